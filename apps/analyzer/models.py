@@ -1,9 +1,13 @@
+import copy
 import datetime
-from collections import defaultdict
+import re
+from collections import OrderedDict, defaultdict
 
 import mongoengine as mongo
+import redis
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.mail import EmailMultiAlternatives
 from django.db import models
 from django.template.loader import render_to_string
@@ -105,6 +109,14 @@ class MClassifierTitle(mongo.Document):
         user = User.objects.get(pk=self.user_id)
         return "%s - %s/%s: (%s) %s" % (user, self.feed_id, self.social_user_id, self.score, self.title[:30])
 
+    def save(self, *args, **kwargs):
+        super(MClassifierTitle, self).save(*args, **kwargs)
+        ClassifierMatcher.invalidate_user(self.user_id)
+
+    def delete(self, *args, **kwargs):
+        super(MClassifierTitle, self).delete(*args, **kwargs)
+        ClassifierMatcher.invalidate_user(self.user_id)
+
 
 class MClassifierAuthor(mongo.Document):
     user_id = mongo.IntField(unique_with=("feed_id", "social_user_id", "author"))
@@ -124,6 +136,14 @@ class MClassifierAuthor(mongo.Document):
         user = User.objects.get(pk=self.user_id)
         return "%s - %s/%s: (%s) %s" % (user, self.feed_id, self.social_user_id, self.score, self.author[:30])
 
+    def save(self, *args, **kwargs):
+        super(MClassifierAuthor, self).save(*args, **kwargs)
+        ClassifierMatcher.invalidate_user(self.user_id)
+
+    def delete(self, *args, **kwargs):
+        super(MClassifierAuthor, self).delete(*args, **kwargs)
+        ClassifierMatcher.invalidate_user(self.user_id)
+
 
 class MClassifierTag(mongo.Document):
     user_id = mongo.IntField(unique_with=("feed_id", "social_user_id", "tag"))
@@ -143,6 +163,14 @@ class MClassifierTag(mongo.Document):
         user = User.objects.get(pk=self.user_id)
         return "%s - %s/%s: (%s) %s" % (user, self.feed_id, self.social_user_id, self.score, self.tag[:30])
 
+    def save(self, *args, **kwargs):
+        super(MClassifierTag, self).save(*args, **kwargs)
+        ClassifierMatcher.invalidate_user(self.user_id)
+
+    def delete(self, *args, **kwargs):
+        super(MClassifierTag, self).delete(*args, **kwargs)
+        ClassifierMatcher.invalidate_user(self.user_id)
+
 
 class MClassifierFeed(mongo.Document):
     user_id = mongo.IntField(unique_with=("feed_id", "social_user_id"))
@@ -165,6 +193,238 @@ class MClassifierFeed(mongo.Document):
             feed = User.objects.get(pk=self.social_user_id)
         return "%s - %s/%s: (%s) %s" % (user, self.feed_id, self.social_user_id, self.score, feed)
 
+    def save(self, *args, **kwargs):
+        super(MClassifierFeed, self).save(*args, **kwargs)
+        ClassifierMatcher.invalidate_user(self.user_id)
+
+    def delete(self, *args, **kwargs):
+        super(MClassifierFeed, self).delete(*args, **kwargs)
+        ClassifierMatcher.invalidate_user(self.user_id)
+
+
+class ClassifierMatcher:
+    """
+    Classifiers for one or more users compiled into lookup tables, so a story is
+    scored with dict lookups and one regex search over its title instead of a scan
+    over every classifier. Scores match the apply_classifier_* functions: among the
+    matching classifiers of a kind, the first positive score wins, otherwise the
+    last match's score.
+
+    Story scores are memoized by story_hash, so scoring the same stories for every
+    subscriber of a feed only matches each story once.
+    """
+
+    VERSION_KEY = "CLV:%s"
+    CACHE_KEY = "CLM:%s:%s"
+    CACHE_EXPIRE = 60 * 60 * 24
+    LOCAL_CACHE_SIZE = 1000
+    local_cache = OrderedDict()
+
+    def __init__(self, classifier_feeds=(), classifier_authors=(), classifier_titles=(), classifier_tags=()):
+        self.user_ids = set()
+        self.trained_feeds = set()
+        self.feeds = defaultdict(list)
+        self.social_feeds = defaultdict(list)
+        self.authors = defaultdict(list)
+        self.tags = defaultdict(list)
+        self.titles = defaultdict(dict)
+        self.title_patterns = {}
+        self.payloads = defaultdict(lambda: {"feeds": {}, "authors": {}, "titles": {}, "tags": {}})
+        self.story_scores_cache = {}
+
+        for order, classifier in enumerate(classifier_feeds):
+            if not classifier.social_user_id:
+                self.user_ids.add(classifier.user_id)
+                self.trained_feeds.add((classifier.user_id, classifier.feed_id))
+            match = (order, classifier.user_id, classifier.score, classifier.social_user_id or 0)
+            self.feeds[classifier.feed_id].append(match)
+            if not classifier.feed_id:
+                self.social_feeds[classifier.social_user_id].append(match)
+            if not classifier.social_user_id:
+                self.payloads[classifier.feed_id]["feeds"][classifier.feed_id] = classifier.score
+        for order, classifier in enumerate(classifier_authors):
+            self.user_ids.add(classifier.user_id)
+            self.trained_feeds.add((classifier.user_id, classifier.feed_id))
+            self.authors[(classifier.feed_id, classifier.author)].append(
+                (order, classifier.user_id, classifier.score)
+            )
+            self.payloads[classifier.feed_id]["authors"][classifier.author] = classifier.score
+        for order, classifier in enumerate(classifier_tags):
+            self.user_ids.add(classifier.user_id)
+            self.trained_feeds.add((classifier.user_id, classifier.feed_id))
+            self.tags[(classifier.feed_id, classifier.tag)].append((order, classifier.user_id, classifier.score))
+            self.payloads[classifier.feed_id]["tags"][classifier.tag] = classifier.score
+        for order, classifier in enumerate(classifier_titles):
+            self.user_ids.add(classifier.user_id)
+            self.trained_feeds.add((classifier.user_id, classifier.feed_id))
+            if classifier.title is None:
+                continue
+            self.titles[classifier.feed_id].setdefault(classifier.title.lower(), []).append(
+                (order, classifier.user_id, classifier.score)
+            )
+            self.payloads[classifier.feed_id]["titles"][classifier.title] = classifier.score
+
+        # One alternation per feed rules out most titles before checking each pattern
+        for feed_id, titles in self.titles.items():
+            self.title_patterns[feed_id] = re.compile("|".join(re.escape(title) for title in titles))
+
+        # Plain dicts so the matcher can be pickled into the cache
+        self.titles = dict(self.titles)
+        self.payloads = dict(self.payloads)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["story_scores_cache"] = {}
+        return state
+
+    @classmethod
+    def for_feed(cls, feed_id, user_ids):
+        """Classifiers of every given user for one feed, in four queries total."""
+        params = dict(feed_id=feed_id, user_id__in=list(user_ids))
+        return cls(
+            classifier_feeds=list(MClassifierFeed.objects(**params)),
+            classifier_authors=list(MClassifierAuthor.objects(**params)),
+            classifier_titles=list(MClassifierTitle.objects(**params)),
+            classifier_tags=list(MClassifierTag.objects(**params)),
+        )
+
+    @classmethod
+    def for_user(cls, user_id):
+        """
+        Every classifier a user has trained, compiled once per version. Each
+        MClassifier* save or delete bumps the user's version in redis, so web and
+        fetch workers share the cached snapshot until the user trains again, and
+        keep the most recently used snapshots in process.
+        """
+        r = redis.Redis(connection_pool=settings.REDIS_POOL)
+        version = int(r.get(cls.VERSION_KEY % user_id) or 0)
+
+        local = cls.local_cache.get(user_id)
+        if local and local[0] == version:
+            cls.local_cache.move_to_end(user_id)
+            return local[1].fresh()
+
+        cache_key = cls.CACHE_KEY % (user_id, version)
+        matcher = cache.get(cache_key)
+        if matcher is None:
+            matcher = cls(
+                classifier_feeds=list(MClassifierFeed.objects(user_id=user_id)),
+                classifier_authors=list(MClassifierAuthor.objects(user_id=user_id)),
+                classifier_titles=list(MClassifierTitle.objects(user_id=user_id)),
+                classifier_tags=list(MClassifierTag.objects(user_id=user_id)),
+            )
+            cache.set(cache_key, matcher, cls.CACHE_EXPIRE)
+
+        cls.local_cache[user_id] = (version, matcher)
+        cls.local_cache.move_to_end(user_id)
+        while len(cls.local_cache) > cls.LOCAL_CACHE_SIZE:
+            cls.local_cache.popitem(last=False)
+
+        return matcher.fresh()
+
+    @classmethod
+    def invalidate_user(cls, user_id):
+        r = redis.Redis(connection_pool=settings.REDIS_POOL)
+        r.incr(cls.VERSION_KEY % user_id)
+
+    def fresh(self):
+        """A copy sharing the compiled tables, without story scores memoized by earlier callers."""
+        matcher = copy.copy(self)
+        matcher.story_scores_cache = {}
+        return matcher
+
+    @staticmethod
+    def matched_score(matches):
+        score = 0
+        for _, score in sorted(matches):
+            if score > 0:
+                return score
+        return score
+
+    def is_trained(self, user_id, feed_id=None):
+        if feed_id is None:
+            return user_id in self.user_ids
+        return (user_id, feed_id) in self.trained_feeds
+
+    def score_feed(self, user_id, feed, social_user_ids=None):
+        """
+        Without social_user_ids only classifiers trained on the feed itself count,
+        like the social_user_id=0 queries for feeds.
+        """
+        if not feed and not social_user_ids:
+            return 0
+        feed_id = None
+        if feed:
+            feed_id = feed if isinstance(feed, int) else feed.pk
+
+        if social_user_ids and not isinstance(social_user_ids, list):
+            social_user_ids = [social_user_ids]
+
+        matches = [
+            m for m in self.feeds.get(feed_id, []) if m[1] == user_id and (social_user_ids or not m[3])
+        ]
+        for social_user_id in social_user_ids or []:
+            matches.extend(m for m in self.social_feeds.get(social_user_id, []) if m[1] == user_id)
+        if not matches:
+            return 0
+        return min(matches)[2]
+
+    def story_scores(self, story):
+        """Returns {user_id: {"author", "tags", "title"}} for the users with any matching classifier."""
+        story_hash = story.get("story_hash")
+        if story_hash and story_hash in self.story_scores_cache:
+            return self.story_scores_cache[story_hash]
+
+        feed_id = story["story_feed_id"]
+        matches = defaultdict(lambda: defaultdict(list))
+        story_authors = story.get("story_authors")
+        if story_authors:
+            for order, user_id, score in self.authors.get((feed_id, story_authors), []):
+                matches[user_id]["author"].append((order, score))
+        if story["story_tags"]:
+            for tag in set(story["story_tags"]):
+                for order, user_id, score in self.tags.get((feed_id, tag), []):
+                    matches[user_id]["tags"].append((order, score))
+        title_pattern = self.title_patterns.get(feed_id)
+        if title_pattern:
+            story_title = story["story_title"].lower()
+            if title_pattern.search(story_title):
+                for title, classifiers in self.titles[feed_id].items():
+                    if title in story_title:
+                        for order, user_id, score in classifiers:
+                            matches[user_id]["title"].append((order, score))
+
+        scores = {}
+        for user_id, user_matches in matches.items():
+            scores[user_id] = {
+                "author": self.matched_score(user_matches["author"]),
+                "tags": self.matched_score(user_matches["tags"]),
+                "title": self.matched_score(user_matches["title"]),
+            }
+        if story_hash:
+            self.story_scores_cache[story_hash] = scores
+        return scores
+
+    def score_story_parts(self, user_id, story):
+        return self.story_scores(story).get(user_id, {"author": 0, "tags": 0, "title": 0})
+
+    def intelligence(self, user_id, story, feed=None, social_user_ids=None):
+        intelligence = {"feed": self.score_feed(user_id, feed or story["story_feed_id"], social_user_ids)}
+        intelligence.update(self.score_story_parts(user_id, story))
+        return intelligence
+
+    def classifiers_by_feed(self, feed_ids, trained_feed_ids=None):
+        """The same payload as sort_classifiers_by_feed, for a single user's matcher."""
+        classifiers = {}
+        for feed_id in feed_ids:
+            payload = None
+            if trained_feed_ids is None or feed_id in trained_feed_ids:
+                payload = self.payloads.get(feed_id)
+            if not payload:
+                payload = {"feeds": {}, "authors": {}, "titles": {}, "tags": {}}
+            classifiers[feed_id] = payload
+        return classifiers
+
 
 def compute_story_score(story, classifier_titles, classifier_authors, classifier_tags, classifier_feeds):
     intelligence = {
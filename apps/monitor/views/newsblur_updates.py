@@ -3,16 +3,20 @@ from django.conf import settings
 from django.shortcuts import render
 from django.views import View
 
+from apps.rss_feeds.scheduler import FeedScheduler
+
 
 class Updates(View):
     def get(self, request):
         r = redis.Redis(connection_pool=settings.REDIS_FEED_UPDATE_POOL)
+        metrics = FeedScheduler(r).metrics()
 
         data = {
-            "update_queue": r.scard("queued_feeds"),
-            "feeds_fetched": r.zcard("fetched_feeds_last_hour"),
-            "tasked_feeds": r.zcard("tasked_feeds"),
-            "error_feeds": r.zcard("error_feeds"),
+            "update_queue": metrics["ready"],
+            "feeds_fetched": metrics["fetched_last_hour"],
+            "tasked_feeds": metrics["tasked"],
+            "error_feeds": metrics["errors"],
+            "update_lag_seconds": metrics["lag_seconds"],
             "celery_update_feeds": r.llen("update_feeds"),
             "celery_new_feeds": r.llen("new_feeds"),
             "celery_push_feeds": r.llen("push_feeds"),
@@ -26,7 +26,8 @@ from apps.analyzer.models import (
 from apps.reader.models import UserSubscription
 
 # from django.utils.html import strip_tags
-from apps.rss_feeds.models import Feed, MStory
+from apps.rss_feeds.models import Feed
+from apps.rss_feeds.scheduler import FeedScheduler
 from utils import log as logging
 from utils import mongoengine_fields
 from utils.story_functions import truncate_chars
@@ -113,6 +114,17 @@ class MUserFeedNotification(mongo.Document):
             self.last_notification_date,
         )
 
+    def save(self, *args, **kwargs):
+        # Only a new notification changes the feed's count, not the per-story date updates
+        created = not self.pk
+        super(MUserFeedNotification, self).save(*args, **kwargs)
+        if created:
+            FeedScheduler().count_notifications(self.feed_id)
+
+    def delete(self, *args, **kwargs):
+        super(MUserFeedNotification, self).delete(*args, **kwargs)
+        FeedScheduler().count_notifications(self.feed_id)
+
     @classmethod
     def feed_has_users(cls, feed_id):
         return cls.users_for_feed(feed_id).count()
@@ -155,8 +167,7 @@ class MUserFeedNotification(mongo.Document):
         r = redis.Redis(connection_pool=settings.REDIS_STORY_HASH_POOL)
 
         latest_story_hashes = r.zrange("zF:%s" % feed.pk, -1 * new_stories, -1)
-        mstories = MStory.objects.filter(story_hash__in=latest_story_hashes).order_by("-story_date")
-        stories = Feed.format_stories(mstories)
+        stories = Feed.format_story_hashes(latest_story_hashes, order="newest", fields="content")
         total_sent_count = 0
 
         for user_feed_notification in notifications:
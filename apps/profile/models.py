@@ -235,6 +235,11 @@ class Profile(models.Model):
         logging.user(self.user, "Deleting %s Stripe IDs." % stripe_ids.count())
         stripe_ids.delete()
 
+        # The subscription cascade below skips UserSubscription.delete, which takes
+        # the user out of each feed's subscriber sets
+        feed_ids = list(UserSubscription.objects.filter(user=self.user).values_list("feed_id", flat=True))
+        UserSubscription.remove_feed_subscribers(self.user.pk, feed_ids)
+
         logging.user(self.user, "Deleting user: %s" % self.user)
         self.user.delete()
 
@@ -271,6 +276,8 @@ class Profile(models.Model):
                 except (IntegrityError, Feed.DoesNotExist):
                     pass
 
+        self.count_all_feed_subscribers_for_user(self.user)
+
         try:
             scheduled_feeds = [sub.feed.pk for sub in subs]
         except Feed.DoesNotExist:
@@ -330,6 +337,8 @@ class Profile(models.Model):
                 except (IntegrityError, Feed.DoesNotExist):
                     pass
 
+        self.count_all_feed_subscribers_for_user(self.user)
+
         # Count subscribers to turn on archive_subscribers counts, then show that count to users
         # on the paypal_archive_return page.
         try:
@@ -395,6 +404,8 @@ class Profile(models.Model):
                 except (IntegrityError, Feed.DoesNotExist):
                     pass
 
+        self.count_all_feed_subscribers_for_user(self.user)
+
         try:
             scheduled_feeds = [sub.feed.pk for sub in subs]
         except Feed.DoesNotExist:
@@ -439,6 +450,8 @@ class Profile(models.Model):
             except (IntegrityError, Feed.DoesNotExist):
                 pass
 
+        self.count_all_feed_subscribers_for_user(self.user)
+
         logging.user(
             self.user, "~BY~FW~SBBOO! Deactivating premium account: ~FR%s subscriptions~SN!" % (subs.count())
         )
@@ -1338,32 +1351,63 @@ class Profile(models.Model):
             % (len(active_feed_ids), len(muted_feed_ids)),
         )
         for feed_ids in [active_feed_ids, muted_feed_ids]:
-            for feeds_group in chunks(feed_ids, 20):
+            for feeds_group in chunks(feed_ids, 100):
                 pipeline = r.pipeline()
                 for feed_id in feeds_group:
-                    key = "s:%s" % feed_id
-                    premium_key = "sp:%s" % feed_id
-                    archive_key = "sarchive:%s" % feed_id
-                    pro_key = "spro:%s" % feed_id
-
-                    last_seen_on = int(user.profile.last_seen_on.strftime("%s"))
-                    if feed_ids is muted_feed_ids:
-                        last_seen_on = 0
-                    pipeline.zadd(key, {user.pk: last_seen_on})
-                    if user.profile.is_premium:
-                        pipeline.zadd(premium_key, {user.pk: last_seen_on})
-                    else:
-                        pipeline.zrem(premium_key, user.pk)
-                    if user.profile.is_archive:
-                        pipeline.zadd(archive_key, {user.pk: last_seen_on})
-                    else:
-                        pipeline.zrem(archive_key, user.pk)
-                    if user.profile.is_pro:
-                        pipeline.zadd(pro_key, {user.pk: last_seen_on})
-                    else:
-                        pipeline.zrem(pro_key, user.pk)
+                    self.store_feed_subscriber(
+                        user.pk,
+                        feed_id,
+                        active=feed_ids is active_feed_ids,
+                        profile=user.profile,
+                        pipeline=pipeline,
+                    )
                 pipeline.execute()
 
+    @classmethod
+    def store_feed_subscriber(cls, user_id, feed_id, active=True, profile=None, pipeline=None):
+        """
+        Writes a single subscriber into a feed's subscriber sets. Subscription and
+        profile changes call this so the counts stay current without recounting
+        every subscriber of the feed.
+        """
+        if not profile:
+            try:
+                profile = cls.objects.get(user_id=user_id)
+            except cls.DoesNotExist:
+                return
+        r = pipeline or redis.Redis(connection_pool=settings.REDIS_FEED_SUB_POOL).pipeline()
+        key = "s:%s" % feed_id
+        premium_key = "sp:%s" % feed_id
+        archive_key = "sarchive:%s" % feed_id
+        pro_key = "spro:%s" % feed_id
+
+        last_seen_on = int(profile.last_seen_on.strftime("%s")) if active else 0
+        r.zadd(key, {user_id: last_seen_on})
+        if profile.is_premium:
+            r.zadd(premium_key, {user_id: last_seen_on})
+        else:
+            r.zrem(premium_key, user_id)
+        if profile.is_archive:
+            r.zadd(archive_key, {user_id: last_seen_on})
+        else:
+            r.zrem(archive_key, user_id)
+        if profile.is_pro:
+            r.zadd(pro_key, {user_id: last_seen_on})
+        else:
+            r.zrem(pro_key, user_id)
+
+        if not pipeline:
+            r.execute()
+
+    @classmethod
+    def remove_feed_subscriber(cls, user_id, feed_id, pipeline=None):
+        r = pipeline or redis.Redis(connection_pool=settings.REDIS_FEED_SUB_POOL).pipeline()
+        for key in ["s:%s", "sp:%s", "sarchive:%s", "spro:%s"]:
+            r.zrem(key % feed_id, user_id)
+
+        if not pipeline:
+            r.execute()
+
     def send_new_user_email(self):
         if not self.user.email or not self.send_emails:
             return
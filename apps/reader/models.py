@@ -1,6 +1,7 @@
 import datetime
 import re
 import time
+from collections import defaultdict
 from operator import itemgetter
 from pprint import pprint
 
@@ -10,29 +11,28 @@ import pymongo
 import redis
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.cache import cache
 from django.db import IntegrityError, models
-from django.db.models import Count, Q
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
 from django.template.defaultfilters import slugify
 from mongoengine.queryset import NotUniqueError, OperationError
 
 from apps.analyzer.models import (
+    ClassifierMatcher,
     MClassifierAuthor,
     MClassifierFeed,
     MClassifierTag,
     MClassifierTitle,
-    apply_classifier_authors,
-    apply_classifier_feeds,
-    apply_classifier_tags,
-    apply_classifier_titles,
 )
 from apps.analyzer.tfidf import tfidf
 from apps.reader.managers import UserSubscriptionManager
 from apps.rss_feeds.models import DuplicateFeed, Feed, MStory
+from apps.rss_feeds.scheduler import FeedScheduler
 from apps.rss_feeds.tasks import NewFeeds
 from utils import json_functions as json
 from utils import log as logging
 from utils.feed_functions import add_object_to_folder, chunks
+from utils.river_merge import RiverMerge, RiverSource
 
 
 def unread_cutoff_default():
@@ -103,6 +103,20 @@ class UserSubscription(models.Model):
                 if self and self.id:
                     self.delete()
 
+    def delete(self, *args, **kwargs):
+        UserSubscription.remove_feed_subscribers(self.user_id, [self.feed_id])
+        return super(UserSubscription, self).delete(*args, **kwargs)
+
+    @classmethod
+    def remove_feed_subscribers(cls, user_id, feed_ids):
+        from apps.profile.models import Profile
+
+        r = redis.Redis(connection_pool=settings.REDIS_FEED_SUB_POOL)
+        pipeline = r.pipeline()
+        for feed_id in feed_ids:
+            Profile.remove_feed_subscriber(user_id, feed_id, pipeline=pipeline)
+        pipeline.execute()
+
     @classmethod
     def subs_for_feeds(cls, user_id, feed_ids=None, read_filter="unread"):
         usersubs = cls.objects
@@ -325,9 +339,7 @@ class UserSubscription(models.Model):
                 cutoff_date=cutoff_date,
             )
 
-        story_date_order = "%sstory_date" % ("" if order == "oldest" else "-")
-        mstories = MStory.objects(story_hash__in=story_hashes).order_by(story_date_order)
-        stories = Feed.format_stories(mstories)
+        stories = Feed.format_story_hashes(story_hashes, order=order)
         return stories
 
     @classmethod
@@ -410,6 +422,69 @@ class UserSubscription(models.Model):
 
         return story_hashes, unread_feed_story_hashes
 
+    @classmethod
+    def river_stories(
+        cls,
+        user_id,
+        feed_ids,
+        usersubs=None,
+        limit=6,
+        offset=0,
+        cursor=None,
+        order="newest",
+        read_filter="all",
+        cutoff_date=None,
+    ):
+        """
+        Merges a page of the river straight from each feed's zF sorted set and the
+        user's RS read stories, instead of unioning every feed into a zU:feeds key
+        the way feed_stories does. Returns the story hashes, the unread ones among
+        them, and a cursor for the next page (None on the last page).
+        """
+        r = redis.Redis(connection_pool=settings.REDIS_STORY_HASH_POOL)
+        user = User.objects.get(pk=user_id)
+
+        if not usersubs:
+            usersubs = cls.subs_for_feeds(user_id, feed_ids=feed_ids, read_filter="all")
+        feed_ids = set(feed_ids)
+        usersubs = [us for us in usersubs if us.feed_id in feed_ids]
+        if not cutoff_date:
+            cutoff_date = user.profile.unread_cutoff
+        max_score = int(time.time() + 60 * 60 * 24)
+
+        manual_unread_feed_ids = set()
+        if user.profile.is_archive:
+            pipeline = r.pipeline()
+            for us in usersubs:
+                pipeline.exists(f"uU:{user_id}:{us.feed_id}")
+            manual_unread_feed_ids = set(
+                us.feed_id for us, exists in zip(usersubs, pipeline.execute()) if exists
+            )
+
+        sources = []
+        for us in usersubs:
+            read_date = int(max(us.mark_read_date, cutoff_date).strftime("%s"))
+            read_stories_key = "RS:%s:%s" % (user_id, us.feed_id)
+            sources.append(
+                RiverSource(
+                    "zF:%s" % us.feed_id,
+                    read_stories_key,
+                    read_date if read_filter == "unread" else 0,
+                    max_score,
+                    unread_since=read_date,
+                )
+            )
+            if us.feed_id in manual_unread_feed_ids:
+                sources.append(
+                    RiverSource(
+                        f"uU:{user_id}:{us.feed_id}", read_stories_key, 0, max_score, manual=True
+                    )
+                )
+
+        return RiverMerge(r).page(
+            sources, limit=limit, order=order, read_filter=read_filter, cursor=cursor, offset=offset
+        )
+
     def oldest_manual_unread_story_date(self, r=None):
         if not r:
             r = redis.Redis(connection_pool=settings.REDIS_STORY_HASH_POOL)
@@ -497,6 +572,10 @@ class UserSubscription(models.Model):
                 us.active = True
                 us.save()
 
+            from apps.profile.models import Profile
+
+            Profile.store_feed_subscriber(user.pk, feed.pk, active=us.active, profile=user.profile)
+
             if not skip_fetch and feed.last_update < datetime.datetime.utcnow() - datetime.timedelta(days=1):
                 feed = feed.update(verbose=True)
 
@@ -907,7 +986,10 @@ class UserSubscription(models.Model):
         if not request:
             request = self.user
 
-        if not self.needs_unread_recalc:
+        if settings.INCREMENTAL_UNREAD_COUNTS and not self.needs_unread_recalc:
+            # Must run before the stories are added to the read set
+            self.uncount_read_stories(story_hashes)
+        elif not self.needs_unread_recalc:
             self.needs_unread_recalc = True
             self.save(update_fields=["needs_unread_recalc"])
 
@@ -917,13 +999,24 @@ class UserSubscription(models.Model):
             logging.user(request, "~FYRead story (%s) in feed: %s" % (story_hashes, self.feed))
             RUserStory.aggregate_mark_read(self.feed_id)
 
-        for story_hash in set(story_hashes):
+        story_hashes = set(story_hashes)
+        RUserStory.mark_stories_read(
+            self.user_id,
+            [
+                MStory.ensure_story_hash(story_hash, story_feed_id=self.feed_id)
+                for story_hash in story_hashes
+            ],
+            aggregated=aggregated,
+        )
+
+        p = r.pipeline()
+        for story_hash in story_hashes:
             # logging.user(request, "~FYRead story: %s" % (story_hash))
-            RUserStory.mark_read(self.user_id, self.feed_id, story_hash, aggregated=aggregated)
-            r.publish(self.user.username, "story:read:%s" % story_hash)
+            p.publish(self.user.username, "story:read:%s" % story_hash)
 
             if self.user.profile.is_archive:
                 RUserUnreadStory.mark_read(self.user_id, story_hash)
+        p.execute()
 
         r.publish(self.user.username, "feed:%s" % self.feed_id)
 
@@ -932,6 +1025,147 @@ class UserSubscription(models.Model):
 
         return data
 
+    @staticmethod
+    def unread_bucket(score):
+        if score > 0:
+            return "positive"
+        elif score < 0:
+            return "negative"
+        return "neutral"
+
+    @classmethod
+    def count_new_unread_stories(cls, feed, user_subs, new_story_hashes):
+        """
+        Incremental alternative to flagging every subscriber with needs_unread_recalc
+        after a fetch: new stories are added to each subscriber's unread counts (in
+        their classifier bucket) and to any unread zU key already built for them.
+        Subscriptions already waiting on a recount are left to it.
+        """
+        user_subs = [sub for sub in user_subs if not sub.needs_unread_recalc]
+        if not user_subs or not new_story_hashes:
+            return
+
+        # Just-saved stories may not have reached the secondaries yet
+        stories = Feed.format_story_hashes(
+            new_story_hashes,
+            feed.pk,
+            read_preference=pymongo.ReadPreference.PRIMARY,
+            fields="metadata",
+        )
+        if not stories:
+            return
+
+        trained_user_ids = [sub.user_id for sub in user_subs if sub.is_trained]
+        classifiers = None
+        if trained_user_ids:
+            classifiers = ClassifierMatcher.for_feed(feed.pk, trained_user_ids)
+
+        increments = defaultdict(list)
+        unread_stories_by_sub = {}
+        for sub in user_subs:
+            read_date = max(sub.mark_read_date, sub.user.profile.unread_cutoff)
+            unread_stories = [story for story in stories if story["story_date"] > read_date]
+            if not unread_stories:
+                continue
+            counts = dict(positive=0, neutral=0, negative=0)
+            for story in unread_stories:
+                score = 0
+                if classifiers and sub.is_trained:
+                    score = cls.score_story(classifiers.intelligence(sub.user_id, story))
+                counts[cls.unread_bucket(score)] += 1
+            increments[(counts["positive"], counts["neutral"], counts["negative"])].append(sub.pk)
+            unread_stories_by_sub[sub] = unread_stories
+
+        for (positive, neutral, negative), sub_ids in increments.items():
+            cls.objects.filter(pk__in=sub_ids).update(
+                unread_count_positive=F("unread_count_positive") + positive,
+                unread_count_neutral=F("unread_count_neutral") + neutral,
+                unread_count_negative=F("unread_count_negative") + negative,
+            )
+
+        # Cached unread stories are only rebuilt on a recount, so keep them current
+        r = redis.Redis(connection_pool=settings.REDIS_STORY_HASH_POOL)
+        subs = list(unread_stories_by_sub.keys())
+        pipeline = r.pipeline()
+        for sub in subs:
+            pipeline.exists("zU:%s:%s" % (sub.user_id, feed.pk))
+        exists = pipeline.execute()
+        pipeline = r.pipeline()
+        for sub, unread_key_exists in zip(subs, exists):
+            if not unread_key_exists:
+                continue
+            pipeline.zadd(
+                "zU:%s:%s" % (sub.user_id, feed.pk),
+                dict(
+                    (story["story_hash"], time.mktime(story["story_date"].timetuple()))
+                    for story in unread_stories_by_sub[sub]
+                ),
+            )
+        pipeline.execute()
+
+        logging.debug(
+            "   ---> [%-30s] ~FBCounted ~SB%s~SN new stories as unread for ~SB%s~SN subscribers"
+            % (feed.log_title[:30], len(stories), len(subs))
+        )
+
+    def uncount_read_stories(self, story_hashes):
+        """
+        Takes stories that are about to be marked read out of the unread counts.
+        Only stories still unread and inside the unread window were counted.
+        """
+        r = redis.Redis(connection_pool=settings.REDIS_STORY_HASH_POOL)
+        story_hashes = list(set(story_hashes))
+        read_date = int(max(self.mark_read_date, self.user.profile.unread_cutoff).strftime("%s"))
+        read_stories_key = "RS:%s:%s" % (self.user_id, self.feed_id)
+        sorted_stories_key = "zF:%s" % self.feed_id
+
+        pipeline = r.pipeline()
+        for story_hash in story_hashes:
+            pipeline.sismember(read_stories_key, story_hash)
+            pipeline.zscore(sorted_stories_key, story_hash)
+        results = pipeline.execute()
+        unread_story_hashes = [
+            story_hash
+            for i, story_hash in enumerate(story_hashes)
+            if not results[i * 2] and results[i * 2 + 1] and results[i * 2 + 1] > read_date
+        ]
+        if not unread_story_hashes:
+            return
+
+        counts = dict(positive=0, neutral=0, negative=0)
+        if self.is_trained:
+            classifiers = ClassifierMatcher.for_user(self.user_id)
+            stories = Feed.format_story_hashes(unread_story_hashes, self.feed_id, fields="metadata")
+            for story in stories:
+                score = self.score_story(classifiers.intelligence(self.user_id, story))
+                counts[self.unread_bucket(score)] += 1
+        else:
+            counts["neutral"] = len(unread_story_hashes)
+
+        UserSubscription.objects.filter(pk=self.pk).update(
+            unread_count_positive=Greatest(F("unread_count_positive") - counts["positive"], 0),
+            unread_count_neutral=Greatest(F("unread_count_neutral") - counts["neutral"], 0),
+            unread_count_negative=Greatest(F("unread_count_negative") - counts["negative"], 0),
+        )
+        self.unread_count_positive = max(self.unread_count_positive - counts["positive"], 0)
+        self.unread_count_neutral = max(self.unread_count_neutral - counts["neutral"], 0)
+        self.unread_count_negative = max(self.unread_count_negative - counts["negative"], 0)
+
+    @classmethod
+    def repair_unread_counts(cls):
+        """
+        Incremental counts can drift (stories trimmed, manual unreads, races), so
+        subscriptions of active users not recounted in a while get a full recount.
+        """
+        subscriber_expire = datetime.datetime.now() - datetime.timedelta(days=settings.SUBSCRIBER_EXPIRE)
+        stale_date = datetime.datetime.now() - datetime.timedelta(hours=settings.UNREAD_COUNTS_REPAIR_HOURS)
+        return cls.objects.filter(
+            active=True,
+            needs_unread_recalc=False,
+            unread_count_updated__lt=stale_date,
+            user__profile__last_seen_on__gte=subscriber_expire,
+        ).update(needs_unread_recalc=True)
+
     def invert_read_stories_after_unread_story(self, story, request=None):
         data = dict(code=1)
         unread_cutoff = self.user.profile.unread_cutoff
@@ -965,7 +1199,7 @@ class UserSubscription(models.Model):
 
         return data
 
-    def calculate_feed_scores(self, silent=False, stories=None, force=False):
+    def calculate_feed_scores(self, silent=False, stories=None, force=False, classifiers=None):
         # now = datetime.datetime.strptime("2009-07-06 22:30:03", "%Y-%m-%d %H:%M:%S")
         now = datetime.datetime.now()
         oldest_unread_story_date = now
@@ -999,9 +1233,6 @@ class UserSubscription(models.Model):
             self.mark_read_date = date_delta
 
         if self.is_trained:
-            if not stories:
-                stories = cache.get("S:v3:%s" % self.feed_id)
-
             unread_story_hashes = self.story_hashes(
                 user_id=self.user_id,
                 feed_ids=[self.feed_id],
@@ -1012,14 +1243,11 @@ class UserSubscription(models.Model):
 
             if not stories:
                 try:
-                    stories_db = MStory.objects(story_hash__in=unread_story_hashes)
-                    stories = Feed.format_stories(stories_db, self.feed_id)
-                except pymongo.errors.OperationFailure as e:
-                    stories_db = MStory.objects(story_hash__in=unread_story_hashes)[:100]
-                    stories = Feed.format_stories(stories_db, self.feed_id)
+                    stories = Feed.format_story_hashes(unread_story_hashes, self.feed_id, fields="metadata")
                 except pymongo.errors.OperationFailure as e:
-                    stories_db = MStory.objects(story_hash__in=unread_story_hashes)[:25]
-                    stories = Feed.format_stories(stories_db, self.feed_id)
+                    stories = Feed.format_story_hashes(
+                        unread_story_hashes[:100], self.feed_id, fields="metadata"
+                    )
 
             unread_stories = []
             for story in stories:
@@ -1033,36 +1261,19 @@ class UserSubscription(models.Model):
             # if not silent:
             #     logging.info(' ---> [%s]    Format stories: %s' % (self.user, datetime.datetime.now() - now))
 
-            classifier_feeds = list(
-                MClassifierFeed.objects(user_id=self.user_id, feed_id=self.feed_id, social_user_id=0)
-            )
-            classifier_authors = list(MClassifierAuthor.objects(user_id=self.user_id, feed_id=self.feed_id))
-            classifier_titles = list(MClassifierTitle.objects(user_id=self.user_id, feed_id=self.feed_id))
-            classifier_tags = list(MClassifierTag.objects(user_id=self.user_id, feed_id=self.feed_id))
+            # Batch scoring passes in classifiers compiled for every subscriber of the feed
+            if classifiers is None:
+                classifiers = ClassifierMatcher.for_user(self.user_id)
 
-            if (
-                not len(classifier_feeds)
-                and not len(classifier_authors)
-                and not len(classifier_titles)
-                and not len(classifier_tags)
-            ):
+            if not classifiers.is_trained(self.user_id, self.feed_id):
                 self.is_trained = False
 
-            # if not silent:
-            #     logging.info(' ---> [%s]    Classifiers: %s (%s)' % (self.user, datetime.datetime.now() - now, classifier_feeds.count() + classifier_authors.count() + classifier_tags.count() + classifier_titles.count()))
-
             scores = {
-                "feed": apply_classifier_feeds(classifier_feeds, self.feed),
+                "feed": classifiers.score_feed(self.user_id, self.feed_id),
             }
 
             for story in unread_stories:
-                scores.update(
-                    {
-                        "author": apply_classifier_authors(classifier_authors, story),
-                        "tags": apply_classifier_tags(classifier_tags, story),
-                        "title": apply_classifier_titles(classifier_titles, story),
-                    }
-                )
+                scores.update(classifiers.score_story_parts(self.user_id, story))
 
                 max_score = max(scores["author"], scores["tags"], scores["title"])
                 min_score = min(scores["author"], scores["tags"], scores["title"])
@@ -1258,32 +1469,12 @@ class UserSubscription(models.Model):
 
     @classmethod
     def verify_feeds_scheduled(cls, user_id):
-        r = redis.Redis(connection_pool=settings.REDIS_FEED_UPDATE_POOL)
         user = User.objects.get(pk=user_id)
         subs = cls.objects.filter(user=user)
         feed_ids = [sub.feed.pk for sub in subs]
 
-        p = r.pipeline()
-        for feed_id in feed_ids:
-            p.zscore("scheduled_updates", feed_id)
-            p.zscore("error_feeds", feed_id)
-        results = p.execute()
-
-        p = r.pipeline()
-        for feed_id in feed_ids:
-            p.zscore("queued_feeds", feed_id)
-        try:
-            results_queued = p.execute()
-        except:
-            results_queued = [False for x in range(len(feed_ids))]
-
-        safety_net = []
-        for f, feed_id in enumerate(feed_ids):
-            scheduled_updates = results[f * 2]
-            error_feeds = results[f * 2 + 1]
-            queued_feeds = results_queued[f]
-            if not scheduled_updates and not queued_feeds and not error_feeds:
-                safety_net.append(feed_id)
+        queued = FeedScheduler().queued(feed_ids)
+        safety_net = [feed_id for feed_id in feed_ids if not queued[feed_id]]
 
         if not safety_net:
             return
@@ -1354,38 +1545,42 @@ class RUserStory:
         if not username:
             username = User.objects.get(pk=user_id).username
 
-        p = r.pipeline()
         feed_ids = set()
         friend_ids = set()
+        friends_by_story_hash = dict()
 
         if not isinstance(story_hashes, list):
             story_hashes = [story_hashes]
 
         single_story = len(story_hashes) == 1
 
+        # Find other social feeds with these stories to update their counts
+        friend_key = "F:%s:F" % (user_id)
+        sp = s.pipeline()
         for story_hash in story_hashes:
+            share_key = "S:%s" % (story_hash)
+            sp.sinter(share_key, friend_key)
+        shares = sp.execute()
+
+        for story_hash, friends_with_shares in zip(story_hashes, shares):
             feed_id, _ = MStory.split_story_hash(story_hash)
             feed_ids.add(feed_id)
 
             if single_story:
                 cls.aggregate_mark_read(feed_id)
 
-            # Find other social feeds with this story to update their counts
-            friend_key = "F:%s:F" % (user_id)
-            share_key = "S:%s" % (story_hash)
-            friends_with_shares = [int(f) for f in s.sinter(share_key, friend_key)]
+            friends_with_shares = [int(f) for f in friends_with_shares]
             friend_ids.update(friends_with_shares)
-            cls.mark_read(
-                user_id,
-                feed_id,
-                story_hash,
-                social_user_ids=friends_with_shares,
-                r=p,
-                username=username,
-                ps=ps,
-            )
+            friends_by_story_hash[story_hash] = friends_with_shares
 
-        p.execute()
+        cls.mark_stories_read(
+            user_id,
+            story_hashes,
+            social_user_ids=friends_by_story_hash,
+            r=r,
+            username=username,
+            ps=ps,
+        )
 
         return list(feed_ids), list(friend_ids)
 
@@ -1453,25 +1648,65 @@ class RUserStory:
         if not story_hash:
             return
 
-        def redis_commands(key):
-            r.sadd(key, story_hash)
-            r.expire(key, Feed.days_of_story_hashes_for_feed(story_feed_id) * 24 * 60 * 60)
+        cls.mark_stories_read(
+            user_id,
+            [story_hash],
+            social_user_ids={story_hash: social_user_ids or []},
+            aggregated=aggregated,
+            r=r,
+            username=username,
+            ps=ps,
+        )
 
-        all_read_stories_key = "RS:%s" % (user_id)
-        redis_commands(all_read_stories_key)
+    @classmethod
+    def mark_stories_read(
+        cls,
+        user_id,
+        story_hashes,
+        social_user_ids=None,
+        aggregated=False,
+        r=None,
+        username=None,
+        ps=None,
+    ):
+        """
+        Bulk mark_read. All of the RS:, RS:user:feed, social RS:user:B: and lRS: writes
+        go out in a single pipeline, and each key is expired once, using its feeds'
+        cached retention. social_user_ids maps a story hash to friends who shared it.
+        """
+        if not r:
+            r = redis.Redis(connection_pool=settings.REDIS_STORY_HASH_POOL)
+        if not social_user_ids:
+            social_user_ids = dict()
 
-        read_story_key = "RS:%s:%s" % (user_id, story_feed_id)
-        redis_commands(read_story_key)
+        read_stories = defaultdict(list)
+        read_stories_feed_ids = defaultdict(set)
+        marked_story_hashes = []
+        for story_hash in story_hashes:
+            feed_id, _ = MStory.split_story_hash(story_hash)
+            if not feed_id:
+                continue
+            keys = ["RS:%s" % (user_id), "RS:%s:%s" % (user_id, feed_id)]
+            for social_user_id in social_user_ids.get(story_hash, []):
+                keys.append("RS:%s:B:%s" % (user_id, social_user_id))
+            for key in keys:
+                read_stories[key].append(story_hash)
+                read_stories_feed_ids[key].add(int(feed_id))
+            marked_story_hashes.append(story_hash)
+
+        if not marked_story_hashes:
+            return
 
-        if ps and username:
-            ps.publish(username, "story:read:%s" % story_hash)
+        days_of_story_hashes = Feed.days_of_story_hashes_for_feeds(read_stories_feed_ids["RS:%s" % (user_id)])
 
-        if social_user_ids:
-            for social_user_id in social_user_ids:
-                social_read_story_key = "RS:%s:B:%s" % (user_id, social_user_id)
-                redis_commands(social_read_story_key)
+        def expire_days(key):
+            return max(days_of_story_hashes[feed_id] for feed_id in read_stories_feed_ids[key])
 
-        feed_id, _ = MStory.split_story_hash(story_hash)
+        pipelined = isinstance(r, redis.client.Pipeline)
+        p = r if pipelined else r.pipeline()
+        for key, key_story_hashes in read_stories.items():
+            p.sadd(key, *key_story_hashes)
+            p.expire(key, expire_days(key) * 24 * 60 * 60)
 
         # Don't remove unread stories from zU because users are actively paging through
         # unread_stories_key = f"U:{user_id}:{story_feed_id}"
@@ -1481,9 +1716,18 @@ class RUserStory:
 
         if not aggregated:
             key = "lRS:%s" % user_id
-            r.lpush(key, story_hash)
-            r.ltrim(key, 0, 1000)
-            r.expire(key, Feed.days_of_story_hashes_for_feed(story_feed_id) * 24 * 60 * 60)
+            p.lpush(key, *marked_story_hashes)
+            p.ltrim(key, 0, 1000)
+            p.expire(key, expire_days("RS:%s" % (user_id)) * 24 * 60 * 60)
+
+        if not pipelined:
+            p.execute()
+
+        if ps and username:
+            pp = ps.pipeline()
+            for story_hash in marked_story_hashes:
+                pp.publish(username, "story:read:%s" % story_hash)
+            pp.execute()
 
     @staticmethod
     def story_can_be_marked_unread_by_user(story, user):
@@ -1841,6 +2085,7 @@ class UserSubscriptionFolders(models.Model):
         self.save()
 
         if commit_delete:
+            UserSubscription.remove_feed_subscribers(self.user.pk, feeds_to_delete)
             UserSubscription.objects.filter(user=self.user, feed__in=feeds_to_delete).delete()
 
         return deleted_folder
@@ -2058,6 +2303,8 @@ class UserSubscriptionFolders(models.Model):
             self.save()
 
     def auto_activate(self):
+        from apps.profile.models import Profile
+
         if self.user.profile.is_premium:
             return
 
@@ -2076,6 +2323,7 @@ class UserSubscriptionFolders(models.Model):
                 continue
             sub.active = True
             sub.save()
+            Profile.store_feed_subscriber(self.user.pk, sub.feed_id, active=True, profile=self.user.profile)
             if sub.feed.active_subscribers <= 0:
                 sub.feed.count_subscribers()
 
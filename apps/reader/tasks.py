@@ -33,6 +33,15 @@ def FreshenHomepage():
         sub.calculate_feed_scores(silent=True)
 
 
+@app.task(name="repair-unread-counts")
+def RepairUnreadCounts():
+    if not settings.INCREMENTAL_UNREAD_COUNTS:
+        return
+
+    repaired = UserSubscription.repair_unread_counts()
+    logging.debug(" ---> Flagged ~SB%s~SN subscriptions for a full unread recount" % repaired)
+
+
 @app.task(name="clean-analytics", time_limit=720 * 10)
 def CleanAnalytics():
     logging.debug(
@@ -1,10 +1,12 @@
+import redis
 from django.conf import settings
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 from django.test.client import Client
 from django.urls import reverse
 from mongoengine.connection import connect, disconnect
 
 from utils import json_functions as json
+from utils.river_merge import RiverMerge, RiverSource
 
 
 class Test_Reader(TestCase):
@@ -212,3 +214,91 @@ class Test_Reader(TestCase):
         compact_folders = usf.folders
 
         self.assertNotEquals(dupe_folders, compact_folders)
+
+
+class Test_RiverMerge(SimpleTestCase):
+    """Runs the river merge script against a local redis, skipped when there isn't one."""
+
+    def setUp(self):
+        self.r = redis.Redis(
+            host=settings.REDIS_STORY["host"], port=settings.REDIS_STORY_PORT, db=10, decode_responses=True
+        )
+        try:
+            self.r.ping()
+        except redis.exceptions.ConnectionError:
+            self.skipTest("No local redis available")
+        self.keys = []
+
+    def tearDown(self):
+        if self.keys:
+            self.r.delete(*self.keys)
+
+    def add_feed(self, feed_id, stories, read_story_hashes=None):
+        key = "zF:test-river:%s" % feed_id
+        read_key = "RS:test-river:%s" % feed_id
+        self.r.delete(key, read_key)
+        self.r.zadd(key, stories)
+        if read_story_hashes:
+            self.r.sadd(read_key, *read_story_hashes)
+        self.keys.extend([key, read_key])
+
+        return RiverSource(key, read_key, 0, 2000000000)
+
+    def all_pages(self, sources, limit, **kwargs):
+        story_hashes = []
+        cursor = None
+        while True:
+            page, _, cursor = RiverMerge(self.r).page(sources, limit=limit, cursor=cursor, **kwargs)
+            story_hashes.extend(page)
+            if not cursor:
+                return story_hashes
+
+    def test_merges_feeds_in_order_without_read_stories(self):
+        sources = [
+            self.add_feed(1, {"1:aaaaaa": 100, "1:bbbbbb": 300}),
+            self.add_feed(2, {"2:cccccc": 200, "2:dddddd": 400}, read_story_hashes=["2:dddddd"]),
+            self.add_feed(3, {"3:eeeeee": 250}),
+        ]
+
+        river = RiverMerge(self.r)
+        story_hashes, unread_story_hashes, _ = river.page(sources, limit=10, read_filter="unread")
+        self.assertEqual(story_hashes, ["1:bbbbbb", "3:eeeeee", "2:cccccc", "1:aaaaaa"])
+        self.assertEqual(unread_story_hashes, story_hashes)
+
+        story_hashes, unread_story_hashes, _ = river.page(sources, limit=10, read_filter="all")
+        self.assertEqual(story_hashes, ["2:dddddd", "1:bbbbbb", "3:eeeeee", "2:cccccc", "1:aaaaaa"])
+        self.assertNotIn("2:dddddd", unread_story_hashes)
+
+        story_hashes, _, _ = river.page(sources, limit=10, order="oldest", read_filter="unread")
+        self.assertEqual(story_hashes, ["1:aaaaaa", "2:cccccc", "3:eeeeee", "1:bbbbbb"])
+
+    def test_cursor_round_trip(self):
+        cursor = RiverMerge.encode_cursor("1700000000", "12:abcdef")
+        self.assertEqual(RiverMerge.decode_cursor(cursor), (1700000000.0, "12:abcdef"))
+        self.assertEqual(RiverMerge.decode_cursor("not a cursor"), (None, None))
+        self.assertEqual(RiverMerge.decode_cursor(None), (None, None))
+
+        stories = {}
+        stories[1] = dict(("1:%06d" % i, 1000 + i * 2) for i in range(7))
+        stories[2] = dict(("2:%06d" % i, 1001 + i * 2) for i in range(6))
+        sources = [self.add_feed(feed_id, feed_stories) for feed_id, feed_stories in stories.items()]
+        scores = dict(list(stories[1].items()) + list(stories[2].items()))
+        expected = sorted(scores, key=lambda story_hash: scores[story_hash], reverse=True)
+
+        first_page, _, cursor = RiverMerge(self.r).page(sources, limit=4)
+        self.assertEqual(first_page, ["1:000006", "2:000005", "1:000005", "2:000004"])
+        self.assertEqual(RiverMerge.decode_cursor(cursor), (1009.0, "2:000004"))
+
+        self.assertEqual(self.all_pages(sources, limit=4), expected)
+
+    def test_tied_scores_page_stably(self):
+        sources = [
+            self.add_feed(1, {"1:aaaaaa": 500, "1:bbbbbb": 500, "1:cccccc": 400}),
+            self.add_feed(2, {"2:aaaaaa": 500, "2:bbbbbb": 500}),
+            self.add_feed(3, {"3:aaaaaa": 500}),
+        ]
+        expected = ["3:aaaaaa", "2:bbbbbb", "2:aaaaaa", "1:bbbbbb", "1:aaaaaa", "1:cccccc"]
+
+        for limit in [1, 2, 4]:
+            self.assertEqual(self.all_pages(sources, limit=limit), expected)
+        self.assertEqual(self.all_pages(sources, limit=2, order="oldest"), list(reversed(expected)))
@@ -11,6 +11,7 @@ import urllib.error
 import urllib.parse
 import urllib.request
 import zlib
+from collections import defaultdict
 
 import redis
 import requests
@@ -41,6 +42,7 @@ from django.views.decorators.cache import never_cache
 from mongoengine.queryset import NotUniqueError, OperationError
 
 from apps.analyzer.models import (
+    ClassifierMatcher,
     MClassifierAuthor,
     MClassifierFeed,
     MClassifierTag,
@@ -793,24 +795,10 @@ def load_single_feed(request, feed_id):
 
     # Get intelligence classifier for user
 
+    classifier_matcher = ClassifierMatcher()
     if usersub and usersub.is_trained:
-        classifier_feeds = list(MClassifierFeed.objects(user_id=user.pk, feed_id=feed_id, social_user_id=0))
-        classifier_authors = list(MClassifierAuthor.objects(user_id=user.pk, feed_id=feed_id))
-        classifier_titles = list(MClassifierTitle.objects(user_id=user.pk, feed_id=feed_id))
-        classifier_tags = list(MClassifierTag.objects(user_id=user.pk, feed_id=feed_id))
-    else:
-        classifier_feeds = []
-        classifier_authors = []
-        classifier_titles = []
-        classifier_tags = []
-    classifiers = get_classifiers_for_user(
-        user,
-        feed_id=feed_id,
-        classifier_feeds=classifier_feeds,
-        classifier_authors=classifier_authors,
-        classifier_titles=classifier_titles,
-        classifier_tags=classifier_tags,
-    )
+        classifier_matcher = ClassifierMatcher.for_user(user.pk)
+    classifiers = classifier_matcher.classifiers_by_feed([int(feed_id)])[int(feed_id)]
     checkpoint3 = time.time()
 
     unread_story_hashes = []
@@ -878,12 +866,7 @@ def load_single_feed(request, feed_id):
                 story["shared_comments"] = strip_tags(shared_stories[story["story_hash"]]["comments"])
         else:
             story["read_status"] = 1
-        story["intelligence"] = {
-            "feed": apply_classifier_feeds(classifier_feeds, feed),
-            "author": apply_classifier_authors(classifier_authors, story),
-            "tags": apply_classifier_tags(classifier_tags, story),
-            "title": apply_classifier_titles(classifier_titles, story),
-        }
+        story["intelligence"] = classifier_matcher.intelligence(user.pk, story, feed=feed)
         story["score"] = UserSubscription.score_story(story["intelligence"])
 
     # Intelligence
@@ -1319,8 +1302,7 @@ def folder_rss_feed(request, user_id, secret_token, unread_filter, folder_slug):
     else:
         story_hashes = []
 
-    mstories = MStory.objects(story_hash__in=story_hashes).order_by("-story_date")
-    stories = Feed.format_stories(mstories)
+    stories = Feed.format_story_hashes(story_hashes, order="newest")
 
     filtered_stories = []
     found_feed_ids = list(set([story["story_feed_id"] for story in stories]))
@@ -1464,8 +1446,7 @@ def load_read_stories(request):
         #     message = "You must be a premium subscriber to search."
     else:
         story_hashes = RUserStory.get_read_stories(user.pk, offset=offset, limit=limit, order=order)
-        mstories = MStory.objects(story_hash__in=story_hashes)
-        stories = Feed.format_stories(mstories)
+        stories = Feed.format_story_hashes(story_hashes)
         stories = sorted(
             stories,
             key=lambda story: story_hashes.index(story["story_hash"]),
@@ -1553,6 +1534,7 @@ def load_river_stories__redis(request):
     requested_hashes = len(story_hashes)
     original_feed_ids = list(feed_ids)
     page = int(get_post.get("page", 1))
+    cursor = get_post.get("cursor")
     order = get_post.get("order", "newest")
     read_filter = get_post.get("read_filter", "unread")
     query = get_post.get("query", "").strip()
@@ -1566,8 +1548,8 @@ def load_river_stories__redis(request):
     usersubs = []
     code = 1
     user_search = None
+    next_cursor = None
     offset = (page - 1) * limit
-    story_date_order = "%sstory_date" % ("" if order == "oldest" else "-")
 
     if user.pk == 86178:
         # Disable Michael_Novakhov account
@@ -1580,8 +1562,8 @@ def load_river_stories__redis(request):
     if story_hashes:
         unread_feed_story_hashes = None
         read_filter = "all"
-        mstories = MStory.objects(story_hash__in=story_hashes).order_by(story_date_order)
-        stories = Feed.format_stories(mstories)
+        stories = Feed.format_story_hashes(story_hashes, order=order)
+        mstories = stories
     elif query:
         if user.profile.is_premium:
             user_search = MUserSearch.get_user(user.pk)
@@ -1610,30 +1592,27 @@ def load_river_stories__redis(request):
         stories = Feed.format_stories(mstories)
     else:
         usersubs = UserSubscription.subs_for_feeds(user.pk, feed_ids=feed_ids, read_filter=read_filter)
-        all_feed_ids = [f for f in feed_ids]
         feed_ids = [sub.feed_id for sub in usersubs]
         if infrequent:
             feed_ids = Feed.low_volume_feeds(feed_ids, stories_per_month=infrequent)
         if feed_ids:
-            params = {
-                "user_id": user.pk,
-                "feed_ids": feed_ids,
-                "all_feed_ids": all_feed_ids,
-                "offset": offset,
-                "limit": limit,
-                "order": order,
-                "read_filter": read_filter,
-                "usersubs": usersubs,
-                "cutoff_date": user.profile.unread_cutoff,
-                "cache_prefix": "dashboard:" if on_dashboard else "",
-            }
-            story_hashes, unread_feed_story_hashes = UserSubscription.feed_stories(**params)
+            story_hashes, unread_feed_story_hashes, next_cursor = UserSubscription.river_stories(
+                user.pk,
+                feed_ids,
+                usersubs=usersubs,
+                limit=limit,
+                offset=offset,
+                cursor=cursor,
+                order=order,
+                read_filter=read_filter,
+                cutoff_date=user.profile.unread_cutoff,
+            )
         else:
             story_hashes = []
             unread_feed_story_hashes = []
 
-        mstories = MStory.objects(story_hash__in=story_hashes[:limit]).order_by(story_date_order)
-        stories = Feed.format_stories(mstories)
+        stories = Feed.format_story_hashes(story_hashes[:limit], order=order)
+        mstories = stories
 
     found_feed_ids = list(set([story["story_feed_id"] for story in stories]))
     stories, user_profiles = MSharedStory.stories_with_comments_and_profiles(stories, user.pk)
@@ -1668,30 +1647,12 @@ def load_river_stories__redis(request):
     else:
         starred_stories = {}
 
-    # Intelligence classifiers for all feeds involved
+    # Intelligence classifiers for all feeds involved, compiled once per user
+    classifier_matcher = ClassifierMatcher()
     if found_trained_feed_ids:
-        classifier_feeds = list(
-            MClassifierFeed.objects(user_id=user.pk, feed_id__in=found_trained_feed_ids, social_user_id=0)
-        )
-        classifier_authors = list(
-            MClassifierAuthor.objects(user_id=user.pk, feed_id__in=found_trained_feed_ids)
-        )
-        classifier_titles = list(
-            MClassifierTitle.objects(user_id=user.pk, feed_id__in=found_trained_feed_ids)
-        )
-        classifier_tags = list(MClassifierTag.objects(user_id=user.pk, feed_id__in=found_trained_feed_ids))
-    else:
-        classifier_feeds = []
-        classifier_authors = []
-        classifier_titles = []
-        classifier_tags = []
-    classifiers = sort_classifiers_by_feed(
-        user=user,
-        feed_ids=found_feed_ids,
-        classifier_feeds=classifier_feeds,
-        classifier_authors=classifier_authors,
-        classifier_titles=classifier_titles,
-        classifier_tags=classifier_tags,
+        classifier_matcher = ClassifierMatcher.for_user(user.pk)
+    classifiers = classifier_matcher.classifiers_by_feed(
+        found_feed_ids, trained_feed_ids=found_trained_feed_ids
     )
 
     # Just need to format stories
@@ -1717,12 +1678,10 @@ def load_river_stories__redis(request):
             story["user_tags"] = starred_stories[story["story_hash"]]["user_tags"]
             story["user_notes"] = starred_stories[story["story_hash"]]["user_notes"]
             story["highlights"] = starred_stories[story["story_hash"]]["highlights"]
-        story["intelligence"] = {
-            "feed": apply_classifier_feeds(classifier_feeds, story["story_feed_id"]),
-            "author": apply_classifier_authors(classifier_authors, story),
-            "tags": apply_classifier_tags(classifier_tags, story),
-            "title": apply_classifier_titles(classifier_titles, story),
-        }
+        if story["story_feed_id"] in found_trained_feed_ids:
+            story["intelligence"] = classifier_matcher.intelligence(user.pk, story)
+        else:
+            story["intelligence"] = {"feed": 0, "author": 0, "tags": 0, "title": 0}
         story["score"] = UserSubscription.score_story(story["intelligence"])
 
     if include_feeds:
@@ -1796,6 +1755,7 @@ def load_river_stories__redis(request):
         elapsed_time=timediff,
         user_search=user_search,
         user_profiles=user_profiles,
+        cursor=next_cursor,
     )
 
     if include_feeds:
@@ -2008,6 +1968,23 @@ def mark_story_hashes_as_read(request):
     except UnreadablePostError:
         return dict(code=-1, message="Missing `story_hash` list parameter.")
 
+    story_hashes_by_feed = defaultdict(list)
+    for story_hash in story_hashes:
+        feed_id, _ = MStory.split_story_hash(story_hash)
+        if feed_id:
+            story_hashes_by_feed[int(feed_id)].append(story_hash)
+    usersubs = dict(
+        (usersub.feed_id, usersub)
+        for usersub in UserSubscription.objects.filter(
+            user=request.user.pk, feed__in=list(story_hashes_by_feed.keys())
+        )
+    )
+    if settings.INCREMENTAL_UNREAD_COUNTS:
+        # Must run before the stories are added to the read set
+        for feed_id, usersub in usersubs.items():
+            if not usersub.needs_unread_recalc:
+                usersub.uncount_read_stories(story_hashes_by_feed[feed_id])
+
     feed_ids, friend_ids = RUserStory.mark_story_hashes_read(
         request.user.pk, story_hashes, username=request.user.username
     )
@@ -2027,11 +2004,10 @@ def mark_story_hashes_as_read(request):
 
     # Also count on original subscription
     for feed_id in feed_ids:
-        usersubs = UserSubscription.objects.filter(user=request.user.pk, feed=feed_id)
-        if usersubs:
-            usersub = usersubs[0]
+        usersub = usersubs.get(int(feed_id))
+        if usersub:
             usersub.last_read_date = datetime.datetime.now()
-            if not usersub.needs_unread_recalc:
+            if not settings.INCREMENTAL_UNREAD_COUNTS and not usersub.needs_unread_recalc:
                 usersub.needs_unread_recalc = True
                 usersub.save(update_fields=["needs_unread_recalc", "last_read_date"])
             else:
@@ -2722,11 +2698,17 @@ def save_feed_chooser(request):
                 if not sub.active:
                     sub.active = True
                     sub.save()
+                    Profile.store_feed_subscriber(
+                        request.user.pk, sub.feed_id, active=True, profile=request.user.profile
+                    )
                     if sub.feed.active_subscribers <= 0:
                         sub.feed.count_subscribers()
             elif sub.active:
                 sub.active = False
                 sub.save()
+                Profile.store_feed_subscriber(
+                    request.user.pk, sub.feed_id, active=False, profile=request.user.profile
+                )
         except Feed.DoesNotExist:
             pass
 
@@ -2765,6 +2747,7 @@ def activate_premium_account(request):
 
     request.user.profile.is_premium = True
     request.user.profile.save()
+    Profile.count_all_feed_subscribers_for_user(request.user)
 
     return HttpResponseRedirect(reverse("index"))
 
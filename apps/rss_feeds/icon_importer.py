@@ -6,7 +6,6 @@ import operator
 import struct
 import urllib.error
 import urllib.parse
-import urllib.request
 from io import BytesIO
 from socket import error as SocketError
 
@@ -31,6 +30,7 @@ from apps.rss_feeds.models import MFeedIcon, MFeedPage
 from utils import log as logging
 from utils.facebook_fetcher import FacebookFetcher
 from utils.feed_functions import TimeoutError, timelimit
+from utils.host_sessions import HostSessions
 
 
 class IconImporter(object):
@@ -239,7 +239,7 @@ class IconImporter(object):
         url = self._url_from_html(content)
         if not url:
             try:
-                content = requests.get(self.cleaned_feed_link, timeout=10).content
+                content = HostSessions.get(self.cleaned_feed_link, timeout=10).content
                 url = self._url_from_html(content)
             except (
                 AttributeError,
@@ -315,12 +315,12 @@ class IconImporter(object):
                     self.feed.permalink,
                     self.feed.fake_user_agent,
                 ),
-                "Connection": "close",
                 "Accept": "image/png,image/x-icon,image/*;q=0.9,*/*;q=0.8",
             }
             try:
-                request = urllib.request.Request(url, headers=headers)
-                icon = urllib.request.urlopen(request).read()
+                response = HostSessions.get(url, headers=headers, timeout=10)
+                response.raise_for_status()
+                icon = response.content
             except Exception:
                 return None
             return icon
@@ -23,13 +23,13 @@ class Command(BaseCommand):
         for i in range(0, feeds_count, 100):
             feeds = Feed.objects.all()[i : i + 100]
             for feed in feeds.iterator():
-                feed.count_subscribers(verbose=options["verbose"])
+                feed.count_subscribers(recount=True, verbose=options["verbose"])
 
         if options["delete"]:
             print("# Deleting old feeds...")
             old_feeds = Feed.objects.filter(num_subscribers=0)
             for feed in old_feeds:
-                feed.count_subscribers(verbose=True)
+                feed.count_subscribers(recount=True, verbose=True)
                 if feed.num_subscribers == 0:
                     print((" ---> Deleting: [%s] %s" % (feed.pk, feed)))
                     feed.delete()
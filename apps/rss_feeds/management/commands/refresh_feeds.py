@@ -30,6 +30,36 @@ class Command(BaseCommand):
         parser.add_argument(
             "-S", "--skip", type=int, dest="skip", default=0, help="Skip stories per month < #."
         )
+        parser.add_argument(
+            "-a",
+            "--async",
+            dest="async_fetch",
+            action="store_true",
+            help="Download each worker's feeds concurrently before parsing them.",
+        )
+        parser.add_argument(
+            "-c",
+            "--concurrency",
+            type=int,
+            dest="async_concurrency",
+            default=200,
+            help="Downloads kept in flight per worker when fetching asynchronously.",
+        )
+        parser.add_argument(
+            "-p",
+            "--pipeline",
+            dest="pipeline",
+            action="store_true",
+            help="Download in this process and parse/store in --workerthreads processes.",
+        )
+        parser.add_argument(
+            "-q",
+            "--queue-size",
+            type=int,
+            dest="queue_size",
+            default=None,
+            help="Downloaded feeds waiting to be parsed before downloads pause (pipeline only).",
+        )
         parser.add_argument(
             "-w",
             "--workerthreads",
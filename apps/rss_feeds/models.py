@@ -6,10 +6,11 @@ import html
 import math
 import random
 import re
+import threading
 import time
 import urllib.parse
 import zlib
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from operator import itemgetter
 
 import bson
@@ -22,9 +23,12 @@ from bson.objectid import ObjectId
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 
 # from nltk.collocations import TrigramCollocationFinder, BigramCollocationFinder, TrigramAssocMeasures, BigramAssocMeasures
 from django.db import IntegrityError, models
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.db.models.query import QuerySet
 from django.db.utils import DatabaseError
 from django.template.defaultfilters import slugify
@@ -33,6 +37,7 @@ from django.utils.encoding import DjangoUnicodeDecodeError, smart_bytes, smart_s
 from mongoengine.errors import ValidationError
 from mongoengine.queryset import NotUniqueError, OperationError, Q
 
+from apps.rss_feeds.scheduler import FeedScheduler
 from apps.rss_feeds.tasks import PushFeeds, ScheduleCountTagsForUser, UpdateFeeds
 from apps.rss_feeds.text_importer import TextImporter
 from apps.search.models import SearchFeed, SearchStory
@@ -43,6 +48,8 @@ from utils import log as logging
 from utils import urlnorm
 from utils.feed_functions import (
     TimeoutError,
+    check_deadline,
+    chunks,
     levenshtein_distance,
     relative_timesince,
     seconds_timesince,
@@ -63,6 +70,73 @@ from vendor.timezones.utilities import localtime_for_timezone
 ENTRY_NEW, ENTRY_UPDATED, ENTRY_SAME, ENTRY_ERR = list(range(4))
 
 
+class FeedIdentityMap:
+    """
+    A task-scoped cache of Feed rows, so that one fetch shares a single Feed
+    instance between the fetcher, ProcessFeed, and every story's sync_redis,
+    instead of reloading it from Postgres at each step. Outside of a scope,
+    Feed.get_by_id always goes to the database.
+
+    Saved feeds replace their cached instance, and merged or deleted feeds are
+    evicted. Duplicate feed ids are cached against the feed they resolve to.
+    """
+
+    _local = threading.local()
+
+    def __init__(self):
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = getattr(self._local, "feeds", None)
+        self._local.feeds = {}
+        return self
+
+    def __exit__(self, *args):
+        self._local.feeds = self.previous
+
+    @classmethod
+    def active(cls):
+        return getattr(cls._local, "feeds", None)
+
+    @staticmethod
+    def key(feed_id):
+        try:
+            return int(feed_id)
+        except (TypeError, ValueError):
+            return feed_id
+
+    @classmethod
+    def get(cls, feed_id):
+        feeds = cls.active()
+        if feeds is None:
+            return None
+        return feeds.get(cls.key(feed_id))
+
+    @classmethod
+    def add(cls, feed_id, feed):
+        feeds = cls.active()
+        if feeds is None or not feed:
+            return
+        feeds[cls.key(feed_id)] = feed
+        feeds[feed.pk] = feed
+
+    @classmethod
+    def evict(cls, feed_id):
+        feeds = cls.active()
+        if feeds is None:
+            return
+        feed_id = cls.key(feed_id)
+        for cached_id, feed in list(feeds.items()):
+            if cached_id == feed_id or feed.pk == feed_id:
+                del feeds[cached_id]
+
+    @classmethod
+    def clear(cls):
+        feeds = cls.active()
+        if feeds is not None:
+            feeds.clear()
+
+
 class Feed(models.Model):
     feed_address = models.URLField(max_length=764, db_index=True)
     feed_address_locked = models.BooleanField(default=False, blank=True, null=True)
@@ -107,6 +181,47 @@ class Feed(models.Model):
     fs_size_bytes = models.IntegerField(null=True, blank=True)
     archive_count = models.IntegerField(null=True, blank=True)
 
+    # feed_id -> (days_of_story_hashes, expires_at), see days_of_story_hashes_for_feeds
+    days_of_story_hashes_cache = {}
+
+    # Bump the version whenever format_story's output changes shape
+    FORMATTED_STORY_CACHE_VERSION = 3
+    FORMATTED_STORY_CACHE_EXPIRE = 60 * 60 * 24
+
+    # MStory fields each format_story field set reads, for .only() projections.
+    # metadata is enough to score a story, content adds its text and image urls
+    # without signing them, full is everything a client is sent.
+    FORMAT_STORY_FIELDS = {
+        "metadata": [
+            "story_hash",
+            "story_feed_id",
+            "story_date",
+            "story_title",
+            "story_author_name",
+            "story_tags",
+            "story_permalink",
+            "story_guid",
+        ],
+        "content": [
+            "story_hash",
+            "story_feed_id",
+            "story_date",
+            "story_title",
+            "story_author_name",
+            "story_tags",
+            "story_permalink",
+            "story_guid",
+            "story_content_z",
+            "story_latest_content_z",
+            "image_urls",
+        ],
+        "full": None,
+    }
+
+    # (image url, thumbnail size) -> signed imageproxy url, see signed_image_url
+    SIGNED_IMAGE_URLS_CACHE_SIZE = 20000
+    signed_image_urls_cache = OrderedDict()
+
     class Meta:
         db_table = "feeds"
         ordering = ["feed_title"]
@@ -175,11 +290,41 @@ class Feed(models.Model):
 
     @classmethod
     def days_of_story_hashes_for_feed(cls, feed_id):
-        try:
-            feed = cls.objects.only("archive_subscribers").get(pk=feed_id)
-            return feed.days_of_story_hashes
-        except cls.DoesNotExist:
-            return settings.DAYS_OF_STORY_HASHES
+        return cls.days_of_story_hashes_for_feeds([feed_id])[int(feed_id)]
+
+    @classmethod
+    def days_of_story_hashes_for_feeds(cls, feed_ids):
+        """
+        Retention only changes when a feed gains or loses archive subscribers, so it's
+        cached for a few minutes per process instead of queried for every read story
+        whose keys get an expire. Returns a dict keyed by int feed_id.
+        """
+        now = time.time()
+        cached_days = cls.days_of_story_hashes_cache
+        days = {}
+        missing = set()
+        for feed_id in feed_ids:
+            feed_id = int(feed_id)
+            cached = cached_days.get(feed_id)
+            if cached and cached[1] > now:
+                days[feed_id] = cached[0]
+            else:
+                missing.add(feed_id)
+
+        if missing:
+            if len(cached_days) > 10000:
+                cached_days.clear()
+            archive_subscribers = dict(
+                cls.objects.filter(pk__in=missing).values_list("pk", "archive_subscribers")
+            )
+            for feed_id in missing:
+                if archive_subscribers.get(feed_id) and archive_subscribers[feed_id] > 0:
+                    days[feed_id] = settings.DAYS_OF_STORY_HASHES_ARCHIVE
+                else:
+                    days[feed_id] = settings.DAYS_OF_STORY_HASHES
+                cached_days[feed_id] = (days[feed_id], now + 5 * 60)
+
+        return days
 
     @property
     def days_of_story_hashes(self):
@@ -266,6 +411,11 @@ class Feed(models.Model):
 
         return feed
 
+    def delete(self, *args, **kwargs):
+        FeedIdentityMap.evict(self.pk)
+        FeedScheduler().forget(self.pk)
+        return super(Feed, self).delete(*args, **kwargs)
+
     def save(self, *args, **kwargs):
         if not self.last_update:
             self.last_update = datetime.datetime.utcnow()
@@ -289,6 +439,7 @@ class Feed(models.Model):
 
         try:
             super(Feed, self).save(*args, **kwargs)
+            FeedIdentityMap.add(self.pk, self)
         except IntegrityError as e:
             logging.debug(" ---> ~FRFeed save collision (%s), checking dupe hash..." % e)
             feed_address = self.feed_address or ""
@@ -340,16 +491,15 @@ class Feed(models.Model):
             )
             feeds = Feed.objects.filter(
                 pk__in=range(f, f + 1000), active=True, active_subscribers__gte=subscribers
-            ).values_list("pk")
-            for (feed_id,) in feeds:
-                Feed.objects.get(pk=feed_id).index_feed_for_search()
+            ).only("pk", "feed_title", "feed_address", "feed_link", "num_subscribers", "branch_from_feed")
+            SearchFeed.bulk_index(doc for doc in (feed.feed_search_doc() for feed in feeds) if doc)
 
-    def index_feed_for_search(self):
+    def feed_search_doc(self):
         min_subscribers = 1
         if settings.DEBUG:
             min_subscribers = 0
-        if self.num_subscribers > min_subscribers and not self.branch_from_feed and not self.is_newsletter:
-            SearchFeed.index(
+        if self.num_subscribers > min_subscribers and not self.branch_from_feed_id and not self.is_newsletter:
+            return dict(
                 feed_id=self.pk,
                 title=self.feed_title,
                 address=self.feed_address,
@@ -357,16 +507,31 @@ class Feed(models.Model):
                 num_subscribers=self.num_subscribers,
             )
 
+    def index_feed_for_search(self):
+        doc = self.feed_search_doc()
+        if doc:
+            SearchFeed.index(**doc)
+
     def index_stories_for_search(self):
-        if self.search_indexed:
+        Feed.index_feeds_stories_for_search([self.pk])
+
+    @classmethod
+    def index_feeds_stories_for_search(cls, feed_ids):
+        """
+        Streams every story of the feeds not yet search indexed through one bulk
+        indexing pass, then marks those feeds indexed.
+        """
+        feeds = [cls.get_by_id(feed_id) for feed_id in feed_ids]
+        feeds = [feed for feed in feeds if feed and not feed.search_indexed]
+        if not feeds:
             return
 
-        stories = MStory.objects(story_feed_id=self.pk)
-        for story in stories:
-            story.index_story_for_search()
+        stories = MStory.objects(story_feed_id__in=[feed.pk for feed in feeds]).only(*MStory.SEARCH_FIELDS)
+        MStory.index_stories_for_search(stories)
 
-        self.search_indexed = True
-        self.save()
+        for feed in feeds:
+            feed.search_indexed = True
+            feed.save(update_fields=["search_indexed"])
 
     def sync_redis(self, allow_skip_resync=False):
         return MStory.sync_feed_redis(self.pk, allow_skip_resync=allow_skip_resync)
@@ -613,7 +778,7 @@ class Feed(models.Model):
         return feed
 
     @classmethod
-    def task_feeds(cls, feeds, queue_size=12, verbose=True):
+    def task_feeds(cls, feeds, queue_size=None, verbose=True):
         if not feeds:
             return
         r = redis.Redis(connection_pool=settings.REDIS_FEED_UPDATE_POOL)
@@ -628,36 +793,66 @@ class Feed(models.Model):
         if isinstance(feeds, QuerySet):
             feeds = [f.pk for f in feeds]
 
-        r.srem("queued_feeds", *feeds)
-        now = datetime.datetime.now().strftime("%s")
-        p = r.pipeline()
-        for feed_id in feeds:
-            p.zadd("tasked_feeds", {feed_id: now})
-        p.execute()
+        FeedScheduler(r).task(feeds)
 
-        # for feed_ids in (feeds[pos:pos + queue_size] for pos in xrange(0, len(feeds), queue_size)):
-        for feed_id in feeds:
-            UpdateFeeds.apply_async(args=(feed_id,), queue="update_feeds")
+        for feed_ids in cls.batch_feeds_by_host(feeds, batch_size=queue_size):
+            UpdateFeeds.apply_async(args=(feed_ids,), queue="update_feeds")
 
     @classmethod
-    def drain_task_feeds(cls):
-        r = redis.Redis(connection_pool=settings.REDIS_FEED_UPDATE_POOL)
-
-        tasked_feeds = r.zrange("tasked_feeds", 0, -1)
-        if tasked_feeds:
-            logging.debug(" ---> ~FRDraining %s tasked feeds..." % len(tasked_feeds))
-            r.sadd("queued_feeds", *tasked_feeds)
-            r.zremrangebyrank("tasked_feeds", 0, -1)
-        else:
-            logging.debug(" ---> No tasked feeds to drain")
+    def batch_feeds_by_host(cls, feed_ids, batch_size=None, batch_seconds=None):
+        """
+        Packs feeds into update-feeds batches so the long tail of tiny feeds doesn't
+        cost a celery message and task setup each. Feeds on the same host sit next
+        to each other in a batch and are fetched one after another, and a batch
+        closes once its feeds' expected fetch time (last_load_time, or a default
+        for feeds never timed) reaches batch_seconds.
+        """
+        batch_size = batch_size or settings.FEED_TASK_BATCH_SIZE
+        batch_seconds = batch_seconds or settings.FEED_TASK_BATCH_SECONDS
+        default_load_time = 5
+
+        feed_ids = [int(feed_id) for feed_id in feed_ids]
+        feeds_by_host = defaultdict(list)
+        known_feed_ids = set()
+        for feed_ids_group in chunks(feed_ids, 1000):
+            feeds = cls.objects.filter(pk__in=feed_ids_group).values_list(
+                "pk", "feed_address", "last_load_time"
+            )
+            for feed_id, feed_address, last_load_time in feeds:
+                host = urllib.parse.urlparse(feed_address or "").netloc.lower()
+                if host.startswith("www."):
+                    host = host[4:]
+                feeds_by_host[host].append((feed_id, last_load_time or default_load_time))
+                known_feed_ids.add(feed_id)
+        # Feeds that no longer exist are still tasked, so update-feeds can drop them
+        for feed_id in feed_ids:
+            if feed_id not in known_feed_ids:
+                feeds_by_host[None].append((feed_id, default_load_time))
+
+        batches = []
+        batch = []
+        batch_load_time = 0
+        hosts = sorted(feeds_by_host.keys(), key=lambda host: len(feeds_by_host[host]), reverse=True)
+        for host in hosts:
+            for feed_id, load_time in feeds_by_host[host]:
+                if batch and (len(batch) >= batch_size or batch_load_time + load_time > batch_seconds):
+                    batches.append(batch)
+                    batch = []
+                    batch_load_time = 0
+                batch.append(feed_id)
+                batch_load_time += load_time
+        if batch:
+            batches.append(batch)
+
+        return batches
 
-        errored_feeds = r.zrange("error_feeds", 0, -1)
-        if errored_feeds:
-            logging.debug(" ---> ~FRDraining %s errored feeds..." % len(errored_feeds))
-            r.sadd("queued_feeds", *errored_feeds)
-            r.zremrangebyrank("error_feeds", 0, -1)
+    @classmethod
+    def drain_task_feeds(cls):
+        drained_feeds = FeedScheduler().drain()
+        if drained_feeds:
+            logging.debug(" ---> ~FRDraining %s tasked and errored feeds..." % len(drained_feeds))
         else:
-            logging.debug(" ---> No errored feeds to drain")
+            logging.debug(" ---> No tasked or errored feeds to drain")
 
     def update_all_statistics(self, has_new_stories=False, force=False):
         recount = not self.counts_converted_to_redis
@@ -895,7 +1090,7 @@ class Feed(models.Model):
 
         return False
 
-    def count_subscribers(self, recount=True, verbose=False):
+    def count_subscribers(self, recount=False, verbose=False):
         if recount or not self.counts_converted_to_redis:
             from apps.profile.models import Profile
 
@@ -1336,16 +1531,9 @@ class Feed(models.Model):
 
         return headers
 
-    def update(self, **kwargs):
-        try:
-            from utils import feed_fetcher
-        except ImportError as e:
-            logging.info(" ***> ~BR~FRImportError: %s" % e)
-            return
-        r = redis.Redis(connection_pool=settings.REDIS_FEED_UPDATE_POOL)
-        original_feed_id = int(self.pk)
-
-        options = {
+    @classmethod
+    def update_options(cls, **kwargs):
+        return {
             "verbose": kwargs.get("verbose"),
             "timeout": 10,
             "single_threaded": kwargs.get("single_threaded", True),
@@ -1363,6 +1551,15 @@ class Feed(models.Model):
             "archive_page": kwargs.get("archive_page", None),
         }
 
+    def update(self, **kwargs):
+        try:
+            from utils import feed_fetcher
+        except ImportError as e:
+            logging.info(" ***> ~BR~FRImportError: %s" % e)
+            return
+        original_feed_id = int(self.pk)
+        options = Feed.update_options(**kwargs)
+
         if getattr(settings, "TEST_DEBUG", False) and "NEWSBLUR_DIR" in self.feed_address:
             print(" ---> Testing feed fetch: %s" % self.log_title)
             # options['force_fp'] = True # No, why would this be needed?
@@ -1383,23 +1580,70 @@ class Feed(models.Model):
 
         if feed:
             feed = Feed.get_by_id(feed.pk)
+
+        return Feed.finish_update(original_feed_id, feed)
+
+    @classmethod
+    def finish_update(cls, original_feed_id, feed):
+        """Reschedules a fetched feed and takes it, and its id before any merge, out of the tasked queue."""
         if feed:
             feed.last_update = datetime.datetime.utcnow()
             feed.set_next_scheduled_update(verbose=settings.DEBUG)
-            r.zadd("fetched_feeds_last_hour", {feed.pk: int(datetime.datetime.now().strftime("%s"))})
 
+        scheduler = FeedScheduler()
         if not feed or original_feed_id != feed.pk:
             logging.info(
                 " ---> ~FRFeed changed id, removing %s from tasked_feeds queue..." % original_feed_id
             )
-            r.zrem("tasked_feeds", original_feed_id)
-            r.zrem("error_feeds", original_feed_id)
+            scheduler.finish(original_feed_id, fetched=False)
         if feed:
-            r.zrem("tasked_feeds", feed.pk)
-            r.zrem("error_feeds", feed.pk)
+            scheduler.finish(feed.pk)
 
         return feed
 
+    @classmethod
+    def update_feeds(cls, feed_ids, **kwargs):
+        """
+        Fetches a batch of feeds in one worker, downloading all of their plain RSS/Atom
+        feeds concurrently through the async fetch stage and parsing each as it
+        arrives, then finishes every feed as update() does. Newsletters and test feeds
+        still go through update() one at a time.
+        """
+        try:
+            from utils import feed_fetcher
+        except ImportError as e:
+            logging.info(" ***> ~BR~FRImportError: %s" % e)
+            return
+
+        feed_ids = [int(feed_id) for feed_id in feed_ids]
+        options = cls.update_options(**kwargs)
+        options["async_fetch"] = True
+        options["async_concurrency"] = settings.UPDATE_FEEDS_ASYNC_CONCURRENCY
+
+        fetch_feed_ids = []
+        for feed_id in feed_ids:
+            feed = cls.get_by_id(feed_id)
+            if not feed:
+                continue
+            if feed.is_newsletter or (
+                getattr(settings, "TEST_DEBUG", False) and "NEWSBLUR_DIR" in feed.feed_address
+            ):
+                feed.update(**kwargs)
+            else:
+                fetch_feed_ids.append(feed_id)
+
+        if not fetch_feed_ids:
+            return
+
+        try:
+            disp = feed_fetcher.Dispatcher(options, 1)
+            disp.add_jobs([fetch_feed_ids])
+            disp.run_jobs()
+        finally:
+            # Feeds cut short by the task's time limit are rescheduled too
+            for feed_id in fetch_feed_ids:
+                cls.finish_update(feed_id, cls.get_by_id(feed_id))
+
     def update_newsletter_icon(self):
         from apps.rss_feeds.icon_importer import IconImporter
 
@@ -1410,18 +1654,27 @@ class Feed(models.Model):
 
     @classmethod
     def get_by_id(cls, feed_id, feed_address=None):
+        feed = FeedIdentityMap.get(feed_id)
+        if feed:
+            return feed
+
         try:
             feed = Feed.objects.get(pk=feed_id)
+            FeedIdentityMap.add(feed_id, feed)
             return feed
         except Feed.DoesNotExist:
             # Feed has been merged after updating. Find the right feed.
             duplicate_feeds = DuplicateFeed.objects.filter(duplicate_feed_id=feed_id)
             if duplicate_feeds:
-                return duplicate_feeds[0].feed
+                feed = duplicate_feeds[0].feed
+                FeedIdentityMap.add(feed_id, feed)
+                return feed
             if feed_address:
                 duplicate_feeds = DuplicateFeed.objects.filter(duplicate_address=feed_address)
                 if duplicate_feeds:
-                    return duplicate_feeds[0].feed
+                    feed = duplicate_feeds[0].feed
+                    FeedIdentityMap.add(feed_id, feed)
+                    return feed
 
     @classmethod
     def get_by_name(cls, query, limit=1):
@@ -1436,13 +1689,16 @@ class Feed(models.Model):
     def add_update_stories(self, stories, existing_stories, verbose=False, updates_off=False):
         ret_values = dict(new=0, updated=0, same=0, error=0)
         error_count = self.error_count
-        new_story_hashes = [s.get("story_hash") for s in stories]
+        new_story_hashes = set(s.get("story_hash") for s in stories)
+        new_stories = []
+        updated_stories = []
 
         if settings.DEBUG or verbose:
             logging.debug(
                 "   ---> [%-30s] ~FBChecking ~SB%s~SN new/updated against ~SB%s~SN stories"
                 % (self.log_title[:30], len(stories), len(list(existing_stories.keys())))
             )
+        existing_stories = ExistingStoriesIndex(existing_stories)
 
         @timelimit(5)
         def _1(story, story_content, existing_stories, new_story_hashes):
@@ -1467,6 +1723,13 @@ class Feed(models.Model):
             story_link = self.get_permalink(story)
             replace_story_date = False
 
+            # Fast path: identical title, content, and permalink means nothing to diff
+            story_fingerprint = MStory.fingerprint_unsaved(story.get("title"), story_content, story_link)
+            existing_story = existing_stories.stories.get(story.get("story_hash"))
+            if existing_story and existing_story.story_fingerprint == story_fingerprint:
+                ret_values["same"] += 1
+                continue
+
             try:
                 existing_story, story_has_changed = _1(
                     story, story_content, existing_stories, new_story_hashes
@@ -1495,19 +1758,8 @@ class Feed(models.Model):
                     story_guid=story.get("guid"),
                     story_tags=story_tags,
                 )
-                try:
-                    s.save()
-                    ret_values["new"] += 1
-                    s.publish_to_subscribers()
-                except (IntegrityError, OperationError) as e:
-                    ret_values["error"] += 1
-                    if settings.DEBUG:
-                        logging.info(
-                            "   ---> [%-30s] ~SN~FRIntegrityError on new story: %s - %s"
-                            % (self.feed_title[:30], story.get("guid"), e)
-                        )
-                if self.search_indexed:
-                    s.index_story_for_search()
+                # Saved together after all stories are checked, see save_new_stories
+                new_stories.append(s)
             elif existing_story and story_has_changed and not updates_off and ret_values["updated"] < 3:
                 # update story
                 original_content = None
@@ -1591,15 +1843,44 @@ class Feed(models.Model):
                             % (self.feed_title[:30], story.get("title")[:30])
                         )
                 if self.search_indexed:
-                    existing_story.index_story_for_search()
+                    updated_stories.append(existing_story)
             else:
                 ret_values["same"] += 1
+                if (
+                    existing_story
+                    and not story_has_changed
+                    and existing_story.story_hash == story.get("story_hash")
+                    and existing_story.story_fingerprint != story_fingerprint
+                ):
+                    # Backfill stories saved before fingerprints, so next fetch takes the fast path
+                    MStory.objects(id=existing_story.id).update_one(set__story_fingerprint=story_fingerprint)
+                    existing_story.story_fingerprint = story_fingerprint
                 if verbose:
                     logging.debug(
                         "Unchanged story (%s): %s / %s "
                         % (story.get("story_hash"), story.get("guid"), story.get("title"))
                     )
 
+        if updated_stories:
+            # Updated stories overwrite their indexed version instead of conflicting with it
+            MStory.index_stories_for_search(updated_stories, op_type="index")
+
+        if new_stories:
+            saved_stories, failed_stories = MStory.save_new_stories(new_stories)
+            ret_values["new"] += len(saved_stories)
+            ret_values["new_story_hashes"] = [s.story_hash for s in saved_stories]
+            ret_values["error"] += len(failed_stories)
+            if settings.DEBUG:
+                for s, e in failed_stories:
+                    logging.info(
+                        "   ---> [%-30s] ~SN~FRIntegrityError on new story: %s - %s"
+                        % (self.feed_title[:30], s.story_guid, e)
+                    )
+            if self.search_indexed and saved_stories:
+                MStory.index_stories_for_search(saved_stories)
+            if saved_stories:
+                self.update_fs_size_bytes(len(saved_stories), sum(s.story_size_bytes for s in saved_stories))
+
         return ret_values
 
     def update_story_with_new_guid(self, existing_story, new_story_guid):
@@ -1674,38 +1955,42 @@ class Feed(models.Model):
     def trim_old_stories(cls, start=0, verbose=True, dryrun=False, total=0, end=None):
         now = datetime.datetime.now()
         month_ago = now - datetime.timedelta(days=settings.DAYS_OF_STORY_HASHES)
-        feed_count = end or Feed.objects.latest("pk").pk
 
-        for feed_id in range(start, feed_count):
-            if feed_id % 1000 == 0:
-                print(
-                    "\n\n -------------------------- %s (%s deleted so far) --------------------------\n\n"
-                    % (feed_id, total)
-                )
-            try:
-                feed = Feed.objects.get(pk=feed_id)
-            except Feed.DoesNotExist:
-                continue
-            # Ensure only feeds with no active subscribers are being trimmed
-            if (
-                feed.active_subscribers <= 0
-                and (not feed.archive_subscribers or feed.archive_subscribers <= 0)
-                and (not feed.last_story_date or feed.last_story_date < month_ago)
-            ):
-                # 1 month since last story = keep 5 stories, >6 months since, only keep 1 story
-                months_ago = 6
-                if feed.last_story_date:
-                    months_ago = int((now - feed.last_story_date).days / 30.0)
-                cutoff = max(1, 6 - months_ago)
-                if dryrun:
-                    print(" DRYRUN: %s cutoff - %s" % (cutoff, feed))
-                else:
-                    total += MStory.trim_feed(feed=feed, cutoff=cutoff, verbose=verbose)
-            else:
-                if dryrun:
-                    print(" DRYRUN: %s/%s cutoff - %s" % (cutoff, feed.story_cutoff, feed))
+        # Feeds always keep at least one story, so only feeds with more can need trimming
+        story_counts = MStory.story_counts_by_feed(start=start, end=end, min_count=2)
+        print(" ---> Found %s feeds with more than one story" % len(story_counts))
+
+        for feed_ids in chunks(sorted(story_counts.keys()), 1000):
+            print(
+                "\n\n -------------------------- %s (%s deleted so far) --------------------------\n\n"
+                % (feed_ids[0], total)
+            )
+            for feed in Feed.objects.filter(pk__in=feed_ids):
+                story_count = story_counts[feed.pk]
+                # Ensure only feeds with no active subscribers are being trimmed
+                if (
+                    feed.active_subscribers <= 0
+                    and (not feed.archive_subscribers or feed.archive_subscribers <= 0)
+                    and (not feed.last_story_date or feed.last_story_date < month_ago)
+                ):
+                    # 1 month since last story = keep 5 stories, >6 months since, only keep 1 story
+                    months_ago = 6
+                    if feed.last_story_date:
+                        months_ago = int((now - feed.last_story_date).days / 30.0)
+                    cutoff = max(1, 6 - months_ago)
+                    if story_count <= cutoff:
+                        continue
+                    if dryrun:
+                        print(" DRYRUN: %s/%s cutoff - %s" % (story_count, cutoff, feed))
+                    else:
+                        total += MStory.trim_feed(feed=feed, cutoff=cutoff, verbose=verbose)
                 else:
-                    total += feed.trim_feed(verbose=verbose)
+                    if story_count <= feed.story_cutoff:
+                        continue
+                    if dryrun:
+                        print(" DRYRUN: %s/%s cutoff - %s" % (story_count, feed.story_cutoff, feed))
+                    else:
+                        total += feed.trim_feed(verbose=verbose)
 
         print(" ---> Deleted %s stories in total." % total)
 
@@ -1792,41 +2077,79 @@ class Feed(models.Model):
 
         return stories_removed
 
-    def count_fs_size_bytes(self):
-        stories = MStory.objects.filter(story_feed_id=self.pk)
-        sum_bytes = 0
-        count = 0
-
-        for story in stories:
-            count += 1
-            story_with_content = story.to_mongo()
-            if story_with_content.get("story_content_z", None):
-                story_with_content["story_content"] = zlib.decompress(story_with_content["story_content_z"])
-                del story_with_content["story_content_z"]
-            if story_with_content.get("original_page_z", None):
-                story_with_content["original_page"] = zlib.decompress(story_with_content["original_page_z"])
-                del story_with_content["original_page_z"]
-            if story_with_content.get("original_text_z", None):
-                story_with_content["original_text"] = zlib.decompress(story_with_content["original_text_z"])
-                del story_with_content["original_text_z"]
-            if story_with_content.get("story_latest_content_z", None):
-                story_with_content["story_latest_content"] = zlib.decompress(
-                    story_with_content["story_latest_content_z"]
+    def count_fs_size_bytes(self, sample_size=100):
+        """
+        Sums each story's stored story_size_bytes in a server-side aggregation. Stories
+        stored before sizes were kept are estimated from a random sample of them, and
+        the sampled sizes are written back so each recount has fewer left to sample.
+        """
+        collection = MStory._get_collection()
+        stats = list(
+            collection.aggregate(
+                [
+                    {"$match": {"story_feed_id": self.pk}},
+                    {
+                        "$group": {
+                            "_id": None,
+                            "count": {"$sum": 1},
+                            "sized": {
+                                "$sum": {
+                                    "$cond": [{"$eq": [{"$type": "$story_size_bytes"}, "missing"]}, 0, 1]
+                                }
+                            },
+                            "bytes": {"$sum": "$story_size_bytes"},
+                        }
+                    },
+                ]
+            )
+        )
+        count = stats[0]["count"] if stats else 0
+        sum_bytes = stats[0]["bytes"] if stats else 0
+        unsized_count = count - (stats[0]["sized"] if stats else 0)
+
+        if unsized_count:
+            sample = list(
+                collection.aggregate(
+                    [
+                        {"$match": {"story_feed_id": self.pk, "story_size_bytes": {"$exists": False}}},
+                        {"$sample": {"size": sample_size}},
+                    ]
                 )
-                del story_with_content["story_latest_content_z"]
-            if story_with_content.get("story_original_content_z", None):
-                story_with_content["story_original_content"] = zlib.decompress(
-                    story_with_content["story_original_content_z"]
+            )
+            if sample:
+                sample_sizes = [MStory.size_bytes(story) for story in sample]
+                collection.bulk_write(
+                    [
+                        pymongo.UpdateOne({"_id": story["_id"]}, {"$set": {"story_size_bytes": size}})
+                        for story, size in zip(sample, sample_sizes)
+                    ],
+                    ordered=False,
                 )
-                del story_with_content["story_original_content_z"]
-            sum_bytes += len(bson.BSON.encode(story_with_content))
+                sum_bytes += int(sum(sample_sizes) / len(sample_sizes) * unsized_count)
 
         self.fs_size_bytes = sum_bytes
         self.archive_count = count
-        self.save()
+        self.save(update_fields=["fs_size_bytes", "archive_count"])
 
         return sum_bytes
 
+    def update_fs_size_bytes(self, story_count, size_bytes):
+        """
+        Adjusts the counted size for stories just stored (or, with negative numbers,
+        trimmed). A feed that hasn't been counted yet is left for count_fs_size_bytes.
+        """
+        if self.fs_size_bytes is None or self.archive_count is None:
+            return
+        if size_bytes is None:
+            return self.count_fs_size_bytes()
+
+        # Adjusted in the database, as fetches and trims of the same feed can overlap
+        Feed.objects.filter(pk=self.pk, fs_size_bytes__isnull=False).update(
+            fs_size_bytes=Greatest(F("fs_size_bytes") + size_bytes, 0),
+            archive_count=Greatest(F("archive_count") + story_count, 0),
+        )
+        self.refresh_from_db(fields=["fs_size_bytes", "archive_count"])
+
     def purge_feed_stories(self, update=True):
         MStory.purge_feed_stories(feed=self, cutoff=self.story_cutoff)
         if update:
@@ -2247,34 +2570,185 @@ class Feed(models.Model):
         return stories
 
     @classmethod
-    def format_stories(cls, stories_db, feed_id=None, include_permalinks=False):
+    def format_stories(cls, stories_db, feed_id=None, include_permalinks=False, fields="full"):
+        stories_db = list(stories_db)
+        cacheable_hashes = [
+            story_db.story_hash
+            for story_db in stories_db
+            if fields == "full" and cls.formatted_story_cacheable(story_db)
+        ]
+        cached_stories = cls.cached_formatted_stories(cacheable_hashes)
         stories = []
+        new_stories = {}
 
         for story_db in stories_db:
-            story = cls.format_story(story_db, feed_id, include_permalinks=include_permalinks)
+            story_hash = getattr(story_db, "story_hash", None)
+            if story_hash in cached_stories:
+                story = cached_stories[story_hash]
+            elif story_hash in cacheable_hashes:
+                story = cls.format_story(story_db, include_permalinks=include_permalinks)
+                new_stories[story_hash] = story
+            else:
+                story = cls.format_story(
+                    story_db, feed_id, include_permalinks=include_permalinks, fields=fields
+                )
             stories.append(story)
 
+        cls.cache_formatted_stories(new_stories)
+        if feed_id:
+            for story in stories:
+                story["story_feed_id"] = feed_id
+
         return stories
 
     @classmethod
-    def format_story(cls, story_db, feed_id=None, text=False, include_permalinks=False, show_changes=False):
-        if isinstance(story_db.story_content_z, str):
-            story_db.story_content_z = base64.b64decode(story_db.story_content_z)
+    def format_story_hashes(cls, story_hashes, feed_id=None, order=None, read_preference=None, fields="full"):
+        """
+        Formatted stories for a list of story hashes. Stories already in the shared
+        formatted story cache skip both the mongo read and the decompressing and
+        image url signing of format_story, so a story formatted once after a fetch
+        is reused by scoring, notifications, and river loads.
+
+        A lighter field set (see FORMAT_STORY_FIELDS) only reads and formats what
+        it needs, and is also satisfied by an already cached full story.
+        """
+        story_hashes = list(story_hashes)
+        stories = cls.cached_formatted_stories(story_hashes, fields=fields)
+        missing_story_hashes = [story_hash for story_hash in story_hashes if story_hash not in stories]
+
+        if missing_story_hashes:
+            stories_db = MStory.objects(story_hash__in=missing_story_hashes)
+            if cls.FORMAT_STORY_FIELDS[fields]:
+                stories_db = stories_db.only(*cls.FORMAT_STORY_FIELDS[fields])
+            if read_preference:
+                stories_db = stories_db.read_preference(read_preference)
+            stories_db = list(stories_db)
+            if "story_content_z" not in cls.FORMAT_STORY_FIELDS[fields]:
+                cls.load_blank_titled_story_content(stories_db, read_preference=read_preference)
+            new_stories = {}
+            for story_db in stories_db:
+                story = cls.format_story(story_db, fields=fields)
+                new_stories[story["story_hash"]] = story
+            cls.cache_formatted_stories(new_stories, fields=fields)
+            stories.update(new_stories)
+
+        stories = list(stories.values())
+        if feed_id:
+            for story in stories:
+                story["story_feed_id"] = feed_id
+        if order:
+            stories = sorted(stories, key=lambda story: story["story_date"], reverse=order != "oldest")
+
+        return stories
+
+    @classmethod
+    def load_blank_titled_story_content(cls, stories_db, read_preference=None):
+        # A story without a title is titled from its content, so the few blank-titled
+        # stories read their content separately instead of every story reading it.
+        blank_titled = dict(
+            (story_db.story_hash, story_db) for story_db in stories_db if not story_db.story_title
+        )
+        if not blank_titled:
+            return
+        contents_db = MStory.objects(story_hash__in=list(blank_titled.keys())).only(
+            "story_hash", "story_content_z", "story_latest_content_z"
+        )
+        if read_preference:
+            contents_db = contents_db.read_preference(read_preference)
+        for content_db in contents_db:
+            story_db = blank_titled[content_db.story_hash]
+            story_db.story_content_z = content_db.story_content_z
+            story_db.story_latest_content_z = content_db.story_latest_content_z
+
+    @classmethod
+    def formatted_story_cache_key(cls, story_hash, fields="full"):
+        if fields == "full":
+            return "FS:v%s:%s" % (cls.FORMATTED_STORY_CACHE_VERSION, story_hash)
+        return "FS:v%s:%s:%s" % (cls.FORMATTED_STORY_CACHE_VERSION, fields, story_hash)
+
+    @classmethod
+    def formatted_story_cacheable(cls, story_db):
+        # Only stored stories as they are in mongo. Starred and shared stories carry
+        # per-user fields, and a story changed in memory may never be saved.
+        return (
+            type(story_db) is MStory
+            and story_db.pk
+            and story_db.story_hash
+            and story_db.story_content_z
+            and not story_db._get_changed_fields()
+        )
+
+    @classmethod
+    def cached_formatted_stories(cls, story_hashes, fields="full"):
+        if not story_hashes:
+            return {}
+        keys = {}
+        for story_hash in story_hashes:
+            keys[cls.formatted_story_cache_key(story_hash)] = story_hash
+            if fields != "full":
+                keys[cls.formatted_story_cache_key(story_hash, fields)] = story_hash
+        try:
+            cached = cache.get_many(list(keys.keys()))
+        except Exception as e:
+            logging.debug(" ***> ~FRCouldn't read formatted stories from cache: %s" % e)
+            return {}
+
+        return dict((keys[key], story) for key, story in cached.items())
+
+    @classmethod
+    def cache_formatted_stories(cls, stories, fields="full"):
+        if not stories:
+            return
+        try:
+            cache.set_many(
+                dict(
+                    (cls.formatted_story_cache_key(story_hash, fields), story)
+                    for story_hash, story in stories.items()
+                ),
+                cls.FORMATTED_STORY_CACHE_EXPIRE,
+            )
+        except Exception as e:
+            logging.debug(" ***> ~FRCouldn't write formatted stories to cache: %s" % e)
+
+    @classmethod
+    def uncache_formatted_stories(cls, story_hashes):
+        if not story_hashes:
+            return
+        try:
+            cache.delete_many(
+                [
+                    cls.formatted_story_cache_key(story_hash, fields)
+                    for story_hash in story_hashes
+                    for fields in cls.FORMAT_STORY_FIELDS
+                ]
+            )
+        except Exception as e:
+            logging.debug(" ***> ~FRCouldn't remove formatted stories from cache: %s" % e)
+
+    @classmethod
+    def format_story(
+        cls, story_db, feed_id=None, text=False, include_permalinks=False, show_changes=False, fields="full"
+    ):
+        with_content = fields != "metadata"
+        with_images = fields == "full"
 
         story_content = ""
         latest_story_content = None
         has_changes = False
-        if (
-            not show_changes
-            and hasattr(story_db, "story_latest_content_z")
-            and story_db.story_latest_content_z
-        ):
-            try:
-                latest_story_content = smart_str(zlib.decompress(story_db.story_latest_content_z))
-            except DjangoUnicodeDecodeError:
-                latest_story_content = zlib.decompress(story_db.story_latest_content_z)
-        if story_db.story_content_z:
-            story_content = smart_str(zlib.decompress(story_db.story_content_z))
+        if with_content or not story_db.story_title:
+            if isinstance(story_db.story_content_z, str):
+                story_db.story_content_z = base64.b64decode(story_db.story_content_z)
+            if (
+                not show_changes
+                and hasattr(story_db, "story_latest_content_z")
+                and story_db.story_latest_content_z
+            ):
+                try:
+                    latest_story_content = smart_str(zlib.decompress(story_db.story_latest_content_z))
+                except DjangoUnicodeDecodeError:
+                    latest_story_content = zlib.decompress(story_db.story_latest_content_z)
+            if story_db.story_content_z:
+                story_content = smart_str(zlib.decompress(story_db.story_content_z))
 
         if "<ins" in story_content or "<del" in story_content:
             has_changes = True
@@ -2301,11 +2775,13 @@ class Feed(models.Model):
         story["story_title"] = story_title
         if blank_story_title:
             story["story_title_blank"] = True
-        story["story_content"] = story_content
+        if with_content:
+            story["story_content"] = story_content
+            story["image_urls"] = story_db.image_urls
         story["story_permalink"] = story_db.story_permalink
-        story["image_urls"] = story_db.image_urls
-        story["secure_image_urls"] = cls.secure_image_urls(story_db.image_urls)
-        story["secure_image_thumbnails"] = cls.secure_image_thumbnails(story_db.image_urls)
+        if with_images:
+            story["secure_image_urls"] = cls.secure_image_urls(story_db.image_urls)
+            story["secure_image_thumbnails"] = cls.secure_image_thumbnails(story_db.image_urls)
         story["story_feed_id"] = feed_id or story_db.story_feed_id
         story["has_modifications"] = has_changes
         story["comment_count"] = story_db.comment_count if hasattr(story_db, "comment_count") else 0
@@ -2343,19 +2819,40 @@ class Feed(models.Model):
 
     @classmethod
     def secure_image_urls(cls, urls):
-        signed_urls = [
-            create_imageproxy_signed_url(settings.IMAGES_URL, settings.IMAGES_SECRET_KEY, url) for url in urls
-        ]
+        signed_urls = [cls.signed_image_url(url) for url in urls]
         return dict(zip(urls, signed_urls))
 
     @classmethod
     def secure_image_thumbnails(cls, urls, size=192):
-        signed_urls = [
-            create_imageproxy_signed_url(settings.IMAGES_URL, settings.IMAGES_SECRET_KEY, url, size)
-            for url in urls
-        ]
+        signed_urls = [cls.signed_image_url(url, size) for url in urls]
         return dict(zip(urls, signed_urls))
 
+    @classmethod
+    def signed_image_url(cls, url, size=None):
+        """
+        Signing is pure CPU and the same popular stories are formatted for every
+        reader, so each process keeps its most recently signed urls.
+        """
+        signed_urls = cls.signed_image_urls_cache
+        key = (url, size)
+        signed_url = signed_urls.get(key)
+        if signed_url:
+            try:
+                signed_urls.move_to_end(key)
+            except KeyError:
+                pass
+            return signed_url
+
+        signed_url = create_imageproxy_signed_url(settings.IMAGES_URL, settings.IMAGES_SECRET_KEY, url, size)
+        signed_urls[key] = signed_url
+        while len(signed_urls) > cls.SIGNED_IMAGE_URLS_CACHE_SIZE:
+            try:
+                signed_urls.popitem(last=False)
+            except KeyError:
+                break
+
+        return signed_url
+
     def get_tags(self, entry):
         fcat = []
         if "tags" in entry:
@@ -2398,24 +2895,22 @@ class Feed(models.Model):
         story_in_system = None
         story_has_changed = False
         story_link = self.get_permalink(story)
-        existing_stories_hashes = list(existing_stories.keys())
         story_pub_date = story.get("published")
         # story_published_now = story.get('published_now', False)
         # start_date = story_pub_date - datetime.timedelta(hours=8)
         # end_date = story_pub_date + datetime.timedelta(hours=8)
+        if not isinstance(existing_stories, ExistingStoriesIndex):
+            existing_stories = ExistingStoriesIndex(existing_stories)
 
-        for existing_story in list(existing_stories.values()):
+        for existing_story in existing_stories.candidates(story, story_link, story_content):
+            check_deadline()
             content_ratio = 0
             # existing_story_pub_date = existing_story.story_date
 
-            if isinstance(existing_story.id, str):
-                # Correcting a MongoDB bug
-                existing_story.story_guid = existing_story.id
-
             if story.get("story_hash") == existing_story.story_hash:
                 story_in_system = existing_story
             elif (
-                story.get("story_hash") in existing_stories_hashes
+                story.get("story_hash") in existing_stories.stories
                 and story.get("story_hash") != existing_story.story_hash
             ):
                 # Story already exists but is not this one
@@ -2427,24 +2922,14 @@ class Feed(models.Model):
                 # Story coming up later
                 continue
 
-            if "story_latest_content_z" in existing_story:
-                existing_story_content = smart_str(zlib.decompress(existing_story.story_latest_content_z))
-            elif "story_latest_content" in existing_story:
-                existing_story_content = existing_story.story_latest_content
-            elif "story_content_z" in existing_story:
-                existing_story_content = smart_str(zlib.decompress(existing_story.story_content_z))
-            elif "story_content" in existing_story:
-                existing_story_content = existing_story.story_content
-            else:
-                existing_story_content = ""
-
-            # Title distance + content distance, checking if story changed
-            story_title_difference = abs(levenshtein_distance(story.get("title"), existing_story.story_title))
-
-            title_ratio = difflib.SequenceMatcher(
-                None, story.get("title", ""), existing_story.story_title
-            ).ratio()
-            if title_ratio < 0.75:
+            # The quick ratios are upper bounds on ratio(), so most titles are
+            # rejected before the full comparison.
+            title_seq = difflib.SequenceMatcher(None, story.get("title", ""), existing_story.story_title)
+            if (
+                title_seq.real_quick_ratio() < 0.75
+                or title_seq.quick_ratio() < 0.75
+                or title_seq.ratio() < 0.75
+            ):
                 continue
 
             story_timedelta = existing_story.story_date - story_pub_date
@@ -2452,7 +2937,9 @@ class Feed(models.Model):
             if abs(story_timedelta.days) >= 2:
                 continue
 
-            seq = difflib.SequenceMatcher(None, story_content, existing_story_content)
+            # Title distance + content distance, checking if story changed
+            story_title_difference = abs(levenshtein_distance(story.get("title"), existing_story.story_title))
+            existing_story_content = existing_stories.content(existing_story)
 
             similiar_length_min = 1000
             if existing_story.story_permalink == story_link and existing_story.story_title == story.get(
@@ -2464,15 +2951,10 @@ class Feed(models.Model):
             if lightweight:
                 continue
 
-            if (
-                seq
-                and story_content
-                and len(story_content) > similiar_length_min
-                and existing_story_content
-                and seq.real_quick_ratio() > 0.9
-                and seq.quick_ratio() > 0.95
-            ):
-                content_ratio = seq.ratio()
+            if story_content and len(story_content) > similiar_length_min and existing_story_content:
+                seq = difflib.SequenceMatcher(None, story_content, existing_story_content)
+                if seq.real_quick_ratio() > 0.9 and seq.quick_ratio() > 0.95:
+                    content_ratio = seq.ratio()
 
             if story_title_difference > 0 and content_ratio > 0.98:
                 story_in_system = existing_story
@@ -2534,11 +3016,14 @@ class Feed(models.Model):
         #     print 'New/updated story: %s' % (story),
         return story_in_system, story_has_changed
 
-    def get_next_scheduled_update(self, force=False, verbose=True, premium_speed=False, pro_speed=False):
+    def get_next_scheduled_update(
+        self, force=False, verbose=True, premium_speed=False, pro_speed=False, scheduling_inputs=None
+    ):
         if self.min_to_decay and not force and not premium_speed:
             return self.min_to_decay
 
-        from apps.notifications.models import MUserFeedNotification
+        if not scheduling_inputs:
+            scheduling_inputs = FeedScheduler().scheduling_inputs(self.pk)
 
         if premium_speed:
             self.active_premium_subscribers += 1
@@ -2549,7 +3034,7 @@ class Feed(models.Model):
         subs = self.active_premium_subscribers + (
             (self.active_subscribers - self.active_premium_subscribers) / 10.0
         )
-        notification_count = MUserFeedNotification.objects.filter(feed_id=self.pk).count()
+        notification_count = scheduling_inputs["notification_count"]
         # Calculate sub counts:
         #   SELECT COUNT(*) FROM feeds WHERE active_premium_subscribers > 10 AND stories_last_month >= 30;
         #   SELECT COUNT(*) FROM feeds WHERE active_premium_subscribers > 1 AND active_premium_subscribers < 10 AND stories_last_month >= 30;
@@ -2603,10 +3088,8 @@ class Feed(models.Model):
         #     subscriber_bonus /= min(self.active_subscribers+self.premium_subscribers, 5)
         # subscriber_bonus = int(subscriber_bonus)
 
-        if self.is_push:
-            fetch_history = MFetchHistory.feed(self.pk)
-            if len(fetch_history["push_history"]):
-                total = total * 12
+        if self.is_push and scheduling_inputs["last_push"]:
+            total = total * 12
 
         # Any notifications means a 30 min minumum
         if notification_count > 0:
@@ -2650,9 +3133,11 @@ class Feed(models.Model):
         return total
 
     def set_next_scheduled_update(self, verbose=False, skip_scheduling=False):
-        r = redis.Redis(connection_pool=settings.REDIS_FEED_UPDATE_POOL)
-        total = self.get_next_scheduled_update(force=True, verbose=verbose)
-        error_count = self.error_count
+        scheduling_inputs = FeedScheduler().scheduling_inputs(self.pk)
+        total = self.get_next_scheduled_update(
+            force=True, verbose=verbose, scheduling_inputs=scheduling_inputs
+        )
+        error_count = scheduling_inputs["error_count"] + self.errors_since_good
 
         if error_count:
             total = total * error_count
@@ -2672,10 +3157,11 @@ class Feed(models.Model):
         minutes_to_next_fetch = (delta.seconds + (delta.days * 24 * 3600)) / 60
         if minutes_to_next_fetch > self.min_to_decay or not skip_scheduling:
             self.next_scheduled_update = next_scheduled_update
-            if self.active_subscribers >= 1:
-                r.zadd("scheduled_updates", {self.pk: self.next_scheduled_update.strftime("%s")})
-            r.zrem("tasked_feeds", self.pk)
-            r.srem("queued_feeds", self.pk)
+            queue = self.active_subscribers >= 1
+            priority = None
+            if queue:
+                priority = FeedScheduler.priority_for_feed(self, scheduling_inputs["notification_count"])
+            FeedScheduler().schedule(self.pk, self.next_scheduled_update, priority=priority, queue=queue)
 
         updated_fields = ["last_update", "next_scheduled_update"]
         if self.min_to_decay != original_min_to_decay:
@@ -2684,13 +3170,9 @@ class Feed(models.Model):
 
     @property
     def error_count(self):
-        r = redis.Redis(connection_pool=settings.REDIS_FEED_UPDATE_POOL)
-        fetch_errors = int(r.zscore("error_feeds", self.pk) or 0)
-
-        return fetch_errors + self.errors_since_good
+        return FeedScheduler().error_count(self.pk) + self.errors_since_good
 
     def schedule_feed_fetch_immediately(self, verbose=True):
-        r = redis.Redis(connection_pool=settings.REDIS_FEED_UPDATE_POOL)
         if not self.num_subscribers:
             logging.debug(
                 "   ---> [%-30s] Not scheduling feed fetch immediately, no subs." % (self.log_title[:30])
@@ -2701,7 +3183,9 @@ class Feed(models.Model):
             logging.debug("   ---> [%-30s] Scheduling feed fetch immediately..." % (self.log_title[:30]))
 
         self.next_scheduled_update = datetime.datetime.utcnow()
-        r.zadd("scheduled_updates", {self.pk: self.next_scheduled_update.strftime("%s")})
+        FeedScheduler().schedule(
+            self.pk, self.next_scheduled_update, priority=FeedScheduler.PRIORITY_IMMEDIATE
+        )
 
         return self.save()
 
@@ -2773,6 +3257,78 @@ class Feed(models.Model):
 #     phrase = models.CharField(max_length=500)
 
 
+class ExistingStoriesIndex:
+    """
+    Stories already stored for a feed, indexed so that Feed._exists_story only
+    runs its fuzzy title and content comparison against plausible matches
+    instead of every stored story. Decompressed content is cached, so each
+    stored story is decompressed at most once per fetch.
+    """
+
+    def __init__(self, existing_stories):
+        self.stories = existing_stories
+        self.positions = {}
+        self.by_day = defaultdict(list)
+        self.by_permalink_title = defaultdict(list)
+        self.undated = []
+        self.contents = {}
+
+        for position, existing_story in enumerate(existing_stories.values()):
+            if isinstance(existing_story.id, str):
+                # Correcting a MongoDB bug
+                existing_story.story_guid = existing_story.id
+            self.positions[id(existing_story)] = position
+            if existing_story.story_date:
+                self.by_day[existing_story.story_date.date()].append(existing_story)
+            else:
+                self.undated.append(existing_story)
+            key = (existing_story.story_permalink, existing_story.story_title)
+            self.by_permalink_title[key].append(existing_story)
+
+    def candidates(self, story, story_link, story_content):
+        """
+        Existing stories that could possibly match, in their original order. A
+        story with a known hash can only match itself. Otherwise a match needs a
+        near-identical body published within two days, and bodies between 20 and
+        1000 characters are only compared when permalink and title are identical.
+        """
+        existing_story = self.stories.get(story.get("story_hash"))
+        if existing_story is not None:
+            return [existing_story]
+
+        story_pub_date = story.get("published")
+        if not story_content or len(story_content) <= 20:
+            return []
+        elif len(story_content) <= 1000:
+            candidates = self.by_permalink_title.get((story_link, story.get("title")), [])
+        elif not story_pub_date:
+            return list(self.stories.values())
+        else:
+            # Stored date minus published date must fall in [-1 day, 2 days)
+            candidates = list(self.undated)
+            for days in range(-1, 3):
+                day = (story_pub_date + datetime.timedelta(days=days)).date()
+                candidates.extend(self.by_day.get(day, []))
+
+        return sorted(candidates, key=lambda s: self.positions[id(s)])
+
+    def content(self, existing_story):
+        key = id(existing_story)
+        if key not in self.contents:
+            if "story_latest_content_z" in existing_story:
+                existing_story_content = smart_str(zlib.decompress(existing_story.story_latest_content_z))
+            elif "story_latest_content" in existing_story:
+                existing_story_content = existing_story.story_latest_content
+            elif "story_content_z" in existing_story:
+                existing_story_content = smart_str(zlib.decompress(existing_story.story_content_z))
+            elif "story_content" in existing_story:
+                existing_story_content = existing_story.story_content
+            else:
+                existing_story_content = ""
+            self.contents[key] = existing_story_content
+        return self.contents[key]
+
+
 class FeedData(models.Model):
     feed = AutoOneToOneField(Feed, related_name="data", on_delete=models.CASCADE)
     feed_tagline = models.CharField(max_length=1024, blank=True, null=True)
@@ -2896,6 +3452,8 @@ class MStory(mongo.Document):
     story_permalink = mongo.StringField()
     story_guid = mongo.StringField()
     story_hash = mongo.StringField()
+    story_fingerprint = mongo.StringField()
+    story_size_bytes = mongo.IntField()
     image_urls = mongo.ListField(mongo.StringField(max_length=1024))
     story_tags = mongo.ListField(mongo.StringField(max_length=250))
     comment_count = mongo.IntField()
@@ -2920,6 +3478,17 @@ class MStory(mongo.Document):
 
     RE_STORY_HASH = re.compile(r"^(\d{1,10}):(\w{6})$")
     RE_RS_KEY = re.compile(r"^RS:(\d+):(\d+)$")
+    # Fields read when bulk indexing stories for search
+    SEARCH_FIELDS = (
+        "story_hash",
+        "story_title",
+        "story_content",
+        "story_content_z",
+        "story_tags",
+        "story_author_name",
+        "story_feed_id",
+        "story_date",
+    )
 
     def __str__(self):
         content = self.story_content_z if self.story_content_z else ""
@@ -2941,6 +3510,14 @@ class MStory(mongo.Document):
     def feed_guid_hash_unsaved(cls, feed_id, guid):
         return "%s:%s" % (feed_id, cls.guid_hash_unsaved(guid))
 
+    @classmethod
+    def fingerprint_unsaved(cls, title, content, permalink):
+        """Hash of everything add_update_stories compares to decide a story is unchanged."""
+        fingerprint = "\n".join(
+            [smart_str(title or "").strip(), smart_str(content or ""), smart_str(permalink or "")]
+        )
+        return hashlib.sha1(smart_bytes(fingerprint)).hexdigest()
+
     @property
     def decoded_story_title(self):
         return html.unescape(self.story_title)
@@ -2956,38 +3533,176 @@ class MStory(mongo.Document):
         return story_content
 
     def save(self, *args, **kwargs):
+        self.prepare_for_save()
+
+        super(MStory, self).save(*args, **kwargs)
+
+        self.sync_redis()
+        Feed.uncache_formatted_stories([self.story_hash])
+
+        return self
+
+    def prepare_for_save(self):
         story_title_max = MStory._fields["story_title"].max_length
         story_content_type_max = MStory._fields["story_content_type"].max_length
         self.story_hash = self.feed_guid_hash
 
         self.extract_image_urls()
 
+        # Fingerprint the content that Feed._exists_story compares against, which is the
+        # latest content when there is any. Stories re-saved without their content loaded
+        # keep their fingerprint.
+        if self.story_latest_content:
+            self.story_fingerprint = self.fingerprint_unsaved(
+                self.story_title, self.story_latest_content, self.story_permalink
+            )
+        elif self.story_content and not self.story_latest_content_z:
+            self.story_fingerprint = self.fingerprint_unsaved(
+                self.story_title, self.story_content, self.story_permalink
+            )
+        elif self.story_content:
+            self.story_fingerprint = None
+
+        uncompressed_bytes = {}
         if self.story_content:
-            self.story_content_z = zlib.compress(smart_bytes(self.story_content))
+            story_content = smart_bytes(self.story_content)
+            uncompressed_bytes["story_content_z"] = len(story_content)
+            self.story_content_z = zlib.compress(story_content)
             self.story_content = None
         if self.story_original_content:
-            self.story_original_content_z = zlib.compress(smart_bytes(self.story_original_content))
+            story_original_content = smart_bytes(self.story_original_content)
+            uncompressed_bytes["story_original_content_z"] = len(story_original_content)
+            self.story_original_content_z = zlib.compress(story_original_content)
             self.story_original_content = None
         if self.story_latest_content:
-            self.story_latest_content_z = zlib.compress(smart_bytes(self.story_latest_content))
+            story_latest_content = smart_bytes(self.story_latest_content)
+            uncompressed_bytes["story_latest_content_z"] = len(story_latest_content)
+            self.story_latest_content_z = zlib.compress(story_latest_content)
             self.story_latest_content = None
         if self.story_title and len(self.story_title) > story_title_max:
             self.story_title = self.story_title[:story_title_max]
         if self.story_content_type and len(self.story_content_type) > story_content_type_max:
             self.story_content_type = self.story_content_type[:story_content_type_max]
 
-        super(MStory, self).save(*args, **kwargs)
+        # Re-saves that only touch other fields keep their size
+        if self._created or uncompressed_bytes or set(self._changed_fields) & set(self.COMPRESSED_FIELDS):
+            self.story_size_bytes = self.size_bytes(self.to_mongo(), uncompressed_bytes)
 
-        self.sync_redis()
+    COMPRESSED_FIELDS = (
+        "story_content_z",
+        "story_original_content_z",
+        "story_latest_content_z",
+        "original_text_z",
+        "original_page_z",
+    )
 
-        return self
+    @classmethod
+    def size_bytes(cls, story, uncompressed_bytes=None):
+        """
+        Size of a raw story document with its compressed fields counted at their
+        uncompressed length. Lengths already known are passed in uncompressed_bytes,
+        keyed by field, so that only the others are decompressed to measure.
+        """
+        if not uncompressed_bytes:
+            uncompressed_bytes = {}
+
+        size = len(bson.BSON.encode(story))
+        for field in cls.COMPRESSED_FIELDS:
+            compressed = story.get(field)
+            if not compressed:
+                continue
+            uncompressed_size = uncompressed_bytes.get(field)
+            if uncompressed_size is None:
+                uncompressed_size = len(zlib.decompress(compressed))
+            size += uncompressed_size - len(compressed)
+
+        return size
 
     def delete(self, *args, **kwargs):
         self.remove_from_redis()
         self.remove_from_search_index()
+        Feed.uncache_formatted_stories([self.story_hash])
 
         super(MStory, self).delete(*args, **kwargs)
 
+    @classmethod
+    def save_new_stories(cls, stories):
+        """
+        Inserts new stories with a single unordered insert_many, then syncs them to
+        redis and publishes them to real-time subscribers in one pipeline each. A
+        story that fails (duplicate story_hash, invalid fields) doesn't stop the rest.
+
+        Returns the saved stories and a list of (story, exception) for the failures.
+        """
+        saved = []
+        failed = []
+        docs = []
+        for story in stories:
+            story.prepare_for_save()
+            try:
+                story.validate()
+            except ValidationError as e:
+                failed.append((story, e))
+                continue
+            saved.append(story)
+            docs.append(story.to_mongo().to_dict())
+
+        if not docs:
+            return saved, failed
+
+        write_errors = {}
+        try:
+            cls._get_collection().insert_many(docs, ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            write_errors = dict((error["index"], error) for error in e.details.get("writeErrors", []))
+
+        inserted = []
+        for index, (story, doc) in enumerate(zip(saved, docs)):
+            error = write_errors.get(index)
+            if error:
+                if error.get("code") == 11000:
+                    failed.append((story, NotUniqueError(error.get("errmsg"))))
+                else:
+                    failed.append((story, OperationError(error.get("errmsg"))))
+                continue
+            story.id = doc["_id"]
+            story._created = False
+            story._clear_changed_fields()
+            inserted.append(story)
+
+        r = redis.Redis(connection_pool=settings.REDIS_STORY_HASH_POOL)
+        p = r.pipeline()
+        feeds = {}
+        for story in inserted:
+            if story.story_feed_id not in feeds:
+                feeds[story.story_feed_id] = Feed.get_by_id(story.story_feed_id)
+            story.sync_redis(r=p, feed=feeds[story.story_feed_id])
+        p.execute()
+
+        cls.publish_stories_to_subscribers(inserted)
+
+        return inserted, failed
+
+    @classmethod
+    def publish_stories_to_subscribers(cls, stories):
+        if not stories:
+            return
+
+        try:
+            r = redis.Redis(connection_pool=settings.REDIS_PUBSUB_POOL)
+            p = r.pipeline(transaction=False)
+            for story in stories:
+                p.publish(
+                    "%s:story" % (story.story_feed_id),
+                    "%s,%s" % (story.story_hash, story.story_date.strftime("%s")),
+                )
+            p.execute()
+        except redis.ConnectionError:
+            logging.debug(
+                "   ***> [%-30s] ~BMRedis is unavailable for real-time."
+                % (Feed.get_by_id(stories[0].story_feed_id).title[:30],)
+            )
+
     def publish_to_subscribers(self):
         try:
             r = redis.Redis(connection_pool=settings.REDIS_PUBSUB_POOL)
@@ -3017,16 +3732,16 @@ class MStory(mongo.Document):
         last_pk = Feed.objects.latest("pk").pk
         for f in range(offset, last_pk, 1000):
             print(" ---> %s / %s (%.2s%%)" % (f, last_pk, float(f) / last_pk * 100))
-            feeds = Feed.objects.filter(
-                pk__in=list(range(f, f + 1000)), active=True, active_subscribers__gte=1
-            ).values_list("pk")
-            for (f,) in feeds:
-                stories = cls.objects.filter(story_feed_id=f)
-                if not len(stories):
-                    continue
-                print(f"Indexing {len(stories)} stories in feed {f}")
-                for story in stories:
-                    story.index_story_for_search()
+            feed_ids = list(
+                Feed.objects.filter(
+                    pk__in=list(range(f, f + 1000)), active=True, active_subscribers__gte=1
+                ).values_list("pk", flat=True)
+            )
+            if not feed_ids:
+                continue
+            stories = cls.objects.filter(story_feed_id__in=feed_ids).only(*cls.SEARCH_FIELDS)
+            indexed = cls.index_stories_for_search(stories)
+            print(f"Indexed {indexed} stories in {len(feed_ids)} feeds")
 
     def index_story_for_search(self):
         story_content = self.story_content or ""
@@ -3042,6 +3757,27 @@ class MStory(mongo.Document):
             story_date=self.story_date,
         )
 
+    @classmethod
+    def index_stories_for_search(cls, stories, op_type="create"):
+        """Bulk indexes an iterable of stories, which may be a queryset streamed from mongo."""
+
+        def docs():
+            for story in stories:
+                story_content = story.story_content or ""
+                if story.story_content_z:
+                    story_content = zlib.decompress(story.story_content_z)
+                yield dict(
+                    story_hash=story.story_hash,
+                    story_title=story.story_title,
+                    story_content=prep_for_search(story_content),
+                    story_tags=story.story_tags,
+                    story_author=story.story_author_name,
+                    story_feed_id=story.story_feed_id,
+                    story_date=story.story_date,
+                )
+
+        return SearchStory.bulk_index(docs(), op_type=op_type)
+
     def remove_from_search_index(self):
         try:
             SearchStory.remove(self.story_hash)
@@ -3061,11 +3797,12 @@ class MStory(mongo.Document):
             feed = feed_id
 
         stories = cls.objects(story_feed_id=feed_id).only("story_date").order_by("-story_date")
+        story_count = stories.count()
 
-        if stories.count() > cutoff:
+        if story_count > cutoff:
             logging.debug(
                 "   ---> [%-30s] ~FMFound %s stories. Trimming to ~SB%s~SN..."
-                % (str(feed)[:30], stories.count(), cutoff)
+                % (str(feed)[:30], story_count, cutoff)
             )
             try:
                 story_trim_date = stories[cutoff].story_date
@@ -3076,15 +3813,24 @@ class MStory(mongo.Document):
                 logging.debug(" ***> [%-30s] ~BRError trimming feed: %s" % (str(feed)[:30], e))
                 return extra_stories_count
 
-            extra_stories = cls.objects(story_feed_id=feed_id, story_date__lte=story_trim_date)
-            extra_stories_count = extra_stories.count()
+            extra_stories = (
+                cls.objects(story_feed_id=feed_id, story_date__lte=story_trim_date)
+                .only("id", "story_hash", "share_count", "story_size_bytes")
+                .as_pymongo()
+            )
             shared_story_count = 0
+            trimmed_stories = []
             for story in extra_stories:
-                if story.share_count:
+                if story.get("share_count"):
                     shared_story_count += 1
-                    extra_stories_count -= 1
                     continue
-                story.delete()
+                trimmed_stories.append(story)
+            extra_stories_count = cls.delete_stories(feed_id, trimmed_stories)
+            if isinstance(feed, Feed) and extra_stories_count:
+                trimmed_bytes = None
+                if all(story.get("story_size_bytes") is not None for story in trimmed_stories):
+                    trimmed_bytes = sum(story["story_size_bytes"] for story in trimmed_stories)
+                feed.update_fs_size_bytes(-extra_stories_count, trimmed_bytes and -trimmed_bytes)
             if verbose:
                 existing_story_count = cls.objects(story_feed_id=feed_id).count()
                 logging.debug(
@@ -3094,6 +3840,54 @@ class MStory(mongo.Document):
 
         return extra_stories_count
 
+    @classmethod
+    def delete_stories(cls, feed_id, stories):
+        """
+        Bulk form of delete() for stories of a single feed, given as raw documents
+        with _id and story_hash: one delete_many per chunk, one redis pipeline,
+        and one bulk search index delete.
+        """
+        if not stories:
+            return 0
+
+        deleted_count = 0
+        for stories_group in chunks(stories, 1000):
+            deleted = cls._get_collection().delete_many({"_id": {"$in": [s["_id"] for s in stories_group]}})
+            deleted_count += deleted.deleted_count
+
+        story_hashes = [s["story_hash"] for s in stories if s.get("story_hash")]
+        r = redis.Redis(connection_pool=settings.REDIS_STORY_HASH_POOL)
+        p = r.pipeline()
+        for story_hashes_group in chunks(story_hashes, 1000):
+            p.srem("F:%s" % feed_id, *story_hashes_group)
+            p.zrem("zF:%s" % feed_id, *story_hashes_group)
+        p.execute()
+
+        try:
+            SearchStory.bulk_remove(story_hashes)
+        except Exception:
+            pass
+        Feed.uncache_formatted_stories(story_hashes)
+
+        return deleted_count
+
+    @classmethod
+    def story_counts_by_feed(cls, start=0, end=None, min_count=1):
+        """Story count of every feed with at least min_count stories, in one pass over the index."""
+        match = {"story_feed_id": {"$gte": start}}
+        if end:
+            match["story_feed_id"]["$lt"] = end
+        counts = cls._get_collection().aggregate(
+            [
+                {"$match": match},
+                {"$group": {"_id": "$story_feed_id", "count": {"$sum": 1}}},
+                {"$match": {"count": {"$gte": min_count}}},
+            ],
+            allowDiskUse=True,
+        )
+
+        return dict((count["_id"], count["count"]) for count in counts)
+
     @classmethod
     def find_story(cls, story_feed_id=None, story_id=None, story_hash=None, original_only=False):
         from apps.social.models import MSharedStory
@@ -3202,10 +3996,11 @@ class MStory(mongo.Document):
 
         return story_hashes
 
-    def sync_redis(self, r=None):
+    def sync_redis(self, r=None, feed=None):
         if not r:
             r = redis.Redis(connection_pool=settings.REDIS_STORY_HASH_POOL)
-        feed = Feed.get_by_id(self.story_feed_id)
+        if not feed:
+            feed = Feed.get_by_id(self.story_feed_id)
 
         if self.id and self.story_date > feed.unread_cutoff:
             feed_key = "F:%s" % self.story_feed_id
@@ -3245,7 +4040,7 @@ class MStory(mongo.Document):
         )
         p = r.pipeline()
         for story in stories:
-            story.sync_redis(r=p)
+            story.sync_redis(r=p, feed=feed)
         p.execute()
 
     def count_comments(self):
@@ -3837,72 +4632,77 @@ class MFetchHistory(mongo.Document):
         "allow_inheritance": False,
     }
 
+    FETCH_TYPE_FIELDS = {
+        "feed": "feed_fetch_history",
+        "page": "page_fetch_history",
+        "push": "push_history",
+        "raw_feed": "raw_feed_history",
+    }
+
     @classmethod
     def feed(cls, feed_id, timezone=None, fetch_history=None):
         if not fetch_history:
-            try:
-                fetch_history = cls.objects.read_preference(pymongo.ReadPreference.PRIMARY).get(
-                    feed_id=feed_id
-                )
-            except cls.DoesNotExist:
-                fetch_history = cls.objects.create(feed_id=feed_id)
+            collection = cls._get_collection().with_options(read_preference=pymongo.ReadPreference.PRIMARY)
+            fetch_history = collection.find_one(
+                {"feed_id": feed_id}, {"feed_fetch_history": 1, "page_fetch_history": 1, "push_history": 1}
+            )
+        if not fetch_history:
+            fetch_history = {}
         history = {}
 
         for fetch_type in ["feed_fetch_history", "page_fetch_history", "push_history"]:
-            history[fetch_type] = getattr(fetch_history, fetch_type)
-            if not history[fetch_type]:
-                history[fetch_type] = []
-            for f, fetch in enumerate(history[fetch_type]):
-                date_key = "push_date" if fetch_type == "push_history" else "fetch_date"
-                history[fetch_type][f] = {
+            history[fetch_type] = fetch_history.get(fetch_type) or []
+            # Up to 25 fetches are kept, but only the last 5 matter while there are no errors
+            if not any(fetch[1] not in [200, 304] for fetch in history[fetch_type]):
+                history[fetch_type] = history[fetch_type][:5]
+            date_key = "push_date" if fetch_type == "push_history" else "fetch_date"
+            history[fetch_type] = [
+                {
                     date_key: localtime_for_timezone(fetch[0], timezone).strftime("%Y-%m-%d %H:%M:%S"),
                     "status_code": fetch[1],
                     "message": fetch[2],
                 }
+                for fetch in history[fetch_type]
+            ]
         return history
 
     @classmethod
     def add(cls, feed_id, fetch_type, date=None, message=None, code=None, exception=None):
+        """
+        Prepends a fetch to the feed's history with a single atomic, capped $push.
+        Only a failed fetch reads the history back, returning it formatted so the
+        feed can count its errors; otherwise this returns None.
+        """
         if not date:
             date = datetime.datetime.now()
-        try:
-            fetch_history = cls.objects.read_preference(pymongo.ReadPreference.PRIMARY).get(feed_id=feed_id)
-        except cls.DoesNotExist:
-            fetch_history = cls.objects.create(feed_id=feed_id)
-
-        if fetch_type == "feed":
-            history = fetch_history.feed_fetch_history or []
-        elif fetch_type == "page":
-            history = fetch_history.page_fetch_history or []
-        elif fetch_type == "push":
-            history = fetch_history.push_history or []
-        elif fetch_type == "raw_feed":
-            history = fetch_history.raw_feed_history or []
-
-        history = [[date, code, message]] + history
-        any_exceptions = any([c for d, c, m in history if c not in [200, 304]])
-        if any_exceptions:
-            history = history[:25]
-        elif fetch_type == "raw_feed":
-            history = history[:10]
-        else:
-            history = history[:5]
-
-        if fetch_type == "feed":
-            fetch_history.feed_fetch_history = history
-        elif fetch_type == "page":
-            fetch_history.page_fetch_history = history
-        elif fetch_type == "push":
-            fetch_history.push_history = history
-        elif fetch_type == "raw_feed":
-            fetch_history.raw_feed_history = history
+        field = cls.FETCH_TYPE_FIELDS[fetch_type]
+        cap = 10 if fetch_type == "raw_feed" else 25
+        update = {"$push": {field: {"$each": [[date, code, message]], "$position": 0, "$slice": cap}}}
+        failed = code is not None and code not in [200, 304]
 
-        fetch_history.save()
+        collection = cls._get_collection()
+        try:
+            if failed:
+                fetch_history = collection.find_one_and_update(
+                    {"feed_id": feed_id},
+                    update,
+                    projection={field: 1},
+                    upsert=True,
+                    return_document=pymongo.ReturnDocument.AFTER,
+                )
+            else:
+                collection.update_one({"feed_id": feed_id}, update, upsert=True)
+        except pymongo.errors.DuplicateKeyError:
+            # Lost a race to create this feed's history, which now exists to push onto
+            return cls.add(feed_id, fetch_type, date=date, message=message, code=code, exception=exception)
 
         if fetch_type == "feed":
             RStats.add("feed_fetch")
+        elif fetch_type == "push":
+            FeedScheduler().pushed(feed_id, date)
 
-        return cls.feed(feed_id, fetch_history=fetch_history)
+        if failed:
+            return cls.feed(feed_id, fetch_history=fetch_history)
 
 
 class DuplicateFeed(models.Model):
@@ -3940,6 +4740,8 @@ def merge_feeds(original_feed_id, duplicate_feed_id, force=False):
     if original_feed_id == duplicate_feed_id:
         logging.info(" ***> Merging the same feed. Ignoring...")
         return original_feed_id
+    FeedIdentityMap.evict(original_feed_id)
+    FeedIdentityMap.evict(duplicate_feed_id)
     try:
         original_feed = Feed.objects.get(pk=original_feed_id)
         duplicate_feed = Feed.objects.get(pk=duplicate_feed_id)
@@ -4022,7 +4824,7 @@ def merge_feeds(original_feed_id, duplicate_feed_id, force=False):
         logging.debug(" ***> Duplicate feed is the same as original feed. Panic!")
     logging.debug(" ---> Deleted duplicate feed: %s/%s" % (duplicate_feed, duplicate_feed_id))
     original_feed.branch_from_feed = None
-    original_feed.count_subscribers()
+    original_feed.count_subscribers(recount=True)
     original_feed.save()
     logging.debug(" ---> Now original subscribers: %s" % (original_feed.num_subscribers))
 
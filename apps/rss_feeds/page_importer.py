@@ -22,6 +22,7 @@ from sentry_sdk import capture_exception, flush
 from apps.rss_feeds.models import MFeedPage
 from utils import log as logging
 from utils.feed_functions import TimeoutError, timelimit
+from utils.host_sessions import HostSessions
 
 # from utils.feed_functions import mail_feed_error_to_admin
 
@@ -100,10 +101,9 @@ class PageImporter(object):
                     data = response.read().decode(response.headers.get_content_charset() or "utf-8")
                 else:
                     try:
-                        response = requests.get(feed_link, headers=self.headers, timeout=10)
-                        response.connection.close()
+                        response = HostSessions.get(feed_link, headers=self.headers, timeout=10)
                     except requests.exceptions.TooManyRedirects:
-                        response = requests.get(feed_link, timeout=10)
+                        response = HostSessions.get(feed_link, timeout=10)
                     except (
                         AttributeError,
                         SocketError,
@@ -210,8 +210,7 @@ class PageImporter(object):
             return
 
         try:
-            response = requests.get(story_permalink, headers=self.headers, timeout=10)
-            response.connection.close()
+            response = HostSessions.get(story_permalink, headers=self.headers, timeout=10)
         except (
             AttributeError,
             SocketError,
@@ -222,7 +221,7 @@ class PageImporter(object):
             requests.adapters.ReadTimeout,
         ) as e:
             try:
-                response = requests.get(story_permalink, timeout=10)
+                response = HostSessions.get(story_permalink, timeout=10)
             except (
                 AttributeError,
                 SocketError,
@@ -0,0 +1,314 @@
+import datetime
+import time
+
+import redis
+from django.conf import settings
+
+# Moves every due feed from the schedule into the ready queue, scored so that
+# feeds pop by priority first and then by how long they've been due, and admits
+# up to limit of them as tasked.
+#
+# KEYS: scheduled, ready, priorities, tasked
+# ARGV: now (as a due time), limit, priority span, default priority, max feeds
+# moved per call, now (as a tasked time)
+ADMIT_LUA = """
+local now = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local span = tonumber(ARGV[3])
+local default_priority = tonumber(ARGV[4])
+
+local due = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", now, "WITHSCORES", "LIMIT", 0, tonumber(ARGV[5]))
+for i = 1, #due, 2 do
+    local priority = tonumber(redis.call("HGET", KEYS[3], due[i]) or default_priority)
+    redis.call("ZADD", KEYS[2], priority * span + tonumber(due[i + 1]), due[i])
+    redis.call("ZREM", KEYS[1], due[i])
+end
+
+local admitted = {}
+if limit > 0 then
+    admitted = redis.call("ZRANGE", KEYS[2], 0, limit - 1)
+    for _, feed_id in ipairs(admitted) do
+        redis.call("ZREM", KEYS[2], feed_id)
+        redis.call("ZADD", KEYS[4], ARGV[6], feed_id)
+    end
+end
+
+return admitted
+"""
+
+
+class FeedScheduler:
+    """
+    Every feed fetch goes through one priority queue in redis:
+
+        scheduled_updates  feed_id -> timestamp the feed is next due
+        ready_feeds        due feeds, ordered by priority and then by due time
+        tasked_feeds       feed_id -> timestamp it was handed to a worker
+        error_feeds        feed_id -> times its task was lost
+
+    Rescheduling a feed after its fetch reads everything it needs beyond the feed
+    itself in one round trip: its error count, and its notification count and last
+    push time, which are kept in hashes as notifications and pushes change.
+
+    Each task-feeds run admits as many ready feeds as workers are measured to
+    fetch (from fetched_feeds_last_hour), highest priority first, so a backlog
+    delays the least valuable feeds instead of a random sample of all of them.
+    """
+
+    SCHEDULED_KEY = "scheduled_updates"
+    READY_KEY = "ready_feeds"
+    PRIORITIES_KEY = "feed_priorities"
+    TASKED_KEY = "tasked_feeds"
+    ERRORS_KEY = "error_feeds"
+    FETCHED_KEY = "fetched_feeds_last_hour"
+    NOTIFICATIONS_KEY = "feed_notification_counts"
+    PUSHED_KEY = "feed_last_push"
+    LEGACY_QUEUED_KEY = "queued_feeds"
+
+    PRIORITY_IMMEDIATE = 0
+    PRIORITY_PRO = 1
+    PRIORITY_NOTIFICATIONS = 2
+    PRIORITY_PREMIUM = 3
+    PRIORITY_STANDARD = 4
+    PRIORITY_PUSH = 5  # Polling is only a fallback for feeds the hub pushes to us
+    PRIORITY_SPAN = 10**10
+
+    # Feeds kept in flight, as minutes of measured fetch throughput
+    IN_FLIGHT_MINUTES = 5
+    MIN_ADMITTED = 500
+    MAX_ADMITTED = 10000
+    # Due feeds moved to the ready queue per run, keeping the script from blocking
+    # redis after an outage. Later task-feeds runs move the rest.
+    MAX_MOVED = 5000
+
+    def __init__(self, r=None):
+        self.r = r or redis.Redis(connection_pool=settings.REDIS_FEED_UPDATE_POOL)
+
+    @classmethod
+    def schedule_timestamp(cls, date=None):
+        # Due times are naive UTC datetimes formatted with %s, as next_scheduled_update is
+        return int((date or datetime.datetime.utcnow()).strftime("%s"))
+
+    @classmethod
+    def priority_for_feed(cls, feed, notification_count=None):
+        if feed.pro_subscribers and feed.pro_subscribers >= 1:
+            return cls.PRIORITY_PRO
+        if notification_count is None:
+            notification_count = cls().scheduling_inputs(feed.pk)["notification_count"]
+        if notification_count:
+            return cls.PRIORITY_NOTIFICATIONS
+        if feed.is_push:
+            return cls.PRIORITY_PUSH
+        if feed.active_premium_subscribers and feed.active_premium_subscribers >= 1:
+            return cls.PRIORITY_PREMIUM
+        return cls.PRIORITY_STANDARD
+
+    def scheduling_inputs(self, feed_id):
+        """
+        A feed's notification count, last push timestamp (0 if never pushed), and
+        lost-task error count. Feeds not yet in the hashes are counted once and stored.
+        """
+        p = self.r.pipeline()
+        p.hget(self.NOTIFICATIONS_KEY, feed_id)
+        p.hget(self.PUSHED_KEY, feed_id)
+        p.zscore(self.ERRORS_KEY, feed_id)
+        notification_count, last_push, error_count = p.execute()
+
+        if notification_count is None:
+            notification_count = self.count_notifications(feed_id)
+        if last_push is None:
+            last_push = self.find_last_push(feed_id)
+
+        return {
+            "notification_count": int(notification_count),
+            "last_push": int(float(last_push)),
+            "error_count": int(error_count or 0),
+        }
+
+    def count_notifications(self, feed_id):
+        """Recounts a feed's notifications after any of them is saved or deleted."""
+        from apps.notifications.models import MUserFeedNotification
+
+        notification_count = MUserFeedNotification.objects.filter(feed_id=feed_id).count()
+        self.r.hset(self.NOTIFICATIONS_KEY, feed_id, notification_count)
+
+        return notification_count
+
+    def find_last_push(self, feed_id):
+        from apps.rss_feeds.models import MFetchHistory
+
+        fetch_history = MFetchHistory._get_collection().find_one(
+            {"feed_id": feed_id}, {"push_history": {"$slice": 1}}
+        )
+        last_push = 0
+        if fetch_history and fetch_history.get("push_history"):
+            last_push = self.schedule_timestamp(fetch_history["push_history"][0][0])
+        self.r.hset(self.PUSHED_KEY, feed_id, last_push)
+
+        return last_push
+
+    def pushed(self, feed_id, date=None):
+        self.r.hset(self.PUSHED_KEY, feed_id, self.schedule_timestamp(date))
+
+    def schedule(self, feed_id, due, priority=None, queue=True):
+        """
+        Schedules a feed's next fetch at the datetime due, taking it out of the ready
+        and tasked queues. Without queue, the feed only leaves those queues.
+        """
+        if priority is None:
+            priority = self.PRIORITY_STANDARD
+        p = self.r.pipeline()
+        if queue:
+            p.zadd(self.SCHEDULED_KEY, {feed_id: self.schedule_timestamp(due)})
+            p.hset(self.PRIORITIES_KEY, feed_id, priority)
+        p.zrem(self.READY_KEY, feed_id)
+        p.zrem(self.TASKED_KEY, feed_id)
+        p.execute()
+
+    def forget(self, feed_id):
+        """Removes every trace of a deleted or merged away feed from the queues and hashes."""
+        p = self.r.pipeline()
+        for key in (self.SCHEDULED_KEY, self.READY_KEY, self.TASKED_KEY, self.ERRORS_KEY):
+            p.zrem(key, feed_id)
+        for key in (self.PRIORITIES_KEY, self.NOTIFICATIONS_KEY, self.PUSHED_KEY):
+            p.hdel(key, feed_id)
+        p.execute()
+
+    def admission_limit(self):
+        """
+        How many feeds to admit now: enough to keep IN_FLIGHT_MINUTES of the fetch
+        rate measured over the last hour in flight, minus what's already tasked.
+        """
+        fetched_last_hour = self.r.zcard(self.FETCHED_KEY)
+        in_flight = self.r.zcard(self.TASKED_KEY)
+        target = max(self.MIN_ADMITTED, fetched_last_hour / 60.0 * self.IN_FLIGHT_MINUTES)
+
+        return int(min(self.MAX_ADMITTED, max(0, target - in_flight)))
+
+    def admit(self, limit=None):
+        if limit is None:
+            limit = self.admission_limit()
+        now = self.schedule_timestamp()
+        script = self.r.register_script(ADMIT_LUA)
+        admitted = script(
+            keys=[self.SCHEDULED_KEY, self.READY_KEY, self.PRIORITIES_KEY, self.TASKED_KEY],
+            args=[now, limit, self.PRIORITY_SPAN, self.PRIORITY_STANDARD, self.MAX_MOVED, int(time.time())],
+            client=self.r,
+        )
+
+        return admitted
+
+    def task(self, feed_ids):
+        if not feed_ids:
+            return
+        now = int(time.time())
+        p = self.r.pipeline()
+        p.zrem(self.READY_KEY, *feed_ids)
+        p.zadd(self.TASKED_KEY, dict((feed_id, now) for feed_id in feed_ids))
+        p.execute()
+
+    def finish(self, feed_id, fetched=True):
+        p = self.r.pipeline()
+        if fetched:
+            p.zadd(self.FETCHED_KEY, {feed_id: int(time.time())})
+        p.zrem(self.TASKED_KEY, feed_id)
+        p.zrem(self.ERRORS_KEY, feed_id)
+        p.execute()
+
+    def untask(self, feed_id):
+        self.r.zrem(self.TASKED_KEY, feed_id)
+
+    def error_count(self, feed_id):
+        return int(self.r.zscore(self.ERRORS_KEY, feed_id) or 0)
+
+    def lost_tasks(self, seconds=10 * 60):
+        """Removes and returns feeds tasked longer ago than seconds, counting each as an error."""
+        cutoff = int(time.time()) - seconds
+        feed_ids = self.r.zrangebyscore(self.TASKED_KEY, 0, cutoff)
+        if feed_ids:
+            p = self.r.pipeline()
+            p.zremrangebyscore(self.TASKED_KEY, 0, cutoff)
+            for feed_id in feed_ids:
+                p.zincrby(self.ERRORS_KEY, 1, feed_id)
+            p.execute()
+
+        return feed_ids
+
+    def drain(self):
+        """Puts every tasked and errored feed back on the schedule, due now."""
+        feed_ids = set(self.r.zrange(self.TASKED_KEY, 0, -1)) | set(self.r.zrange(self.ERRORS_KEY, 0, -1))
+        if feed_ids:
+            now = self.schedule_timestamp()
+            p = self.r.pipeline()
+            p.zadd(self.SCHEDULED_KEY, dict((feed_id, now) for feed_id in feed_ids))
+            p.delete(self.TASKED_KEY)
+            p.delete(self.ERRORS_KEY)
+            p.execute()
+
+        return feed_ids
+
+    def migrate_legacy_queue(self):
+        """Moves feeds left in the old queued_feeds set onto the schedule, due now."""
+        feed_ids = self.r.smembers(self.LEGACY_QUEUED_KEY)
+        if feed_ids:
+            now = self.schedule_timestamp()
+            self.r.zadd(self.SCHEDULED_KEY, dict((feed_id, now) for feed_id in feed_ids))
+            self.r.delete(self.LEGACY_QUEUED_KEY)
+
+        return len(feed_ids)
+
+    def trim_fetched(self):
+        self.r.zremrangebyscore(self.FETCHED_KEY, 0, int(time.time()) - 60 * 60)
+
+    def queued(self, feed_ids):
+        """Which of these feeds are scheduled, ready, tasked, or errored."""
+        p = self.r.pipeline()
+        for feed_id in feed_ids:
+            p.zscore(self.SCHEDULED_KEY, feed_id)
+            p.zscore(self.READY_KEY, feed_id)
+            p.zscore(self.TASKED_KEY, feed_id)
+            p.zscore(self.ERRORS_KEY, feed_id)
+        results = p.execute()
+
+        return dict(
+            (feed_id, any(score is not None for score in results[i * 4 : i * 4 + 4]))
+            for i, feed_id in enumerate(feed_ids)
+        )
+
+    def metrics(self):
+        now = self.schedule_timestamp()
+        p = self.r.pipeline()
+        p.zcard(self.SCHEDULED_KEY)
+        p.zcount(self.SCHEDULED_KEY, "-inf", now)
+        p.zcard(self.READY_KEY)
+        p.zcard(self.TASKED_KEY)
+        p.zcard(self.ERRORS_KEY)
+        p.zcard(self.FETCHED_KEY)
+        p.zrange(self.SCHEDULED_KEY, 0, 0, withscores=True)
+        scheduled, due, ready, tasked, errors, fetched, oldest_scheduled = p.execute()
+
+        # Ready feeds' scores carry their priority, so the oldest due time is the
+        # smallest remainder within any priority band.
+        oldest_due = oldest_scheduled[0][1] if oldest_scheduled else now
+        for priority in range(self.PRIORITY_IMMEDIATE, self.PRIORITY_PUSH + 1):
+            band = self.r.zrangebyscore(
+                self.READY_KEY,
+                priority * self.PRIORITY_SPAN,
+                "(%s" % ((priority + 1) * self.PRIORITY_SPAN),
+                start=0,
+                num=1,
+                withscores=True,
+            )
+            if band:
+                oldest_due = min(oldest_due, band[0][1] - priority * self.PRIORITY_SPAN)
+
+        return {
+            "scheduled": scheduled,
+            "due": due,
+            "ready": ready,
+            "tasked": tasked,
+            "errors": errors,
+            "fetched_last_hour": fetched,
+            "lag_seconds": max(0, int(now - oldest_due)),
+            "admission_limit": self.admission_limit(),
+        }
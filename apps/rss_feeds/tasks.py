@@ -3,7 +3,6 @@ import os
 import shutil
 import time
 
-import redis
 from celery.exceptions import SoftTimeLimitExceeded
 from django.conf import settings
 
@@ -12,53 +11,37 @@ from newsblur_web.celeryapp import app
 from utils import log as logging
 from utils.redis_raw_log_middleware import RedisDumpMiddleware
 
-FEED_TASKING_MAX = 10000
-
-
 @app.task(name="task-feeds")
 def TaskFeeds():
     from apps.rss_feeds.models import Feed
+    from apps.rss_feeds.scheduler import FeedScheduler
 
     settings.LOG_TO_STREAM = True
-    now = datetime.datetime.utcnow()
     start = time.time()
-    r = redis.Redis(connection_pool=settings.REDIS_FEED_UPDATE_POOL)
-    tasked_feeds_size = r.zcard("tasked_feeds")
-
-    hour_ago = now - datetime.timedelta(hours=1)
-    r.zremrangebyscore("fetched_feeds_last_hour", 0, int(hour_ago.strftime("%s")))
+    scheduler = FeedScheduler()
 
-    now_timestamp = int(now.strftime("%s"))
-    queued_feeds = r.zrangebyscore("scheduled_updates", 0, now_timestamp)
-    r.zremrangebyscore("scheduled_updates", 0, now_timestamp)
-    if not queued_feeds:
-        logging.debug(" ---> ~SN~FB~BMNo feeds to queue! Exiting...")
-        return
-
-    r.sadd("queued_feeds", *queued_feeds)
-    logging.debug(
-        " ---> ~SN~FBQueuing ~SB%s~SN stale feeds (~SB%s~SN/~FG%s~FB~SN/%s tasked/queued/scheduled)"
-        % (len(queued_feeds), r.zcard("tasked_feeds"), r.scard("queued_feeds"), r.zcard("scheduled_updates"))
-    )
+    scheduler.trim_fetched()
+    migrated_count = scheduler.migrate_legacy_queue()
+    if migrated_count:
+        logging.debug(" ---> ~SN~FBMigrated ~SB%s~SN feeds from the old queued_feeds set" % migrated_count)
 
-    # Regular feeds
-    if tasked_feeds_size < FEED_TASKING_MAX:
-        feeds = r.srandmember("queued_feeds", FEED_TASKING_MAX)
+    # Due feeds move to the ready queue, and only as many as workers are keeping up
+    # with are admitted, highest priority and longest overdue first
+    feeds = scheduler.admit()
+    if feeds:
         Feed.task_feeds(feeds, verbose=True)
-        active_count = len(feeds)
-    else:
-        logging.debug(" ---> ~SN~FBToo many tasked feeds. ~SB%s~SN tasked." % tasked_feeds_size)
-        active_count = 0
-        feeds = []
 
+    metrics = scheduler.metrics()
     logging.debug(
-        " ---> ~SN~FBTasking %s feeds took ~SB%s~SN seconds (~SB%s~SN/~FG%s~FB~SN/%s tasked/queued/scheduled)"
+        " ---> ~SN~FBTasking ~SB%s~SN feeds took ~SB%s~SN seconds (~SB%s~SN/~FG%s~FB~SN/%s tasked/ready/scheduled, ~SB%s~SN fetched last hour, ~SB%s~SN seconds behind)"
         % (
-            active_count,
+            len(feeds),
             int((time.time() - start)),
-            r.zcard("tasked_feeds"),
-            r.scard("queued_feeds"),
-            r.zcard("scheduled_updates"),
+            metrics["tasked"],
+            metrics["ready"],
+            metrics["scheduled"],
+            metrics["fetched_last_hour"],
+            metrics["lag_seconds"],
         )
     )
     logging.debug(" ---> ~FBFeeds being tasked: ~SB%s" % feeds)
@@ -67,11 +50,12 @@ def TaskFeeds():
 @app.task(name="task-broken-feeds")
 def TaskBrokenFeeds():
     from apps.rss_feeds.models import Feed
+    from apps.rss_feeds.scheduler import FeedScheduler
 
     settings.LOG_TO_STREAM = True
     now = datetime.datetime.utcnow()
     start = time.time()
-    r = redis.Redis(connection_pool=settings.REDIS_FEED_UPDATE_POOL)
+    scheduler = FeedScheduler()
 
     logging.debug(" ---> ~SN~FBQueuing broken feeds...")
 
@@ -85,19 +69,16 @@ def TaskBrokenFeeds():
     logging.debug(" ---> ~SN~FBFound %s active, unfetched broken feeds" % refresh_count)
 
     # Mistakenly inactive feeds
-    hours_ago = (now - datetime.timedelta(minutes=10)).strftime("%s")
-    old_tasked_feeds = r.zrangebyscore("tasked_feeds", 0, hours_ago)
+    old_tasked_feeds = scheduler.lost_tasks(seconds=10 * 60)
     inactive_count = len(old_tasked_feeds)
-    if inactive_count:
-        r.zremrangebyscore("tasked_feeds", 0, hours_ago)
-        # r.sadd('queued_feeds', *old_tasked_feeds)
-        for feed_id in old_tasked_feeds:
-            r.zincrby("error_feeds", 1, feed_id)
-            feed = Feed.get_by_id(feed_id)
+    for feed_id in old_tasked_feeds:
+        feed = Feed.get_by_id(feed_id)
+        if feed:
             feed.set_next_scheduled_update()
+    metrics = scheduler.metrics()
     logging.debug(
-        " ---> ~SN~FBRe-queuing ~SB%s~SN dropped/broken feeds (~SB%s/%s~SN queued/tasked)"
-        % (inactive_count, r.scard("queued_feeds"), r.zcard("tasked_feeds"))
+        " ---> ~SN~FBRe-queuing ~SB%s~SN dropped/broken feeds (~SB%s/%s~SN ready/tasked)"
+        % (inactive_count, metrics["ready"], metrics["tasked"])
     )
     cp2 = time.time()
 
@@ -123,13 +104,14 @@ def TaskBrokenFeeds():
     Feed.task_feeds(refresh_feeds, verbose=False)
     Feed.task_feeds(old_feeds, verbose=False)
 
+    metrics = scheduler.metrics()
     logging.debug(
-        " ---> ~SN~FBTasking broken feeds took ~SB%s~SN seconds (~SB%s~SN/~FG%s~FB~SN/%s tasked/queued/scheduled)"
+        " ---> ~SN~FBTasking broken feeds took ~SB%s~SN seconds (~SB%s~SN/~FG%s~FB~SN/%s tasked/ready/scheduled)"
         % (
             int((time.time() - start)),
-            r.zcard("tasked_feeds"),
-            r.scard("queued_feeds"),
-            r.zcard("scheduled_updates"),
+            metrics["tasked"],
+            metrics["ready"],
+            metrics["scheduled"],
         )
     )
 
@@ -137,9 +119,10 @@ def TaskBrokenFeeds():
 @app.task(name="update-feeds", time_limit=10 * 60, soft_time_limit=9 * 60, ignore_result=True)
 def UpdateFeeds(feed_pks):
     from apps.rss_feeds.models import Feed
+    from apps.rss_feeds.scheduler import FeedScheduler
     from apps.statistics.models import MStatistics
 
-    r = redis.Redis(connection_pool=settings.REDIS_FEED_UPDATE_POOL)
+    scheduler = FeedScheduler()
 
     mongodb_replication_lag = int(MStatistics.get("mongodb_replication_lag", 0))
     compute_scores = bool(mongodb_replication_lag < 10)
@@ -161,6 +144,17 @@ def UpdateFeeds(feed_pks):
     if not isinstance(feed_pks, list):
         feed_pks = [feed_pks]
 
+    if getattr(settings, "UPDATE_FEEDS_ASYNC", False) and len(feed_pks) > 1:
+        try:
+            Feed.update_feeds(feed_pks, **options)
+        except SoftTimeLimitExceeded:
+            logging.info(
+                " ---> ~BR~FWTime limit hit!~SB~FR Unfinished feeds in %s were rescheduled." % feed_pks
+            )
+        if profiler_activated:
+            profiler.process_celery_finished()
+        return
+
     for feed_pk in feed_pks:
         feed = Feed.get_by_id(feed_pk)
         if not feed or feed.pk != int(feed_pk):
@@ -168,7 +162,7 @@ def UpdateFeeds(feed_pks):
                 " ---> ~FRRemoving feed_id %s from tasked_feeds queue, points to %s..."
                 % (feed_pk, feed and feed.pk)
             )
-            r.zrem("tasked_feeds", feed_pk)
+            scheduler.untask(feed_pk)
         if not feed:
             continue
         try:
@@ -2,7 +2,6 @@ import base64
 import datetime
 from urllib.parse import urlparse
 
-import redis
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
@@ -21,6 +20,7 @@ from apps.reader.models import UserSubscription
 
 # from django.db import IntegrityError
 from apps.rss_feeds.models import Feed, MFeedIcon, MFetchHistory, MStory, merge_feeds
+from apps.rss_feeds.scheduler import FeedScheduler
 from utils import feedfinder_forman as feedfinder
 from utils import json_functions as json
 from utils import log as logging
@@ -571,11 +571,12 @@ def status(request):
         else:
             feeds = Feed.objects.filter(pk__in=feed_ids, last_update__gte=hour_ago).order_by("-last_update")
 
-    r = redis.Redis(connection_pool=settings.REDIS_FEED_UPDATE_POOL)
+    metrics = FeedScheduler().metrics()
     queues = {
-        "tasked_feeds": r.zcard("tasked_feeds"),
-        "queued_feeds": r.scard("queued_feeds"),
-        "scheduled_updates": r.zcard("scheduled_updates"),
+        "tasked_feeds": metrics["tasked"],
+        "queued_feeds": metrics["ready"],
+        "scheduled_updates": metrics["scheduled"],
+        "lag_seconds": metrics["lag_seconds"],
     }
     return render(request, "rss_feeds/status.xhtml", {"feeds": feeds, "queues": queues})
 
@@ -28,11 +28,7 @@ class Command(BaseCommand):
         else:
             user = User.objects.get(username=options["user"])
 
-        subscriptions = UserSubscription.objects.filter(user=user)
-        print(" ---> Indexing %s feeds..." % subscriptions.count())
-
-        for sub in subscriptions:
-            try:
-                sub.feed.index_stories_for_search()
-            except Feed.DoesNotExist:
-                print(" ***> Couldn't find %s" % sub.feed_id)
+        feed_ids = list(UserSubscription.objects.filter(user=user).values_list("feed_id", flat=True))
+        print(" ---> Indexing %s feeds..." % len(feed_ids))
+
+        Feed.index_feeds_stories_for_search(feed_ids)
@@ -1,10 +1,12 @@
 import datetime
 import html
+import itertools
 import re
 import time
 
 import celery
 import elasticsearch
+import elasticsearch.helpers
 import mongoengine as mongo
 import pymongo
 import redis
@@ -21,6 +23,61 @@ from apps.search.tasks import (
 from utils import log as logging
 from utils.feed_functions import chunks
 
+# Documents per _bulk request, and how many times a request that can't reach the
+# search server, or documents it rejects as overloaded, are retried.
+BULK_CHUNK_SIZE = 500
+BULK_CHUNK_BYTES = 10 * 1024 * 1024
+BULK_RETRIES = 3
+
+
+def bulk_request(es, actions, op_type, ignore_status, description):
+    """
+    Streams an iterable of bulk actions to the search server in BULK_CHUNK_SIZE
+    batches, so a feed's or a user's whole history is never held in memory or sent
+    one document at a time. Documents rejected with a 429 are retried with backoff,
+    and a batch whose request fails to connect is resent whole. Errors with a status
+    in ignore_status (conflicts on create, missing documents on delete) don't count.
+
+    Returns the number of documents sent.
+    """
+    actions = iter(actions)
+    sent = 0
+    failed = 0
+    first_error = None
+
+    while True:
+        batch = list(itertools.islice(actions, BULK_CHUNK_SIZE))
+        if not batch:
+            break
+
+        for attempt in range(BULK_RETRIES + 1):
+            try:
+                _, errors = elasticsearch.helpers.bulk(
+                    es,
+                    batch,
+                    chunk_size=BULK_CHUNK_SIZE,
+                    max_chunk_bytes=BULK_CHUNK_BYTES,
+                    max_retries=BULK_RETRIES,
+                    raise_on_error=False,
+                )
+                break
+            except (elasticsearch.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
+                if attempt == BULK_RETRIES:
+                    logging.debug(f" ***> ~FRNo search server available for {description}: {e}")
+                    return sent
+                time.sleep(2**attempt)
+
+        sent += len(batch)
+        errors = [error for error in errors if error.get(op_type, {}).get("status") not in ignore_status]
+        if errors:
+            failed += len(errors)
+            first_error = first_error or errors[0]
+
+    if failed:
+        logging.debug(f" ***> ~FRCould not finish {description} of {failed}/{sent} documents: {first_error}")
+
+    return sent
+
 
 class MUserSearch(mongo.Document):
     """Search index state of a user's subscriptions."""
@@ -119,12 +176,7 @@ class MUserSearch(mongo.Document):
 
         logging.user(user, "~FCIndexing %s feeds..." % len(feed_ids))
 
-        for feed_id in feed_ids:
-            feed = Feed.get_by_id(feed_id)
-            if not feed:
-                continue
-
-            feed.index_stories_for_search()
+        Feed.index_feeds_stories_for_search(feed_ids)
 
         r.publish(user.username, "search_index_complete:feeds:%s" % ",".join([str(f) for f in feed_ids]))
 
@@ -149,12 +201,7 @@ class MUserSearch(mongo.Document):
 
         logging.user(user, "~SB~FCIndexing %s~FC by request..." % feed_ids)
 
-        for feed_id in feed_ids:
-            feed = Feed.get_by_id(feed_id)
-            if not feed:
-                continue
-
-            feed.index_stories_for_search()
+        Feed.index_feeds_stories_for_search(feed_ids)
 
     @classmethod
     def remove_all(cls, drop_index=False):
@@ -202,6 +249,7 @@ class MUserSearch(mongo.Document):
 
 class SearchStory:
     _es_client = None
+    _mapping_checked = False
     name = "stories"
 
     @classmethod
@@ -229,8 +277,13 @@ class SearchStory:
                 cls.ES().indices.delete(cls.index_name())
             except elasticsearch.exceptions.NotFoundError:
                 logging.debug(f" ---> ~FBCan't delete {cls.index_name()} index, doesn't exist...")
+            cls._mapping_checked = False
 
+        # Once the index is known to exist, this process doesn't ask the server again
+        if cls._mapping_checked:
+            return
         if cls.ES().indices.exists(cls.index_name()):
+            cls._mapping_checked = True
             return
 
         try:
@@ -283,6 +336,7 @@ class SearchStory:
             index=cls.index_name(),
         )
         cls.ES().indices.flush(cls.index_name())
+        cls._mapping_checked = True
 
     @classmethod
     def index(
@@ -307,6 +361,57 @@ class SearchStory:
         # if settings.DEBUG:
         #     logging.debug(f" ***> ~FBIndexed {story_hash}")
 
+    @classmethod
+    def bulk_index(cls, stories, op_type="create"):
+        """
+        Indexes an iterable of dicts with the same keyword arguments as index(), streamed
+        in batches. Creates skip stories already indexed, while an op_type of "index"
+        overwrites them with the story's latest version.
+        """
+        cls.create_elasticsearch_mapping()
+
+        def actions():
+            for story in stories:
+                action = {
+                    "_op_type": op_type,
+                    "_index": cls.index_name(),
+                    "_id": story["story_hash"],
+                    "_source": {
+                        "content": story["story_content"],
+                        "title": story["story_title"],
+                        "tags": ", ".join(story["story_tags"]),
+                        "author": story["story_author"],
+                        "feed_id": story["story_feed_id"],
+                        "date": story["story_date"],
+                    },
+                }
+                if cls.doc_type():
+                    action["_type"] = cls.doc_type()
+                yield action
+
+        # Conflicts are stories that were already indexed
+        return bulk_request(cls.ES(), actions(), op_type, [409], "story indexing")
+
+    @classmethod
+    def bulk_remove(cls, story_hashes):
+        """Deletes a list of story hashes from the index in batches, ignoring unindexed ones."""
+        if not story_hashes:
+            return
+
+        def actions():
+            for story_hash in story_hashes:
+                action = {
+                    "_op_type": "delete",
+                    "_index": cls.index_name(),
+                    "_id": story_hash,
+                }
+                if cls.doc_type():
+                    action["_type"] = cls.doc_type()
+                yield action
+
+        # Stories that were never indexed come back as not found
+        return bulk_request(cls.ES(), actions(), "delete", [404], "story deletion")
+
     @classmethod
     def remove(cls, story_hash):
         if not cls.ES().exists(index=cls.index_name(), id=story_hash, doc_type=cls.doc_type()):
@@ -321,6 +426,7 @@ class SearchStory:
 
     @classmethod
     def drop(cls):
+        cls._mapping_checked = False
         try:
             cls.ES().indices.delete(cls.index_name())
         except elasticsearch.exceptions.NotFoundError:
@@ -490,6 +596,7 @@ class SearchStory:
 
 class SearchFeed:
     _es_client = None
+    _mapping_checked = False
     name = "feeds"
 
     @classmethod
@@ -518,8 +625,13 @@ class SearchFeed:
                 cls.ES().indices.delete(cls.index_name())
             except elasticsearch.exceptions.NotFoundError:
                 logging.debug(f" ---> ~FBCan't delete {cls.index_name()} index, doesn't exist...")
+            cls._mapping_checked = False
 
+        # Once the index is known to exist, this process doesn't ask the server again
+        if cls._mapping_checked:
+            return
         if cls.ES().indices.exists(cls.index_name()):
+            cls._mapping_checked = True
             return
 
         index_settings = {
@@ -582,6 +694,7 @@ class SearchFeed:
             index=cls.index_name(),
         )
         cls.ES().indices.flush(cls.index_name())
+        cls._mapping_checked = True
 
     @classmethod
     def index(cls, feed_id, title, address, link, num_subscribers):
@@ -597,8 +710,35 @@ class SearchFeed:
         except (elasticsearch.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
             logging.debug(f" ***> ~FRNo search server available for feed indexing: {e}")
 
+    @classmethod
+    def bulk_index(cls, feeds):
+        """Indexes an iterable of dicts with the same keyword arguments as index(), streamed in batches."""
+        cls.create_elasticsearch_mapping()
+
+        def actions():
+            for feed in feeds:
+                action = {
+                    "_op_type": "create",
+                    "_index": cls.index_name(),
+                    "_id": feed["feed_id"],
+                    "_source": {
+                        "feed_id": feed["feed_id"],
+                        "title": feed["title"],
+                        "feed_address": feed["address"],
+                        "link": feed["link"],
+                        "num_subscribers": feed["num_subscribers"],
+                    },
+                }
+                if cls.doc_type():
+                    action["_type"] = cls.doc_type()
+                yield action
+
+        # Conflicts are feeds that were already indexed
+        return bulk_request(cls.ES(), actions(), "create", [409], "feed indexing")
+
     @classmethod
     def drop(cls):
+        cls._mapping_checked = False
         try:
             cls.ES().indices.delete(cls.index_name())
         except elasticsearch.exceptions.NotFoundError:
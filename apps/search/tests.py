@@ -5,7 +5,13 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
-from django.test import TestCase
+from unittest import mock
+
+import elasticsearch
+from django.test import SimpleTestCase, TestCase
+
+from apps.search import models as search_models
+from apps.search.models import BULK_CHUNK_SIZE, SearchStory, bulk_request
 
 
 class SimpleTest(TestCase):
@@ -14,3 +20,138 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+def create_actions(count):
+    return ({"_op_type": "create", "_index": "stories-index", "_id": "%s:abcdef" % i} for i in range(count))
+
+
+class Test_BulkRequest(SimpleTestCase):
+    def setUp(self):
+        self.batches = []
+
+        def fake_bulk(es, actions, **kwargs):
+            actions = list(actions)
+            self.batches.append(actions)
+            return len(actions), []
+
+        self.bulk = mock.patch.object(search_models.elasticsearch.helpers, "bulk", side_effect=fake_bulk)
+        self.bulk.start()
+        self.sleep = mock.patch.object(search_models.time, "sleep")
+        self.sleep.start()
+
+    def tearDown(self):
+        self.bulk.stop()
+        self.sleep.stop()
+
+    def test_batches_at_chunk_size(self):
+        sent = bulk_request(None, create_actions(BULK_CHUNK_SIZE * 2 + 1), "create", [409], "testing")
+
+        self.assertEqual(sent, BULK_CHUNK_SIZE * 2 + 1)
+        self.assertEqual([len(batch) for batch in self.batches], [BULK_CHUNK_SIZE, BULK_CHUNK_SIZE, 1])
+
+    def test_ignores_conflicts_on_create(self):
+        errors = [
+            {"create": {"_id": "1:abcdef", "status": 409}},
+            {"create": {"_id": "2:abcdef", "status": 400}},
+        ]
+        search_models.elasticsearch.helpers.bulk.side_effect = lambda es, actions, **kwargs: (0, errors)
+
+        with mock.patch.object(search_models.logging, "debug") as debug:
+            sent = bulk_request(None, create_actions(2), "create", [409], "testing")
+
+        self.assertEqual(sent, 2)
+        debug.assert_called_once()
+        self.assertIn("1/2", debug.call_args[0][0])
+        self.assertIn("2:abcdef", debug.call_args[0][0])
+
+    def test_ignores_missing_on_delete(self):
+        errors = [{"delete": {"_id": "1:abcdef", "status": 404}}]
+        search_models.elasticsearch.helpers.bulk.side_effect = lambda es, actions, **kwargs: (0, errors)
+
+        with mock.patch.object(search_models.logging, "debug") as debug:
+            bulk_request(None, create_actions(1), "delete", [404], "testing")
+
+        debug.assert_not_called()
+
+    def test_retries_whole_batch_after_connection_error(self):
+        attempts = []
+
+        def flaky_bulk(es, actions, **kwargs):
+            attempts.append(list(actions))
+            if len(attempts) == 1:
+                raise elasticsearch.exceptions.ConnectionError("N/A", "Connection refused", None)
+            return len(attempts[-1]), []
+
+        search_models.elasticsearch.helpers.bulk.side_effect = flaky_bulk
+
+        sent = bulk_request(None, create_actions(3), "create", [409], "testing")
+
+        self.assertEqual(sent, 3)
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(attempts[0], attempts[1])
+
+    def test_gives_up_after_retries(self):
+        search_models.elasticsearch.helpers.bulk.side_effect = elasticsearch.exceptions.ConnectionError(
+            "N/A", "Connection refused", None
+        )
+
+        sent = bulk_request(None, create_actions(3), "create", [409], "testing")
+
+        self.assertEqual(sent, 0)
+        self.assertEqual(search_models.elasticsearch.helpers.bulk.call_count, search_models.BULK_RETRIES + 1)
+
+
+class Test_SearchStoryMapping(SimpleTestCase):
+    def setUp(self):
+        SearchStory._mapping_checked = False
+        self.es = mock.Mock()
+        self.es.indices.exists.return_value = True
+        self.ES = mock.patch.object(SearchStory, "ES", return_value=self.es)
+        self.ES.start()
+
+    def tearDown(self):
+        self.ES.stop()
+        SearchStory._mapping_checked = False
+
+    def test_mapping_checked_once_per_process(self):
+        SearchStory.create_elasticsearch_mapping()
+        SearchStory.create_elasticsearch_mapping()
+
+        self.assertEqual(self.es.indices.exists.call_count, 1)
+        self.assertTrue(SearchStory._mapping_checked)
+
+    def test_drop_forgets_mapping(self):
+        SearchStory.create_elasticsearch_mapping()
+        SearchStory.drop()
+        SearchStory.create_elasticsearch_mapping()
+
+        self.assertEqual(self.es.indices.exists.call_count, 2)
+
+    def test_bulk_index_streams_stories(self):
+        stories = [
+            dict(
+                story_hash="%s:abcdef" % i,
+                story_title="Title",
+                story_content="Content",
+                story_tags=["tag"],
+                story_author="Author",
+                story_feed_id=1,
+                story_date=None,
+            )
+            for i in range(BULK_CHUNK_SIZE + 1)
+        ]
+        batches = []
+
+        def fake_bulk(es, actions, **kwargs):
+            batches.append(list(actions))
+            return len(batches[-1]), []
+
+        with mock.patch.object(search_models.elasticsearch.helpers, "bulk", side_effect=fake_bulk):
+            sent = SearchStory.bulk_index(iter(stories))
+
+        self.assertEqual(sent, BULK_CHUNK_SIZE + 1)
+        self.assertEqual([len(batch) for batch in batches], [BULK_CHUNK_SIZE, 1])
+        self.assertEqual(batches[0][0]["_op_type"], "create")
+        self.assertEqual(batches[0][0]["_source"]["tags"], "tag")
+        self.assertEqual(self.es.indices.exists.call_count, 1)
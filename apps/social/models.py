@@ -27,14 +27,11 @@ from django.utils.encoding import smart_bytes, smart_str
 from mongoengine.queryset import Q
 
 from apps.analyzer.models import (
+    ClassifierMatcher,
     MClassifierAuthor,
     MClassifierFeed,
     MClassifierTag,
     MClassifierTitle,
-    apply_classifier_authors,
-    apply_classifier_feeds,
-    apply_classifier_tags,
-    apply_classifier_titles,
 )
 from apps.profile.models import MSentEmail, Profile
 from apps.reader.models import RUserStory, UserSubscription
@@ -1533,42 +1530,11 @@ class MSocialSubscription(mongo.Document):
                 oldest_unread_story_date = story.shared_date
         stories = Feed.format_stories(unread_stories_db)
 
-        classifier_feeds = list(
-            MClassifierFeed.objects(user_id=self.user_id, social_user_id=self.subscription_user_id)
-        )
-        classifier_authors = list(
-            MClassifierAuthor.objects(user_id=self.user_id, social_user_id=self.subscription_user_id)
-        )
-        classifier_titles = list(
-            MClassifierTitle.objects(user_id=self.user_id, social_user_id=self.subscription_user_id)
-        )
-        classifier_tags = list(
-            MClassifierTag.objects(user_id=self.user_id, social_user_id=self.subscription_user_id)
-        )
-        # Merge with feed specific classifiers
-        if story_feed_ids:
-            classifier_feeds = classifier_feeds + list(
-                MClassifierFeed.objects(user_id=self.user_id, feed_id__in=story_feed_ids)
-            )
-            classifier_authors = classifier_authors + list(
-                MClassifierAuthor.objects(user_id=self.user_id, feed_id__in=story_feed_ids)
-            )
-            classifier_titles = classifier_titles + list(
-                MClassifierTitle.objects(user_id=self.user_id, feed_id__in=story_feed_ids)
-            )
-            classifier_tags = classifier_tags + list(
-                MClassifierTag.objects(user_id=self.user_id, feed_id__in=story_feed_ids)
-            )
+        # Feed classifiers trained in this blurblog or on the story's own feed
+        classifiers = ClassifierMatcher.for_user(self.user_id)
 
         for story in stories:
-            scores = {
-                "feed": apply_classifier_feeds(
-                    classifier_feeds, story["story_feed_id"], social_user_ids=self.subscription_user_id
-                ),
-                "author": apply_classifier_authors(classifier_authors, story),
-                "tags": apply_classifier_tags(classifier_tags, story),
-                "title": apply_classifier_titles(classifier_titles, story),
-            }
+            scores = classifiers.intelligence(self.user_id, story, social_user_ids=self.subscription_user_id)
 
             max_score = max(scores["author"], scores["tags"], scores["title"])
             min_score = min(scores["author"], scores["tags"], scores["title"])
@@ -262,11 +262,29 @@ DAYS_OF_STORY_HASHES_ARCHIVE = DAYS_OF_UNREAD_ARCHIVE
 # is no longer considered an active subscriber
 SUBSCRIBER_EXPIRE = 7
 
+# INCREMENTAL_UNREAD_COUNTS adjusts subscribers' unread counts as stories arrive and
+# are read, instead of flagging every subscription for a full recount. A periodic
+# repair job still recounts each subscription every UNREAD_COUNTS_REPAIR_HOURS.
+INCREMENTAL_UNREAD_COUNTS = False
+UNREAD_COUNTS_REPAIR_HOURS = 6
+
 # PRO_MINUTES_BETWEEN_FETCHES sets the number of minutes to fetch feeds for
 # Premium Pro accounts. Defaults to every 5 minutes, but that's for NewsBlur
 # servers. On your local, you should probably set this to 10-15 minutes
 PRO_MINUTES_BETWEEN_FETCHES = 5
 
+# FEED_TASK_BATCH_SIZE caps the feeds fetched by a single update-feeds task, and
+# FEED_TASK_BATCH_SECONDS caps their combined expected fetch time (from each
+# feed's last_load_time). Feeds from the same host are kept together in a batch.
+FEED_TASK_BATCH_SIZE = 12
+FEED_TASK_BATCH_SECONDS = 60
+
+# With UPDATE_FEEDS_ASYNC, each update-feeds task downloads its whole batch
+# concurrently (up to UPDATE_FEEDS_ASYNC_CONCURRENCY at once) and parses feeds
+# as they arrive, instead of fetching them one after another.
+UPDATE_FEEDS_ASYNC = False
+UPDATE_FEEDS_ASYNC_CONCURRENCY = 50
+
 ROOT_URLCONF = "newsblur_web.urls"
 INTERNAL_IPS = ("127.0.0.1",)
 LOGGING_LOG_SQL = True
@@ -422,6 +440,11 @@ CELERY_BEAT_SCHEDULE = {
         "schedule": datetime.timedelta(hours=1),
         "options": {"queue": "cron_queue"},
     },
+    "repair-unread-counts": {
+        "task": "repair-unread-counts",
+        "schedule": datetime.timedelta(hours=1),
+        "options": {"queue": "cron_queue"},
+    },
     "collect-stats": {
         "task": "collect-stats",
         "schedule": datetime.timedelta(minutes=1),
@@ -0,0 +1,130 @@
+import asyncio
+import concurrent.futures
+import queue
+import threading
+import time
+
+import aiohttp
+
+from utils import log as logging
+
+# Downloads kept in flight at once by a single fetcher process.
+ASYNC_FETCH_CONCURRENCY = 200
+ASYNC_FETCH_TIMEOUT = 15
+
+
+class AsyncFeedFetcher:
+    """
+    Downloads feeds concurrently on an asyncio event loop running in a background
+    thread, so the worker can keep parsing and storing the feeds that have already
+    arrived (which touches Django and Mongo and stays on the calling thread) while
+    the rest of the downloads are still in flight.
+
+    Requests are dicts of feed_id, address, and headers. Every request yields
+    exactly one result dict, in completion order:
+
+        feed_id, address, url, status, headers (lowercased), content, error, duration
+
+    With max_buffered, at most that many finished downloads wait for the consumer;
+    once the buffer is full, downloads stall until the consumer catches up.
+    """
+
+    def __init__(self, concurrency=None, timeout=None, max_buffered=0):
+        self.concurrency = concurrency or ASYNC_FETCH_CONCURRENCY
+        self.timeout = timeout or ASYNC_FETCH_TIMEOUT
+        self.max_buffered = max_buffered or 0
+        self.results = queue.Queue(maxsize=self.max_buffered)
+        self.pending = 0
+        self.thread = None
+
+    def start(self, fetch_requests):
+        self.pending = len(fetch_requests)
+        if not fetch_requests:
+            return
+
+        self.thread = threading.Thread(target=self._run, args=(fetch_requests,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def completed(self):
+        while self.pending:
+            result = self.results.get()
+            self.pending -= 1
+            yield result
+
+        if self.thread:
+            self.thread.join()
+
+    def fetch(self, fetch_requests):
+        self.start(fetch_requests)
+        return self.completed()
+
+    def _run(self, fetch_requests):
+        unfinished = dict((id(request), request) for request in fetch_requests)
+        try:
+            asyncio.run(self._fetch_all(fetch_requests, unfinished))
+        except Exception as e:
+            logging.debug(" ***> ~FRAsync fetcher failed, %s feeds left unfetched: %s" % (len(unfinished), e))
+        finally:
+            # Never leave the consumer waiting on a download that will not come back
+            for request in list(unfinished.values()):
+                self.results.put(self._result(request, error="Async fetcher stopped"))
+
+    async def _fetch_all(self, fetch_requests, unfinished):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+        # A single thread blocks on a full results buffer, keeping the loop's
+        # default executor free for DNS lookups.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as handoff_executor:
+            async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+                await asyncio.gather(
+                    *[
+                        self._fetch_one(session, semaphore, request, unfinished, handoff_executor)
+                        for request in fetch_requests
+                    ]
+                )
+
+    async def _fetch_one(self, session, semaphore, request, unfinished, handoff_executor):
+        start = time.time()
+        async with semaphore:
+            try:
+                async with session.get(request["address"], headers=request["headers"]) as response:
+                    content = await response.read()
+                    status = response.status
+                    # Mirror feedparser, which reports a permanent redirect anywhere in
+                    # the chain so the feed address can be updated.
+                    for redirect in response.history:
+                        if redirect.status in (301, 308):
+                            status = redirect.status
+                            break
+                    result = self._result(
+                        request,
+                        url=str(response.url),
+                        status=status,
+                        headers=dict((k.lower(), v) for k, v in response.headers.items()),
+                        content=content,
+                        duration=time.time() - start,
+                    )
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, UnicodeError) as e:
+                result = self._result(request, error=repr(e), duration=time.time() - start)
+
+            # The download slot is held until the body is handed off, so a full
+            # results buffer stalls new downloads instead of piling bodies up here.
+            if self.max_buffered:
+                await asyncio.get_running_loop().run_in_executor(handoff_executor, self.results.put, result)
+            else:
+                self.results.put(result)
+        unfinished.pop(id(request), None)
+
+    def _result(self, request, url=None, status=None, headers=None, content=None, error=None, duration=0):
+        return {
+            "feed_id": request["feed_id"],
+            "address": request["address"],
+            "url": url or request["address"],
+            "status": status,
+            "headers": headers or {},
+            "content": content,
+            "error": error,
+            "duration": duration,
+        }
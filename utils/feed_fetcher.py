@@ -1,5 +1,6 @@
 import datetime
 import multiprocessing
+import queue
 import time
 import traceback
 
@@ -24,16 +25,16 @@ import pymongo
 import redis
 import requests
 from django.conf import settings
-from django.core.cache import cache
 from django.db import IntegrityError
 from sentry_sdk import set_user
 
+from apps.analyzer.models import ClassifierMatcher
 from apps.notifications.models import MUserFeedNotification
 from apps.notifications.tasks import QueueNotifications
 from apps.push.models import PushSubscription
 from apps.reader.models import UserSubscription
 from apps.rss_feeds.icon_importer import IconImporter
-from apps.rss_feeds.models import Feed, MStory
+from apps.rss_feeds.models import Feed, FeedIdentityMap, MStory
 from apps.rss_feeds.page_importer import PageImporter
 from apps.statistics.models import MAnalyticsFetcher, MStatistics
 
@@ -51,8 +52,15 @@ from sentry_sdk import capture_exception, flush
 
 from utils import json_functions as json
 from utils import log as logging
+from utils.async_fetcher import AsyncFeedFetcher
 from utils.facebook_fetcher import FacebookFetcher
-from utils.feed_functions import TimeoutError, strip_underscore_from_feed_address, timelimit
+from utils.feed_functions import (
+    TimeoutError,
+    check_deadline,
+    strip_underscore_from_feed_address,
+    timelimit,
+)
+from utils.host_sessions import HostSessions
 from utils.json_fetcher import JSONFetcher
 from utils.story_functions import linkify, pre_process_story, strip_tags
 from utils.twitter_fetcher import TwitterFetcher
@@ -70,9 +78,10 @@ NO_UNDERSCORE_ADDRESSES = ["jwz"]
 
 
 class FetchFeed:
-    def __init__(self, feed_id, options):
+    def __init__(self, feed_id, options, prefetched=None):
         self.feed = Feed.get_by_id(feed_id)
         self.options = options
+        self.prefetched = prefetched
         self.fpf = None
         self.raw_feed = None
 
@@ -99,27 +108,12 @@ class FetchFeed:
             )
         logging.debug(log_msg)
 
-        etag = self.feed.etag
-        modified = self.feed.last_modified.utctimetuple()[:7] if self.feed.last_modified else None
-        address = self.feed.feed_address
+        if self.prefetched:
+            self.fpf = self.parse_prefetched()
+            if self.fpf:
+                return FEED_OK, self.fpf
 
-        if self.options.get("force") or self.options.get("archive_page", None) or random.random() <= 0.01:
-            self.options["force"] = True
-            modified = None
-            etag = None
-            if self.options.get("archive_page", None) == "rfc5005" and self.options.get(
-                "archive_page_link", None
-            ):
-                address = self.options["archive_page_link"]
-            elif self.options.get("archive_page", None):
-                address = qurl(address, add={self.options["archive_page_key"]: self.options["archive_page"]})
-            # Don't use the underscore cache buster: https://forum.newsblur.com/t/jwz-feed-broken-hes-mad-about-url-parameters/10742/15
-            # elif address.startswith("http") and not any(item in address for item in NO_UNDERSCORE_ADDRESSES):
-            #     address = qurl(address, add={"_": random.randint(0, 10000)})
-            logging.debug("   ---> [%-30s] ~FBForcing fetch: %s" % (self.feed.log_title[:30], address))
-        elif not self.feed.fetched_once or not self.feed.known_good:
-            modified = None
-            etag = None
+        address, etag, modified = self.conditional_fetch_params()
 
         if self.options.get("feed_xml"):
             logging.debug(
@@ -161,43 +155,9 @@ class FetchFeed:
 
         if not self.fpf and "json" in address:
             try:
-                headers = self.feed.fetch_headers()
-                if etag:
-                    headers["If-None-Match"] = etag
-                if modified:
-                    # format into an RFC 1123-compliant timestamp. We can't use
-                    # time.strftime() since the %a and %b directives can be affected
-                    # by the current locale, but RFC 2616 states that dates must be
-                    # in English.
-                    short_weekdays = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-                    months = [
-                        "Jan",
-                        "Feb",
-                        "Mar",
-                        "Apr",
-                        "May",
-                        "Jun",
-                        "Jul",
-                        "Aug",
-                        "Sep",
-                        "Oct",
-                        "Nov",
-                        "Dec",
-                    ]
-                    modified_header = "%s, %02d %s %04d %02d:%02d:%02d GMT" % (
-                        short_weekdays[modified[6]],
-                        modified[2],
-                        months[modified[1] - 1],
-                        modified[0],
-                        modified[3],
-                        modified[4],
-                        modified[5],
-                    )
-                    headers["If-Modified-Since"] = modified_header
-                if etag or modified:
-                    headers["A-IM"] = "feed"
+                headers = self.conditional_headers(self.feed.fetch_headers(), etag, modified)
                 try:
-                    raw_feed = requests.get(address, headers=headers, timeout=15)
+                    raw_feed = HostSessions.get(address, headers=headers, timeout=15)
                 except (requests.adapters.ConnectionError, TimeoutError):
                     raw_feed = None
                 if not raw_feed or raw_feed.status_code >= 400:
@@ -211,7 +171,7 @@ class FetchFeed:
                             "   ***> [%-30s] ~FRJson feed fetch timed out, trying fake headers: %s"
                             % (self.feed.log_title[:30], address)
                         )
-                    raw_feed = requests.get(
+                    raw_feed = HostSessions.get(
                         self.feed.feed_address,
                         headers=self.feed.fetch_headers(fake=True),
                         timeout=15,
@@ -252,6 +212,9 @@ class FetchFeed:
                 )
                 # raise e
 
+        if not self.fpf and not self.options.get("force_fp", False):
+            self.fpf = self.fetch_address(address, etag, modified)
+
         if not self.fpf or self.options.get("force_fp", False):
             try:
                 self.fpf = feedparser.parse(address, agent=self.feed.user_agent, etag=etag, modified=modified)
@@ -298,6 +261,198 @@ class FetchFeed:
 
         return FEED_OK, self.fpf
 
+    def conditional_fetch_params(self):
+        """
+        Returns the (address, etag, modified) to fetch, dropping the conditional
+        GET headers when the fetch is forced or the feed isn't known to be good.
+        """
+        etag = self.feed.etag
+        modified = self.feed.last_modified.utctimetuple()[:7] if self.feed.last_modified else None
+        address = self.feed.feed_address
+
+        if self.options.get("force") or self.options.get("archive_page", None) or random.random() <= 0.01:
+            self.options["force"] = True
+            modified = None
+            etag = None
+            if self.options.get("archive_page", None) == "rfc5005" and self.options.get(
+                "archive_page_link", None
+            ):
+                address = self.options["archive_page_link"]
+            elif self.options.get("archive_page", None):
+                address = qurl(address, add={self.options["archive_page_key"]: self.options["archive_page"]})
+            # Don't use the underscore cache buster: https://forum.newsblur.com/t/jwz-feed-broken-hes-mad-about-url-parameters/10742/15
+            # elif address.startswith("http") and not any(item in address for item in NO_UNDERSCORE_ADDRESSES):
+            #     address = qurl(address, add={"_": random.randint(0, 10000)})
+            logging.debug("   ---> [%-30s] ~FBForcing fetch: %s" % (self.feed.log_title[:30], address))
+        elif not self.feed.fetched_once or not self.feed.known_good:
+            modified = None
+            etag = None
+
+        return address, etag, modified
+
+    @classmethod
+    def conditional_headers(cls, headers, etag=None, modified=None):
+        if etag:
+            headers["If-None-Match"] = etag
+        if modified:
+            # format into an RFC 1123-compliant timestamp. We can't use
+            # time.strftime() since the %a and %b directives can be affected
+            # by the current locale, but RFC 2616 states that dates must be
+            # in English.
+            short_weekdays = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+            months = [
+                "Jan",
+                "Feb",
+                "Mar",
+                "Apr",
+                "May",
+                "Jun",
+                "Jul",
+                "Aug",
+                "Sep",
+                "Oct",
+                "Nov",
+                "Dec",
+            ]
+            modified_header = "%s, %02d %s %04d %02d:%02d:%02d GMT" % (
+                short_weekdays[modified[6]],
+                modified[2],
+                months[modified[1] - 1],
+                modified[0],
+                modified[3],
+                modified[4],
+                modified[5],
+            )
+            headers["If-Modified-Since"] = modified_header
+        if etag or modified:
+            headers["A-IM"] = "feed"
+
+        return headers
+
+    def async_fetch_request(self, feed_id):
+        """
+        Returns the request AsyncFeedFetcher should download for this feed, or None
+        if the feed needs one of the special fetchers (YouTube, Twitter, Facebook,
+        JSON Feed, archive pages, fat pings), which stay on the synchronous path.
+        """
+        if not self.feed:
+            return
+        if self.options.get("fpf") or self.options.get("archive_page", None) or self.options.get("force_fp"):
+            return
+
+        address, etag, modified = self.conditional_fetch_params()
+        if not address or not address.startswith("http"):
+            return
+        if "youtube.com" in address or "json" in address:
+            return
+        if re.match(r"(https?)?://twitter.com/\w+/?", qurl(address, remove=["_"])):
+            return
+        if re.match(r"(.*?)facebook.com/\w+/?$", qurl(address, remove=["_"])):
+            return
+
+        return {
+            "feed_id": feed_id,
+            "address": address,
+            "headers": self.conditional_headers(self.feed.fetch_headers(), etag, modified),
+        }
+
+    def parse_prefetched(self):
+        """
+        Turns a response downloaded by AsyncFeedFetcher into a feedparser result that
+        looks like what `feedparser.parse(address)` would have returned. Returns None
+        when the download failed so the caller falls back to a synchronous fetch.
+        """
+        result = self.prefetched
+        if result["error"] or not result["status"] or result["status"] >= 400:
+            logging.debug(
+                "   ***> [%-30s] ~FRAsync fetch failed (%s), fetching synchronously: %s"
+                % (self.feed.log_title[:30], result["status"] or result["error"], result["address"])
+            )
+            return
+
+        try:
+            fpf = self.parse_response(result)
+        except Exception as e:
+            logging.debug(
+                "   ***> [%-30s] ~FRAsync fetch failed to parse, fetching synchronously: %s"
+                % (self.feed.log_title[:30], e)
+            )
+            return
+
+        logging.debug(
+            "   ---> [%-30s] ~FYFeed fetched asynchronously (~SB%s~SN) in ~FM%.4ss"
+            % (self.feed.log_title[:30], result["status"], result["duration"])
+        )
+
+        return fpf
+
+    def fetch_address(self, address, etag=None, modified=None):
+        """
+        Downloads the feed through the shared per-host sessions, reusing a kept-alive
+        connection to its host. Returns None on a connection error so the caller
+        falls back to letting feedparser fetch it.
+        """
+        if not address or not address.startswith("http"):
+            return
+
+        start = time.time()
+        headers = self.conditional_headers(self.feed.fetch_headers(), etag, modified)
+        try:
+            response = HostSessions.get(address, headers=headers, timeout=15)
+        except (requests.exceptions.RequestException, ValueError, UnicodeError) as e:
+            logging.debug("   ***> [%-30s] ~FRSession fetch failed: %s" % (self.feed.log_title[:30], e))
+            return
+
+        status = response.status_code
+        # Mirror feedparser, which reports a permanent redirect anywhere in the chain
+        # so the feed address can be updated.
+        for redirect in response.history:
+            if redirect.status_code in (301, 308):
+                status = redirect.status_code
+                break
+
+        try:
+            return self.parse_response(
+                {
+                    "url": response.url,
+                    "status": status,
+                    "headers": dict((k.lower(), v) for k, v in response.headers.items()),
+                    "content": response.content,
+                    "duration": time.time() - start,
+                }
+            )
+        except Exception as e:
+            logging.debug(
+                "   ***> [%-30s] ~FRSession fetch failed to parse: %s" % (self.feed.log_title[:30], e)
+            )
+            return
+
+    def parse_response(self, result):
+        response_headers = result["headers"]
+        response_headers["content-location"] = result["url"]
+        if result["status"] == 304 or result["status"] >= 400:
+            fpf = feedparser.FeedParserDict(entries=[], feed=feedparser.FeedParserDict(), bozo=0)
+        else:
+            # Feedparser detects the charset from the bytes and headers, as it does when it fetches
+            fpf = feedparser.parse(result["content"], response_headers=response_headers)
+            self.raw_feed = self.decode_raw_feed(result["content"], fpf.get("encoding"))
+        fpf["status"] = result["status"]
+        fpf["href"] = result["url"]
+        fpf["headers"] = response_headers
+        if response_headers.get("etag"):
+            fpf["etag"] = response_headers["etag"]
+        if response_headers.get("last-modified"):
+            fpf["modified"] = response_headers["last-modified"]
+
+        return fpf
+
+    @staticmethod
+    def decode_raw_feed(content, encoding=None):
+        try:
+            return content.decode(encoding or "utf-8", "replace")
+        except LookupError:
+            return content.decode("utf-8", "replace")
+
     def get_identity(self):
         identity = "X"
 
@@ -718,7 +873,7 @@ class FeedFetcherWorker:
         self.time_start = datetime.datetime.utcnow()
 
     def refresh_feed(self, feed_id):
-        """Update feed, since it may have changed"""
+        """Update feed, since it may have changed. Within a fetch this is the shared instance."""
         return Feed.get_by_id(feed_id)
 
     def reset_database_connections(self):
@@ -740,16 +895,14 @@ class FeedFetcherWorker:
             )
 
     def process_feed_wrapper(self, feed_queue):
+        with FeedIdentityMap():
+            return self.process_feed_queue(feed_queue)
+
+    def process_feed_queue(self, feed_queue):
         self.reset_database_connections()
 
-        delta = None
-        current_process = multiprocessing.current_process()
-        identity = "X"
         feed = None
 
-        if current_process._identity:
-            identity = current_process._identity[0]
-
         # If fetching archive pages, come back once the archive scaffolding is built
         if self.options.get("archive_page", None):
             for feed_id in feed_queue:
@@ -767,7 +920,54 @@ class FeedFetcherWorker:
                 return feed
             return
 
-        for feed_id in feed_queue:
+        if self.options.get("async_fetch"):
+            feed_fetches = self.fetch_feeds_async(feed_queue)
+        else:
+            feed_fetches = [(feed_id, None) for feed_id in feed_queue]
+
+        feed = self.process_feeds(feed_fetches)
+
+        if len(feed_queue) == 1:
+            return feed
+
+        # time_taken = datetime.datetime.utcnow() - self.time_start
+
+    def process_handoff_queue(self, handoff_queue, stats_queue):
+        """Pipeline stage two: parses and stores feeds handed off by FeedPipeline."""
+        self.reset_database_connections()
+        stats = {"processed": 0, "idle": 0.0, "queue_latency": 0.0}
+        start = time.time()
+
+        def handoffs():
+            while True:
+                wait_start = time.time()
+                handoff = handoff_queue.get()
+                stats["idle"] += time.time() - wait_start
+                if handoff is None:
+                    break
+                feed_id, prefetched, queued_at = handoff
+                stats["queue_latency"] += time.time() - queued_at
+                stats["processed"] += 1
+                yield feed_id, prefetched
+
+        try:
+            with FeedIdentityMap():
+                self.process_feeds(handoffs())
+        finally:
+            stats["busy"] = time.time() - start - stats["idle"]
+            stats["feed_stats"] = dict(self.feed_stats)
+            stats_queue.put(stats)
+
+    def process_feeds(self, feed_fetches):
+        delta = None
+        current_process = multiprocessing.current_process()
+        identity = "X"
+        feed = None
+
+        if current_process._identity:
+            identity = current_process._identity[0]
+
+        for feed_id, prefetched in feed_fetches:
             start_duration = time.time()
             feed_fetch_duration = None
             feed_process_duration = None
@@ -779,6 +979,8 @@ class FeedFetcherWorker:
             ret_feed = FEED_ERREXC
 
             set_user({"id": feed_id})
+            # Each feed starts from a fresh row, then shares it for the rest of its fetch
+            FeedIdentityMap.clear()
             try:
                 feed = self.refresh_feed(feed_id)
                 set_user({"id": feed_id, "username": feed.feed_title})
@@ -814,10 +1016,12 @@ class FeedFetcherWorker:
                     )
                     continue
 
-                ffeed = FetchFeed(feed_id, self.options)
+                ffeed = FetchFeed(feed_id, self.options, prefetched=prefetched)
                 ret_feed, fetched_feed = ffeed.fetch()
 
                 feed_fetch_duration = time.time() - start_duration
+                if prefetched:
+                    feed_fetch_duration += prefetched["duration"]
                 raw_feed = ffeed.raw_feed
 
                 if fetched_feed and (ret_feed == FEED_OK or self.options["force"]):
@@ -843,7 +1047,9 @@ class FeedFetcherWorker:
                                 % (feed.log_title[:30], time.time() - start_cleanup)
                             )
                         try:
-                            self.count_unreads_for_subscribers(feed)
+                            self.count_unreads_for_subscribers(
+                                feed, new_story_hashes=ret_entries and ret_entries.get("new_story_hashes")
+                            )
                         except TimeoutError:
                             logging.debug(
                                 "   ---> [%-30s] Unread count took too long..." % (feed.log_title[:30],)
@@ -880,6 +1086,7 @@ class FeedFetcherWorker:
                 logging.error(tb)
                 logging.debug("[%d] ! -------------------------" % (feed_id,))
                 ret_feed = FEED_ERREXC
+                FeedIdentityMap.evict(getattr(feed, "pk", feed_id))
                 feed = Feed.get_by_id(getattr(feed, "pk", feed_id))
                 if not feed:
                     continue
@@ -1025,10 +1232,43 @@ class FeedFetcherWorker:
 
             self.feed_stats[ret_feed] += 1
 
-        if len(feed_queue) == 1:
-            return feed
+        return feed
 
-        # time_taken = datetime.datetime.utcnow() - self.time_start
+    def fetch_feeds_async(self, feed_queue):
+        """
+        Starts downloading every plain RSS/Atom feed in the queue at once and yields
+        (feed_id, prefetched) as each download completes, so ProcessFeed works through
+        finished bodies while the rest are still on the network. Feeds that need a
+        special fetcher are yielded first with no prefetch and fetched synchronously.
+        """
+        fetch_requests = []
+        sync_feed_ids = []
+        for feed_id in feed_queue:
+            try:
+                request = FetchFeed(feed_id, dict(self.options)).async_fetch_request(feed_id)
+            except Exception as e:
+                logging.debug("   ***> [%-30s] ~FRCouldn't build async fetch: %s" % (str(feed_id)[:30], e))
+                request = None
+            if request:
+                fetch_requests.append(request)
+            else:
+                sync_feed_ids.append(feed_id)
+
+        fetcher = AsyncFeedFetcher(
+            concurrency=self.options.get("async_concurrency"),
+            timeout=self.options.get("async_timeout"),
+            max_buffered=self.options.get("async_buffer"),
+        )
+        fetcher.start(fetch_requests)
+        logging.debug(
+            " ---> ~FBFetching ~SB%s~SN feeds asynchronously, ~SB%s~SN synchronously"
+            % (len(fetch_requests), len(sync_feed_ids))
+        )
+
+        for feed_id in sync_feed_ids:
+            yield feed_id, None
+        for result in fetcher.completed():
+            yield result["feed_id"], result
 
     def fetch_and_process_archive_pages(self, feed_id):
         feed = Feed.get_by_id(feed_id)
@@ -1193,7 +1433,7 @@ class FeedFetcherWorker:
         except redis.ConnectionError:
             logging.debug("   ***> [%-30s] ~BMRedis is unavailable for real-time." % (feed.log_title[:30],))
 
-    def count_unreads_for_subscribers(self, feed):
+    def count_unreads_for_subscribers(self, feed, new_story_hashes=None):
         subscriber_expire = datetime.datetime.now() - datetime.timedelta(days=settings.SUBSCRIBER_EXPIRE)
 
         user_subs = UserSubscription.objects.filter(
@@ -1203,6 +1443,12 @@ class FeedFetcherWorker:
         if not user_subs.count():
             return
 
+        if settings.INCREMENTAL_UNREAD_COUNTS and new_story_hashes and not self.options["force"]:
+            UserSubscription.count_new_unread_stories(
+                feed, user_subs.select_related("user__profile"), new_story_hashes
+            )
+            return
+
         for sub in user_subs:
             if not sub.needs_unread_recalc:
                 sub.needs_unread_recalc = True
@@ -1210,30 +1456,21 @@ class FeedFetcherWorker:
 
         if self.options["compute_scores"]:
             r = redis.Redis(connection_pool=settings.REDIS_STORY_HASH_POOL)
-            stories = MStory.objects(story_feed_id=feed.pk, story_date__gte=feed.unread_cutoff)
-            stories = Feed.format_stories(stories, feed.pk)
             story_hashes = r.zrangebyscore(
                 "zF:%s" % feed.pk,
                 int(feed.unread_cutoff.strftime("%s")),
                 int(time.time() + 60 * 60 * 24),
             )
-            missing_story_hashes = set(story_hashes) - set([s["story_hash"] for s in stories])
-            if missing_story_hashes:
-                missing_stories = MStory.objects(
-                    story_feed_id=feed.pk, story_hash__in=missing_story_hashes
-                ).read_preference(pymongo.ReadPreference.PRIMARY)
-                missing_stories = Feed.format_stories(missing_stories, feed.pk)
-                stories = missing_stories + stories
-                logging.debug(
-                    "   ---> [%-30s] ~FYFound ~SB~FC%s(of %s)/%s~FY~SN un-secondaried stories while computing scores"
-                    % (
-                        feed.log_title[:30],
-                        len(missing_stories),
-                        len(missing_story_hashes),
-                        len(stories),
-                    )
-                )
-            cache.set("S:v3:%s" % feed.pk, stories, 60)
+            # Read uncached stories from the primary, as just saved stories may not
+            # have reached the secondaries yet. Subscribers' score recalculations
+            # then find them all in the formatted story cache.
+            stories = Feed.format_story_hashes(
+                story_hashes,
+                feed.pk,
+                order="newest",
+                read_preference=pymongo.ReadPreference.PRIMARY,
+                fields="metadata",
+            )
             logging.debug(
                 "   ---> [%-30s] ~FYComputing scores: ~SB%s stories~SN with ~SB%s subscribers ~SN(%s/%s/%s)"
                 % (
@@ -1254,9 +1491,112 @@ class FeedFetcherWorker:
 
     @timelimit(10)
     def calculate_feed_scores_with_stories(self, user_subs, stories):
+        user_subs = list(user_subs)
+        # Classifiers for every trained subscriber in one set of queries, and each
+        # story matched once for all of them.
+        trained_user_ids = [sub.user_id for sub in user_subs if sub.is_trained]
+        classifiers = None
+        if trained_user_ids:
+            classifiers = ClassifierMatcher.for_feed(user_subs[0].feed_id, trained_user_ids)
+
         for sub in user_subs:
+            check_deadline()
             silent = False if getattr(self.options, "verbose", 0) >= 2 else True
-            sub.calculate_feed_scores(silent=silent, stories=stories)
+            sub.calculate_feed_scores(silent=silent, stories=stories, classifiers=classifiers)
+
+
+class FeedPipeline:
+    """
+    Two-stage fetch. This process downloads feeds asynchronously and hands the raw
+    bodies through a bounded queue to a pool of processes that parse and store them
+    with ProcessFeed. A full queue stalls the downloads (backpressure), so the I/O
+    side (--concurrency) and the CPU side (--workerthreads) are sized independently.
+    """
+
+    def __init__(self, options, num_workers, queue_size=None):
+        self.options = options
+        self.num_workers = max(1, num_workers)
+        self.queue_size = queue_size or self.num_workers * 4
+
+    def run(self, feed_ids):
+        handoff_queue = multiprocessing.Queue(maxsize=self.queue_size)
+        stats_queue = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=dispatch_pipeline_worker, args=(handoff_queue, stats_queue, self.options))
+            for _ in range(self.num_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        fetch_options = dict(self.options, async_buffer=self.queue_size)
+        fetcher = FeedFetcherWorker(fetch_options)
+        start = time.time()
+        fetched = 0
+        fetched_bytes = 0
+        blocked = 0.0
+        for feed_id, prefetched in fetcher.fetch_feeds_async(feed_ids):
+            put_start = time.time()
+            if not self.handoff(handoff_queue, (feed_id, prefetched, time.time()), workers):
+                logging.debug(" ***> ~FRAll pipeline workers have died, dropping remaining feeds")
+                break
+            blocked += time.time() - put_start
+            fetched += 1
+            if prefetched and prefetched["content"]:
+                fetched_bytes += len(prefetched["content"])
+        fetch_duration = time.time() - start
+
+        for _ in workers:
+            self.handoff(handoff_queue, None, workers)
+        worker_stats = []
+        for _ in workers:
+            try:
+                worker_stats.append(stats_queue.get(timeout=60))
+            except queue.Empty:
+                break
+        for worker in workers:
+            worker.join()
+        total_duration = time.time() - start
+
+        stats = {
+            "fetched": fetched,
+            "fetched_bytes": fetched_bytes,
+            "fetch_duration": fetch_duration,
+            "fetch_blocked": blocked,
+            "processed": sum(s["processed"] for s in worker_stats),
+            "process_busy": sum(s["busy"] for s in worker_stats),
+            "process_idle": sum(s["idle"] for s in worker_stats),
+            "queue_latency": sum(s["queue_latency"] for s in worker_stats),
+            "total_duration": total_duration,
+        }
+        logging.debug(
+            " ---> ~FBPipeline fetch stage: ~SB%s~SN feeds (%.1f MB) in ~SB%.4ss~SN (%.1f/s), "
+            "~SB%.4ss~SN blocked on a full queue"
+            % (fetched, fetched_bytes / 1024.0 / 1024.0, fetch_duration, fetched / max(fetch_duration, 1), blocked)
+        )
+        logging.debug(
+            " ---> ~FBPipeline process stage: ~SB%s~SN feeds in ~SB%.4ss~SN (%.1f/s) across %s workers, "
+            "~SB%.4ss~SN busy / ~SB%.4ss~SN idle, ~SB%.4ss~SN average queue latency"
+            % (
+                stats["processed"],
+                total_duration,
+                stats["processed"] / max(total_duration, 1),
+                self.num_workers,
+                stats["process_busy"],
+                stats["process_idle"],
+                stats["queue_latency"] / max(stats["processed"], 1),
+            )
+        )
+
+        return stats
+
+    def handoff(self, handoff_queue, item, workers):
+        while True:
+            try:
+                handoff_queue.put(item, timeout=5)
+                return True
+            except queue.Full:
+                if not any(worker.is_alive() for worker in workers):
+                    return False
 
 
 class Dispatcher:
@@ -1271,7 +1611,11 @@ class Dispatcher:
         self.feeds_count = feeds_count
 
     def run_jobs(self):
-        if self.options["single_threaded"] or self.num_threads == 1:
+        if self.options.get("pipeline"):
+            feed_ids = [feed_id for feed_queue in self.feeds_queue for feed_id in feed_queue]
+            pipeline = FeedPipeline(self.options, self.num_threads, queue_size=self.options.get("queue_size"))
+            return pipeline.run(feed_ids)
+        elif self.options["single_threaded"] or self.num_threads == 1:
             return dispatch_workers(self.feeds_queue[0], self.options)
         else:
             for i in range(self.num_threads):
@@ -1286,3 +1630,8 @@ class Dispatcher:
 def dispatch_workers(feed_queue, options):
     worker = FeedFetcherWorker(options)
     return worker.process_feed_wrapper(feed_queue)
+
+
+def dispatch_pipeline_worker(handoff_queue, stats_queue, options):
+    worker = FeedFetcherWorker(options)
+    return worker.process_handoff_queue(handoff_queue, stats_queue)
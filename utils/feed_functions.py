@@ -1,9 +1,10 @@
 import datetime
+import functools
 import pprint
 import random
-import sys
+import signal
 import threading
-import traceback
+import time
 import urllib.error
 import urllib.parse
 import urllib.request
@@ -20,39 +21,110 @@ class TimeoutError(Exception):
     pass
 
 
+class DeadlineExceeded(BaseException):
+    """Raised by the interval timer. Not an Exception, so the timed work's own
+    `except Exception:` handlers can't swallow it; timelimit turns it into TimeoutError."""
+
+
+# How often the interval timer fires again while the work overstays its deadline
+DEADLINE_REFIRE_SECONDS = 0.1
+
+
+def _raise_timeout(signum, frame):
+    deadline = Deadline.current()
+    if not deadline:
+        return
+    if not deadline.expired:
+        signal.setitimer(signal.ITIMER_REAL, max(deadline.remaining(), 0.001))
+        return
+    signal.setitimer(signal.ITIMER_REAL, DEADLINE_REFIRE_SECONDS)
+    raise DeadlineExceeded("took too long")
+
+
+class Deadline:
+    """
+    A point in time by which the work inside `with Deadline(seconds):` must finish.
+    Deadlines nest per thread, and an inner one never outlives its outer one.
+
+    In a process's main thread an interval timer raises DeadlineExceeded wherever the
+    work is when the deadline passes, and keeps firing until the work leaves the
+    deadline, so a bare `except:` can't outlast it. The timer is cancelled on exit, and
+    the outermost deadline puts back whatever SIGALRM handler it found. Signals can't be
+    used off the main thread, so there the deadline is cooperative: long loops call
+    check_deadline().
+    """
+
+    _local = threading.local()
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.expires_at = None
+        self.outer = None
+        self.alarm = False
+        self.previous_handler = None
+
+    @classmethod
+    def current(cls):
+        return getattr(cls._local, "deadline", None)
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def __enter__(self):
+        self.outer = Deadline.current()
+        self.expires_at = time.monotonic() + self.timeout
+        if self.outer:
+            self.expires_at = min(self.expires_at, self.outer.expires_at)
+        Deadline._local.deadline = self
+
+        self.alarm = threading.current_thread() is threading.main_thread() and hasattr(signal, "setitimer")
+        if self.alarm:
+            if not self.outer:
+                self.previous_handler = signal.getsignal(signal.SIGALRM)
+                signal.signal(signal.SIGALRM, _raise_timeout)
+            signal.setitimer(signal.ITIMER_REAL, max(self.remaining(), 0.001))
+        return self
+
+    def __exit__(self, *args):
+        if self.alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        Deadline._local.deadline = self.outer
+        if self.alarm and self.outer:
+            signal.setitimer(signal.ITIMER_REAL, max(self.outer.remaining(), 0.001))
+        elif self.alarm:
+            signal.signal(signal.SIGALRM, self.previous_handler or signal.SIG_DFL)
+        return False
+
+
+def check_deadline():
+    """Raises TimeoutError if the current thread's deadline has passed."""
+    deadline = Deadline.current()
+    if deadline and deadline.expired:
+        raise TimeoutError("took too long")
+
+
 def timelimit(timeout):
-    """borrowed from web.py"""
+    """
+    Raises TimeoutError if the decorated call takes longer than timeout seconds, even
+    when the call caught the timeout itself and returned. See Deadline.
+    """
 
     def _1(function):
+        @functools.wraps(function)
         def _2(*args, **kw):
-            class Dispatch(threading.Thread):
-                def __init__(self):
-                    threading.Thread.__init__(self)
-                    self.result = None
-                    self.error = None
-                    self.exc_info = None
-
-                    self.setDaemon(True)
-                    self.start()
-
-                def run(self):
-                    try:
-                        self.result = function(*args, **kw)
-                    except BaseException as e:
-                        self.error = e
-                        self.exc_info = sys.exc_info()
-
-            c = Dispatch()
-            dispatch = c
-            c.join(timeout)
-            if c.is_alive():
+            deadline = Deadline(timeout)
+            try:
+                with deadline:
+                    result = function(*args, **kw)
+            except DeadlineExceeded:
+                raise TimeoutError("took too long")
+            if deadline.expired:
                 raise TimeoutError("took too long")
-            if c.error:
-                tb = "".join(traceback.format_exception(c.exc_info[0], c.exc_info[1], c.exc_info[2]))
-                logging.debug(f" ***> Traceback timeout error: {tb}")
-                # mail_admins('Error in timeout: %s' % c.exc_info[0], tb)
-                raise c.error
-            return c.result
+            return result
 
         return _2
 
@@ -0,0 +1,97 @@
+import http.cookiejar
+import os
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Hosts a process keeps keep-alive connections open to, and connections per host.
+HOST_POOLS = 500
+HOST_POOL_SIZE = 4
+# Requests a process sends to a single host at once, and the minimum seconds
+# between the start of two requests to the same host.
+HOST_CONCURRENCY = 4
+HOST_MIN_INTERVAL = 0.2
+
+
+class HostSessions:
+    """
+    Shared HTTP layer for feed, page, and icon fetches. Every request in a process
+    goes through one requests session, whose adapter keeps a pool of keep-alive
+    connections per host, so the hundreds of feeds on feedburner, medium, substack,
+    or youtube fetched by a worker reuse connections instead of a new TLS handshake
+    each.
+
+    Each host also gets a politeness limit: at most HOST_CONCURRENCY requests in
+    flight and HOST_MIN_INTERVAL seconds between requests from this process.
+
+        response = HostSessions.get(url, headers=headers, timeout=10)
+    """
+
+    lock = threading.Lock()
+    pid = None
+    shared_session = None
+    host_semaphores = {}
+    host_next_request = {}
+
+    @classmethod
+    def session(cls):
+        # Sessions (and their open sockets) are never shared with a forked worker
+        if cls.shared_session is None or cls.pid != os.getpid():
+            with cls.lock:
+                if cls.shared_session is None or cls.pid != os.getpid():
+                    session = requests.Session()
+                    # Each fetch stands alone, so no response's cookies are kept or sent on
+                    session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+                    adapter = HTTPAdapter(pool_connections=HOST_POOLS, pool_maxsize=HOST_POOL_SIZE)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    cls.shared_session = session
+                    cls.pid = os.getpid()
+                    cls.host_semaphores = {}
+                    cls.host_next_request = {}
+
+        return cls.shared_session
+
+    @classmethod
+    def host(cls, url):
+        return urllib.parse.urlparse(url).netloc.lower()
+
+    @classmethod
+    def host_semaphore(cls, host):
+        with cls.lock:
+            semaphore = cls.host_semaphores.get(host)
+            if not semaphore:
+                if len(cls.host_semaphores) > 10000:
+                    cls.host_semaphores.clear()
+                semaphore = threading.BoundedSemaphore(HOST_CONCURRENCY)
+                cls.host_semaphores[host] = semaphore
+
+        return semaphore
+
+    @classmethod
+    def wait_for_host(cls, host):
+        with cls.lock:
+            now = time.time()
+            next_request = max(now, cls.host_next_request.get(host, 0))
+            if len(cls.host_next_request) > 10000:
+                cls.host_next_request.clear()
+            cls.host_next_request[host] = next_request + HOST_MIN_INTERVAL
+
+        if next_request > now:
+            time.sleep(next_request - now)
+
+    @classmethod
+    def request(cls, method, url, **kwargs):
+        session = cls.session()
+        host = cls.host(url)
+        with cls.host_semaphore(host):
+            cls.wait_for_host(host)
+            return session.request(method, url, **kwargs)
+
+    @classmethod
+    def get(cls, url, **kwargs):
+        kwargs.setdefault("allow_redirects", True)
+        return cls.request("GET", url, **kwargs)
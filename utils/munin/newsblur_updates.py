@@ -23,6 +23,7 @@ class NBMuninGraph(MuninGraph):
             "feeds_fetched.label": "Fetched feeds last hour",
             "tasked_feeds.label": "Tasked Feeds",
             "error_feeds.label": "Error Feeds",
+            "update_lag_seconds.label": "Seconds behind schedule",
             "celery_update_feeds.label": "Celery - Update Feeds",
             "celery_new_feeds.label": "Celery - New Feeds",
             "celery_push_feeds.label": "Celery - Push Feeds",
@@ -33,13 +34,17 @@ class NBMuninGraph(MuninGraph):
     def calculate_metrics(self):
         from django.conf import settings
 
+        from apps.rss_feeds.scheduler import FeedScheduler
+
         r = redis.Redis(connection_pool=settings.REDIS_FEED_UPDATE_POOL)
+        metrics = FeedScheduler(r).metrics()
 
         return {
-            "update_queue": r.scard("queued_feeds"),
-            "feeds_fetched": r.zcard("fetched_feeds_last_hour"),
-            "tasked_feeds": r.zcard("tasked_feeds"),
-            "error_feeds": r.zcard("error_feeds"),
+            "update_queue": metrics["ready"],
+            "feeds_fetched": metrics["fetched_last_hour"],
+            "tasked_feeds": metrics["tasked"],
+            "error_feeds": metrics["errors"],
+            "update_lag_seconds": metrics["lag_seconds"],
             "celery_update_feeds": r.llen("update_feeds"),
             "celery_new_feeds": r.llen("new_feeds"),
             "celery_push_feeds": r.llen("push_feeds"),
@@ -0,0 +1,223 @@
+import base64
+
+# K-way merge of per-feed sorted sets, run inside Redis so a river page never
+# needs the whole union of a user's feeds stored under a temporary key.
+#
+# KEYS come in pairs per source: the sorted set of story hashes scored by story
+# date, and the user's read stories set for that feed.
+#
+# ARGV: order, limit, offset, cursor score, cursor hash, read filter, batch size,
+# then four values per source: min score, max score, unread since, manual.
+# Manual sources (a user's manually marked unread stories) skip the read check.
+#
+# Returns three parallel lists: story hashes, their scores, and 1/0 unread flags.
+RIVER_MERGE_LUA = """
+local newest = ARGV[1] ~= "oldest"
+local limit = tonumber(ARGV[2])
+local offset = tonumber(ARGV[3])
+local cursor_score = tonumber(ARGV[4])
+local cursor_hash = ARGV[5]
+local unread_only = ARGV[6] == "unread"
+local batch = tonumber(ARGV[7])
+local wanted = offset + limit
+
+local function before(a_score, a_hash, b_score, b_hash)
+    if a_score ~= b_score then
+        if newest then return a_score > b_score end
+        return a_score < b_score
+    end
+    if newest then return a_hash > b_hash end
+    return a_hash < b_hash
+end
+
+local sources = {}
+for i = 1, #KEYS / 2 do
+    local a = 8 + (i - 1) * 4
+    local source = {
+        key = KEYS[i * 2 - 1],
+        read_key = KEYS[i * 2],
+        min = tonumber(ARGV[a]),
+        max = tonumber(ARGV[a + 1]),
+        unread_since = tonumber(ARGV[a + 2]),
+        manual = ARGV[a + 3] == "1",
+        fetched = 0,
+        done = false,
+        buffer = {},
+        pos = 1,
+    }
+    if cursor_score then
+        if newest then
+            source.max = math.min(source.max, cursor_score)
+        else
+            source.min = math.max(source.min, cursor_score)
+        end
+    end
+    sources[i] = source
+end
+
+local function refill(source)
+    source.buffer = {}
+    source.pos = 1
+    while not source.done and #source.buffer == 0 do
+        local items
+        if newest then
+            items = redis.call("ZREVRANGEBYSCORE", source.key, source.max, source.min,
+                               "WITHSCORES", "LIMIT", source.fetched, batch)
+        else
+            items = redis.call("ZRANGEBYSCORE", source.key, source.min, source.max,
+                               "WITHSCORES", "LIMIT", source.fetched, batch)
+        end
+        local count = #items / 2
+        source.fetched = source.fetched + count
+        if count < batch then source.done = true end
+        for j = 1, #items, 2 do
+            local hash, score = items[j], tonumber(items[j + 1])
+            local keep = not cursor_score or before(cursor_score, cursor_hash, score, hash)
+            local unread = 1
+            if keep and not source.manual then
+                if score < source.unread_since or redis.call("SISMEMBER", source.read_key, hash) == 1 then
+                    unread = 0
+                end
+                if unread_only and unread == 0 then keep = false end
+            end
+            if keep then
+                table.insert(source.buffer, {score, hash, items[j + 1], unread})
+            end
+        end
+    end
+    return #source.buffer > 0
+end
+
+local heap = {}
+local function less(i, j)
+    local a = sources[heap[i]].buffer[sources[heap[i]].pos]
+    local b = sources[heap[j]].buffer[sources[heap[j]].pos]
+    return before(a[1], a[2], b[1], b[2])
+end
+
+local function heap_push(i)
+    table.insert(heap, i)
+    local c = #heap
+    while c > 1 do
+        local p = math.floor(c / 2)
+        if not less(c, p) then break end
+        heap[c], heap[p] = heap[p], heap[c]
+        c = p
+    end
+end
+
+local function heap_pop()
+    local top = heap[1]
+    local last = table.remove(heap)
+    if #heap > 0 then
+        heap[1] = last
+        local p = 1
+        while true do
+            local l, r, s = p * 2, p * 2 + 1, p
+            if l <= #heap and less(l, s) then s = l end
+            if r <= #heap and less(r, s) then s = r end
+            if s == p then break end
+            heap[p], heap[s] = heap[s], heap[p]
+            p = s
+        end
+    end
+    return top
+end
+
+for i, source in ipairs(sources) do
+    if source.min <= source.max and refill(source) then heap_push(i) end
+end
+
+local hashes, scores, unreads = {}, {}, {}
+local emitted = 0
+local last_hash = nil
+while #heap > 0 and emitted < wanted do
+    local i = heap_pop()
+    local source = sources[i]
+    local item = source.buffer[source.pos]
+    if item[2] == last_hash then
+        -- Same story from a feed and its manual unreads, which sort next to each other
+        if emitted > offset and item[4] == 1 then unreads[#unreads] = 1 end
+    else
+        emitted = emitted + 1
+        last_hash = item[2]
+        if emitted > offset then
+            table.insert(hashes, item[2])
+            table.insert(scores, item[3])
+            table.insert(unreads, item[4])
+        end
+    end
+    source.pos = source.pos + 1
+    if source.pos <= #source.buffer or refill(source) then heap_push(i) end
+end
+
+return {hashes, scores, unreads}
+"""
+
+
+class RiverSource:
+    def __init__(self, key, read_key, min_score, max_score, unread_since=0, manual=False):
+        self.key = key
+        self.read_key = read_key
+        self.min_score = min_score
+        self.max_score = max_score
+        self.unread_since = unread_since
+        self.manual = manual
+
+
+class RiverMerge:
+    """
+    Pages through a river of stories across many feeds without materializing
+    their union. Pages are continued by an opaque cursor (the last story's score
+    and hash) rather than by offset, so later pages cost the same as the first.
+    """
+
+    def __init__(self, r):
+        self.r = r
+        self.script = r.register_script(RIVER_MERGE_LUA)
+
+    def page(self, sources, limit=6, order="newest", read_filter="all", cursor=None, offset=0):
+        if not sources:
+            return [], [], None
+
+        cursor_score, cursor_hash = self.decode_cursor(cursor)
+        if cursor_score is not None:
+            offset = 0
+        keys = []
+        args = [
+            order,
+            limit,
+            offset,
+            "" if cursor_score is None else cursor_score,
+            cursor_hash or "",
+            read_filter,
+            max(limit, 10),
+        ]
+        for source in sources:
+            keys.extend([source.key, source.read_key])
+            args.extend([source.min_score, source.max_score, source.unread_since, 1 if source.manual else 0])
+
+        story_hashes, scores, unreads = self.script(keys=keys, args=args, client=self.r)
+        unread_story_hashes = [
+            story_hash for story_hash, unread in zip(story_hashes, unreads) if int(unread)
+        ]
+        next_cursor = None
+        if len(story_hashes) >= limit:
+            next_cursor = self.encode_cursor(scores[-1], story_hashes[-1])
+
+        return story_hashes, unread_story_hashes, next_cursor
+
+    @staticmethod
+    def encode_cursor(score, story_hash):
+        cursor = "%s:%s" % (score, story_hash)
+        return base64.urlsafe_b64encode(cursor.encode("utf-8")).decode("utf-8")
+
+    @staticmethod
+    def decode_cursor(cursor):
+        if not cursor:
+            return None, None
+        try:
+            score, story_hash = base64.urlsafe_b64decode(cursor.encode("utf-8")).decode("utf-8").split(":", 1)
+            return float(score), story_hash
+        except (ValueError, UnicodeError):
+            return None, None